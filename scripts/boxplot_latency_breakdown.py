@@ -5,6 +5,9 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
+from src.utils.catalog import load_catalog
+from src.utils.run_store import read_csv
+
 ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -102,29 +105,30 @@ def output_boxplot(
 
 
 def prepare_data_for_lines():
+    catalog = load_catalog()
     df_5g_static_lines = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='5g', condition='static', mode='line'):
         df_5g_static_lines.append(
-            pd.read_csv(get_output_path('5g-static-line', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     # only 4 runs for 5G blocked
     df_5g_block_static_lines = []
-    for num in range(1, 5):
+    for record in catalog.query(tech='5g', condition='static', mode='point', run_numbers=range(1, 5)):
         df_5g_block_static_lines.append(
-            pd.read_csv(get_output_path('5g-static-point', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     df_wifi_static_lines = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='wifi', condition='static', mode='line'):
         df_wifi_static_lines.append(
-            pd.read_csv(get_output_path('wifi-static-line', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     df_lte_static_lines = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='lte', condition='static', mode='line'):
         df_lte_static_lines.append(
-            pd.read_csv(get_output_path('lte-static-line', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     return (
@@ -136,28 +140,29 @@ def prepare_data_for_lines():
 
 
 def prepare_data_for_points():
+    catalog = load_catalog()
     df_5g_static_points = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='5g', condition='static', mode='point'):
         df_5g_static_points.append(
-            pd.read_csv(get_output_path('5g-static-point', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     df_5g_block_static_points = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='5g', condition='static', mode='point'):
         df_5g_block_static_points.append(
-            pd.read_csv(get_output_path('5g-static-point', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     df_wifi_static_points = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='wifi', condition='static', mode='point'):
         df_wifi_static_points.append(
-            pd.read_csv(get_output_path('wifi-static-point', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     df_lte_static_points = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='lte', condition='static', mode='point'):
         df_lte_static_points.append(
-            pd.read_csv(get_output_path('lte-static-point', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     return (
@@ -7,9 +7,11 @@ import os
 import bisect
 
 import numpy as np
-import pandas as pd
 import glob
 
+from src.utils.catalog import load_catalog
+from src.utils.run_store import read_csv
+
 ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -50,65 +52,71 @@ def output_cdf(e2e_delays: List, title: str, type: str):
 
 
 def prepare_e2e_delays_for_lines():
+    catalog = load_catalog()
     df_5g_static_lines = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='5g', condition='static', mode='line'):
         df_5g_static_lines.append(
-            pd.read_csv(get_output_path('5g-static-line', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     # only 4 runs for 5G blocked
     df_5g_block_static_lines = []
-    for num in range(1, 5):
+    for record in catalog.query(tech='5g', condition='static', mode='line', run_numbers=range(1, 5)):
         df_5g_block_static_lines.append(
-            pd.read_csv(get_output_path('5g-static-line', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     df_wifi_static_lines = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='wifi', condition='static', mode='line'):
         df_wifi_static_lines.append(
-            pd.read_csv(get_output_path('wifi-static-line', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     df_lte_static_lines = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='lte', condition='static', mode='line'):
         df_lte_static_lines.append(
-            pd.read_csv(get_output_path('lte-static-line', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
     df_list = df_5g_static_lines + df_5g_block_static_lines + df_wifi_static_lines + df_lte_static_lines
     return df_list
 
 
 def prepare_e2e_delays_for_points():
+    catalog = load_catalog()
     df_5g_static_points = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='5g', condition='static', mode='point'):
         df_5g_static_points.append(
-            pd.read_csv(get_output_path('5g-static-point', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     df_5g_block_static_points = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='5g', condition='static', mode='point'):
         df_5g_block_static_points.append(
-            pd.read_csv(get_output_path('5g-static-point', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     df_wifi_static_points = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='wifi', condition='static', mode='point'):
         df_wifi_static_points.append(
-            pd.read_csv(get_output_path('wifi-static-point', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     df_lte_static_points = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='lte', condition='static', mode='point'):
         df_lte_static_points.append(
-            pd.read_csv(get_output_path('lte-static-point', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     return df_5g_static_points + df_5g_block_static_points + df_wifi_static_points + df_lte_static_points
 
 
-if __name__ == '__main__':
+def main():
     df_lines = prepare_e2e_delays_for_lines()
     output_cdf(generate_data(df_lines), title='E2E Delays for Lines', type='lines')
 
     df_points = prepare_e2e_delays_for_points()
     output_cdf(generate_data(df_points), title='E2E Delays for Points', type='points')
+
+
+if __name__ == '__main__':
+    main()
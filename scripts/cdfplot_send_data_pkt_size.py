@@ -7,9 +7,11 @@ import os
 import bisect
 
 import numpy as np
-import pandas as pd
 import glob
 
+from src.utils.catalog import load_catalog
+from src.utils.run_store import read_csv
+
 ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -49,65 +51,71 @@ def output_cdf(data_list: List, title: str, type: str):
 
 
 def prepare_data_for_lines():
+    catalog = load_catalog()
     df_5g_static_lines = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='5g', condition='static', mode='line'):
         df_5g_static_lines.append(
-            pd.read_csv(get_output_path('5g-static-line', num, 'send_pkt_sequences.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'send_pkt_sequences.csv'))
         )
 
     # only 4 runs for 5G blocked
     df_5g_block_static_lines = []
-    for num in range(1, 5):
+    for record in catalog.query(tech='5g', condition='static', mode='line', run_numbers=range(1, 5)):
         df_5g_block_static_lines.append(
-            pd.read_csv(get_output_path('5g-static-line', num, 'send_pkt_sequences.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'send_pkt_sequences.csv'))
         )
 
     df_wifi_static_lines = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='wifi', condition='static', mode='line'):
         df_wifi_static_lines.append(
-            pd.read_csv(get_output_path('wifi-static-line', num, 'send_pkt_sequences.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'send_pkt_sequences.csv'))
         )
 
     df_lte_static_lines = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='lte', condition='static', mode='line'):
         df_lte_static_lines.append(
-            pd.read_csv(get_output_path('lte-static-line', num, 'send_pkt_sequences.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'send_pkt_sequences.csv'))
         )
     df_list = df_5g_static_lines + df_5g_block_static_lines + df_wifi_static_lines + df_lte_static_lines
     return df_list
 
 
 def prepare_data_for_points():
+    catalog = load_catalog()
     df_5g_static_points = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='5g', condition='static', mode='point'):
         df_5g_static_points.append(
-            pd.read_csv(get_output_path('5g-static-point', num, 'send_pkt_sequences.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'send_pkt_sequences.csv'))
         )
 
     df_5g_block_static_points = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='5g', condition='static', mode='point'):
         df_5g_block_static_points.append(
-            pd.read_csv(get_output_path('5g-static-point', num, 'send_pkt_sequences.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'send_pkt_sequences.csv'))
         )
 
     df_wifi_static_points = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='wifi', condition='static', mode='point'):
         df_wifi_static_points.append(
-            pd.read_csv(get_output_path('wifi-static-point', num, 'send_pkt_sequences.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'send_pkt_sequences.csv'))
         )
 
     df_lte_static_points = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='lte', condition='static', mode='point'):
         df_lte_static_points.append(
-            pd.read_csv(get_output_path('lte-static-point', num, 'send_pkt_sequences.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'send_pkt_sequences.csv'))
         )
 
     return df_5g_static_points + df_5g_block_static_points + df_wifi_static_points + df_lte_static_points
 
 
-if __name__ == '__main__':
+def main():
     df_list = prepare_data_for_lines()
     output_cdf(generate_data(df_list), title='Size of each data pkt sent from host to cloud', type='lines')
 
     df_list = prepare_data_for_points()
     output_cdf(generate_data(df_list), title='Size of each data pkt sent from host to cloud', type='points')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# Regenerate the figures of every script below in a single process, so that each run is parsed
+# and each output csv is read once (see src/utils/run_store.py) instead of once per script.
+
+import argparse
+import importlib
+import os
+import sys
+import time
+import traceback
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+
+ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path[:0] = [os.path.join(ROOT_PATH, '..'), os.path.join(ROOT_PATH, '..', 'src')]
+
+from src.utils.run_store import RUN_STORE
+
+# Scripts with a main() that builds their figures
+FIGURE_SCRIPTS = [
+    'boxplot_latency_breakdown',
+    'cdfplot_e2e_delays',
+    'cdfplot_send_data_pkt_size',
+    'paper_boxplot_e2e_async_vs_sync',
+    'paper_jal_latency_breakdown',
+    'paper_period_and_e2e_correlation',
+    'paper_CDF_JAL_CA_sync',
+    'paper_CDF_period_duration',
+    'paper_CDF_total_pkt_size_sync',
+    'paper_agg_slam_size',
+    'paper_cdf_slam_period',
+    'paper_coordinate_pkt_CDF',
+    'paper_dynamic_long_e2e_slam_timeline_aggregate',
+    'paper_dynamic_short_e2e_slam_timeline_aggregate',
+    'paper_static_short_e2e_slam_timeline_aggregate',
+    'paper_plot_long_sync_pkt_size',
+    'paper_plot_short_sync_pkt_size',
+    'paper_three_way_comparison',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Regenerate the paper figures in one process.')
+    parser.add_argument('scripts', nargs='*', default=FIGURE_SCRIPTS,
+                        help='scripts to run, without .py (default: all of them)')
+    args = parser.parse_args()
+
+    # The scripts read and write paths relative to the scripts directory
+    os.chdir(ROOT_PATH)
+    os.makedirs(os.path.join(ROOT_PATH, '..', 'Figures'), exist_ok=True)
+    failed = []
+    start = time.perf_counter()
+    for name in args.scripts:
+        script_start = time.perf_counter()
+        try:
+            importlib.import_module(name).main()
+            print('{name} done in {duration:.1f}s'.format(name=name, duration=time.perf_counter() - script_start))
+        except Exception:
+            traceback.print_exc()
+            print('{name} failed'.format(name=name))
+            failed.append(name)
+        finally:
+            plt.close('all')
+
+    print('{ok}/{total} scripts succeeded in {duration:.1f}s, {runs} runs and {frames} csv files loaded'.format(
+        ok=len(args.scripts) - len(failed),
+        total=len(args.scripts),
+        duration=time.perf_counter() - start,
+        runs=len(RUN_STORE.info_maps),
+        frames=len(RUN_STORE.frames),
+    ))
+    if failed:
+        print('failed scripts: {}'.format(', '.join(failed)))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,8 @@ import os
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 
-from src.timeline.moment import parse_log_and_pcap
+from src.utils.catalog import load_catalog
+from src.utils.run_store import parse_log_and_pcap
 
 ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
 OUTPUT_DIR = 'output'
@@ -24,43 +25,7 @@ def main():
     #jal_sync_elapsed_time_list = []
     # If the data become stale
     if len(jal_sync_elapsed_time_list) == 0:
-        host_dirs = [
-            # 5g-static-line
-            input_path('../datasets/5g-static-line/host/run1'),
-            input_path('../datasets/5g-static-line/host/run2'),
-            input_path('../datasets/5g-static-line/host/run3'),
-            input_path('../datasets/5g-static-line/host/run4'),
-            input_path('../datasets/5g-static-line/host/run5'),
-            # 5g-host_move-line
-            input_path('../datasets/5g-host_move-line/host/run1'),
-            input_path('../datasets/5g-host_move-line/host/run2'),
-            input_path('../datasets/5g-host_move-line/host/run3'),
-            input_path('../datasets/5g-host_move-line/host/run4'),
-            input_path('../datasets/5g-host_move-line/host/run5'),
-            # 5g-resolver_move-line
-            input_path('../datasets/5g-resolver_move-line/host/run1'),
-            input_path('../datasets/5g-resolver_move-line/host/run2'),
-            input_path('../datasets/5g-resolver_move-line/host/run3'),
-            input_path('../datasets/5g-resolver_move-line/host/run4'),
-            input_path('../datasets/5g-resolver_move-line/host/run5'),
-            # 5g-static-point
-            input_path('../datasets/5g-static-point/host/run1'),
-            input_path('../datasets/5g-static-point/host/run2'),
-            input_path('../datasets/5g-static-point/host/run3'),
-            input_path('../datasets/5g-static-point/host/run4'),
-            input_path('../datasets/5g-static-point/host/run5'),
-            # 5g-block line
-            input_path('../datasets/5g-block-line/host/run1'),
-            input_path('../datasets/5g-block-line/host/run2'),
-            input_path('../datasets/5g-block-line/host/run3'),
-            input_path('../datasets/5g-block-line/host/run4'),
-            input_path('../datasets/5g-block-line/host/run5'),
-            # 5g-blocked point
-            input_path('../datasets/5g-block-point/host/run1'),
-            input_path('../datasets/5g-block-point/host/run2'),
-            input_path('../datasets/5g-block-point/host/run3'),
-            input_path('../datasets/5g-block-point/host/run4'),
-        ]
+        host_dirs = [record.host_path for record in load_catalog().query(tech='5g')]
         for index, host_path in enumerate(host_dirs):
             resolver_path = host_path.replace('/host/', '/resolver/')
             exp_name = host_path.split('/')[-3]
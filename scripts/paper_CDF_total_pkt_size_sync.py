@@ -2,12 +2,11 @@
 
 import numpy as np
 import os
-import pyshark
-from src.constants import DATETIME_FORMAT
 import matplotlib.pyplot as plt
 
-from src.timeline.moment import parse_log_and_pcap
-from src.utils.pcap import get_ip, get_timestamp, is_ack_pkt
+from src.utils.run_store import parse_log_and_pcap
+from src.utils.catalog import load_catalog
+from src.utils.packet_table import load_packet_table
 from matplotlib.ticker import MaxNLocator
 
 ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
@@ -28,35 +27,17 @@ def calculate_sync_data(runtime_info, pcap_path):
     sync_start_moment = log_sync_moments[0]
     sync_success_moment = log_sync_moments[-1]
     phone_ip = runtime_info.phone_ip
-    # Construct the filter
-    sync_start_filter = 'frame.time >= "{st}"'.format(st=sync_start_moment.time.strftime(DATETIME_FORMAT))
-    sync_end_filter = 'frame.time <= "{et}"'.format(et=sync_success_moment.time.strftime(DATETIME_FORMAT))
-    ip_ver_filter = "ipv6" if runtime_info.ip_ver_is_six else "ip"
-    #tls_filter = "!tls.handshake"
-    #display_filter = " && ".join([sync_start_filter, sync_end_filter, ip_ver_filter, tls_filter, "tcp"])
-    display_filter = " && ".join([sync_start_filter, sync_end_filter, ip_ver_filter, "tcp"])
-    # Get capture
-    caps = pyshark.FileCapture(pcap_path, display_filter=display_filter)
-
-    x_uplink_time = []
-    y_uplink_size = []
-    x_downlink_time = []
-    y_downlink_size = []
-
-    for pkt in caps:
-        if is_ack_pkt(pkt):
-            continue
-
-        src_ip = get_ip(pkt, type='src')
-        dst_ip = get_ip(pkt, type='dst')
-
-        if (src_ip == phone_ip) and (dst_ip in runtime_info.arcore_ip_set):
-            x_uplink_time.append(get_timestamp(pkt))
-            y_uplink_size.append(int(pkt.length))
-
-        if (dst_ip == phone_ip) and (src_ip in runtime_info.arcore_ip_set):
-            x_downlink_time.append(get_timestamp(pkt))
-            y_downlink_size.append(int(pkt.length))
+
+    table = load_packet_table(pcap_path)
+    mask = (table.get_window_mask(sync_start_moment.time, sync_success_moment.time)
+            & table.get_ip_version_mask(runtime_info.ip_ver_is_six) & ~table.get_ack_mask())
+    uplink_mask = mask & table.get_ip_mask('src', phone_ip) & table.get_ip_mask('dst', runtime_info.arcore_ip_set)
+    downlink_mask = mask & table.get_ip_mask('dst', phone_ip) & table.get_ip_mask('src', runtime_info.arcore_ip_set)
+
+    x_uplink_time = table.get_times(uplink_mask)
+    y_uplink_size = table.packets['length'][uplink_mask].tolist()
+    x_downlink_time = table.get_times(downlink_mask)
+    y_downlink_size = table.packets['length'][downlink_mask].tolist()
 
     return {
         'x_uplink_time': x_uplink_time,
@@ -100,29 +81,14 @@ def plot_figures(*lists_to_plot_with_labels, xmax = int, output_name: str, xlabe
 
 
 def main():
-    host_dirs = [
-        input_path('../datasets/5g-static-line/host/run1'),
-        input_path('../datasets/5g-static-line/host/run2'),
-        input_path('../datasets/5g-static-line/host/run3'),
-        input_path('../datasets/5g-static-line/host/run4'),
-        input_path('../datasets/5g-static-line/host/run5'),
-        input_path('../datasets/5g-host_move-line/host/run1'),
-        input_path('../datasets/5g-host_move-line/host/run2'),
-        input_path('../datasets/5g-host_move-line/host/run3'),
-        input_path('../datasets/5g-host_move-line/host/run4'),
-        input_path('../datasets/5g-host_move-line/host/run5'),
-        input_path('../datasets/5g-resolver_move-line/host/run1'),
-        input_path('../datasets/5g-resolver_move-line/host/run2'),
-        input_path('../datasets/5g-resolver_move-line/host/run3'),
-        input_path('../datasets/5g-resolver_move-line/host/run4'),
-        input_path('../datasets/5g-resolver_move-line/host/run5'),
-    ]
     total_sync_host_downlink_size_all_run_list = [20558, 20114, 15792, 54415, 13516, 13400, 13425, 13400, 13786, 15811, 15830, 16299, 13914, 15877, 15946]
     total_sync_host_uplink_size_all_run_list = [724220, 7530646, 477983, 6336592, 236291, 1198946, 487555, 341669, 946209, 800004, 1290352, 4598916, 672377, 1449190, 1485339]
     total_sync_resolver_downlink_size_all_run_list = [8073, 146142, 8755, 65158, 11935, 6637, 14193, 8755, 6477, 6478, 60155, 56047, 6638, 55606, 57485]
     total_sync_resolver_uplink_size_all_run_list = [217929, 12188482, 273416, 5838543, 549966, 69302, 909143, 293234, 67920, 67923, 5505531, 6161010, 64772, 4967581, 5256261]
 
     if len(total_sync_host_downlink_size_all_run_list) == 0:
+        host_dirs = [record.host_path for record in load_catalog().query(
+            tech='5g', condition=('static', 'host_move', 'resolver_move'), mode='line')]
         for index, host_path in enumerate(host_dirs):
             resolver_path = host_path.replace('/host/', '/resolver/')
             exp_name = host_path.split('/')[-3]
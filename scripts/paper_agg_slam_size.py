@@ -13,9 +13,10 @@ import numpy as np
 import matplotlib.dates as mdates
 import pandas as pd
 
-from main import prepare_other_ip_summary_and_moments
+from src.utils.run_store import prepare_other_ip_summary_and_moments
 from src.phase.phase import prepare_phases
-from src.timeline.moment import parse_log_and_pcap
+from src.utils.catalog import load_catalog
+from src.utils.run_store import parse_log_and_pcap
 from src.timeline.timeline import get_timeline
 from src.utils.time import diff_sec
 from matplotlib.ticker import MaxNLocator
@@ -179,23 +180,8 @@ def main():
     periods_downlink_pkt_size_aggregated_all_run_list = []
     periods_uplink_pkt_size_aggregated_all_run_list = []
 
-    host_dirs = [
-        input_path('../datasets/5g-static-line/host/run1'),
-        input_path('../datasets/5g-static-line/host/run2'),
-        input_path('../datasets/5g-static-line/host/run3'),
-        input_path('../datasets/5g-static-line/host/run4'),
-        input_path('../datasets/5g-static-line/host/run5'),
-        input_path('../datasets/5g-host_move-line/host/run1'),
-        input_path('../datasets/5g-host_move-line/host/run2'),
-        input_path('../datasets/5g-host_move-line/host/run3'),
-        input_path('../datasets/5g-host_move-line/host/run4'),
-        input_path('../datasets/5g-host_move-line/host/run5'),
-        input_path('../datasets/5g-resolver_move-line/host/run1'),
-        input_path('../datasets/5g-resolver_move-line/host/run2'),
-        input_path('../datasets/5g-resolver_move-line/host/run3'),
-        input_path('../datasets/5g-resolver_move-line/host/run4'),
-        input_path('../datasets/5g-resolver_move-line/host/run5'),
-    ]
+    host_dirs = [record.host_path for record in load_catalog().query(
+        tech='5g', condition=('static', 'host_move', 'resolver_move'), mode='line')]
     for index, host_path in enumerate(host_dirs):
         resolver_path = host_path.replace('/host/', '/resolver/')
         exp_name = host_path.split('/')[-3]
@@ -6,9 +6,10 @@ import numpy as np
 import matplotlib.dates as mdates
 import pandas as pd
 
-from main import prepare_other_ip_summary_and_moments
+from src.utils.run_store import prepare_other_ip_summary_and_moments
 from src.phase.phase import prepare_phases
-from src.timeline.moment import parse_log_and_pcap
+from src.utils.catalog import load_catalog
+from src.utils.run_store import parse_log_and_pcap
 from src.timeline.timeline import get_timeline
 from matplotlib.ticker import MaxNLocator
 from src.utils.time import diff_sec
@@ -23,23 +24,8 @@ def main():
     #interval_avg_list = []
     interval_avg_list = [3.2096174, 0.7044605217391305, 3.2213651249999997, 0.672940035714286, 3.251666, 3.1662763333333337, 3.206519333333333, 3.186882833333333, 0.6796149473684211, 0.7057408857142855, 3.15552375, 0.9372554761904762, 0.6814988421052632, 3.2528272, 3.2448035]
     if len(interval_avg_list) == 0:
-        host_dirs = [
-            #input_path('../datasets/5g-static-line/host/run1'),
-            #input_path('../datasets/5g-static-line/host/run2'),
-            #input_path('../datasets/5g-static-line/host/run3'),
-            #input_path('../datasets/5g-static-line/host/run4'),
-            #input_path('../datasets/5g-static-line/host/run5'), # 3.2528272
-            #input_path('../datasets/5g-host_move-line/host/run1'), # 3.2448035
-            #input_path('../datasets/5g-host_move-line/host/run2'),
-            #input_path('../datasets/5g-host_move-line/host/run3'),
-            #input_path('../datasets/5g-host_move-line/host/run4'),
-            #input_path('../datasets/5g-host_move-line/host/run5'),
-            #input_path('../datasets/5g-resolver_move-line/host/run1'),
-            #input_path('../datasets/5g-resolver_move-line/host/run2'),
-            #input_path('../datasets/5g-resolver_move-line/host/run3'),
-            input_path('../datasets/5g-resolver_move-line/host/run4'),
-            #input_path('../datasets/5g-resolver_move-line/host/run5'),
-        ]
+        host_dirs = [record.host_path for record in load_catalog().query(
+            tech='5g', condition='resolver_move', mode='line', run_numbers=4)]
 
         interval_avg_list = []
         for index, host_path in enumerate(host_dirs):
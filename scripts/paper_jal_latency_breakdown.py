@@ -7,6 +7,9 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
+from src.utils.catalog import load_catalog
+from src.utils.run_store import read_csv
+
 ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -124,19 +127,17 @@ def output_boxplot(
 
 
 def prepare_data_for_lines():
+    catalog = load_catalog()
     df_5g_static_lines = []
-    for num in range(1, 6):
+    for record in catalog.query(tech='5g', condition='static', mode='line'):
         df_5g_static_lines.append(
-            pd.read_csv(get_output_path('5g-static-line', num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
     df_5g_dynamic_lines = []
-    for num in range(1, 6):
-        df_5g_dynamic_lines.append(
-            pd.read_csv(get_output_path("5g-host_move-line", num, 'phases.csv'))
-        )
+    for record in catalog.query(tech='5g', condition=('host_move', 'resolver_move'), mode='line'):
         df_5g_dynamic_lines.append(
-            pd.read_csv(get_output_path("5g-resolver_move-line", num, 'phases.csv'))
+            read_csv(get_output_path(record.exp_name, record.run_number, 'phases.csv'))
         )
 
 
@@ -2,10 +2,10 @@ import os
 
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
-
 from matplotlib.ticker import MaxNLocator
 
+from src.utils.run_store import read_csv
+
 ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
 
 def input_path(*file_path) -> str:
@@ -46,7 +46,7 @@ def main():
 
     e2e_list_short_period = []
     for dir in short_period_host_dirs:
-        df = pd.read_csv(dir)
+        df = read_csv(dir)
         e2e_list_short_period += extract_e2e_delays(df)
 
     e2e_list_short_period = np.sort(e2e_list_short_period)
@@ -54,7 +54,7 @@ def main():
 
     e2e_list_long_period = []
     for dir in long_period_host_dirs:
-        df = pd.read_csv(dir)
+        df = read_csv(dir)
         e2e_list_long_period += extract_e2e_delays(df)
 
     e2e_list_long_period = np.sort(e2e_list_long_period)
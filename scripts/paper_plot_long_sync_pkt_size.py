@@ -3,12 +3,11 @@
 import copy
 import numpy as np
 import os
-import pyshark
-from src.constants import DATETIME_FORMAT
 import matplotlib.pyplot as plt
 
-from src.timeline.moment import parse_log_and_pcap
-from src.utils.pcap import get_ip, get_timestamp, is_ack_pkt
+from src.utils.catalog import load_catalog
+from src.utils.run_store import parse_log_and_pcap
+from src.utils.pcap import get_ip, get_timestamp, is_ack_pkt, iter_packets
 from matplotlib.ticker import MaxNLocator
 
 
@@ -114,22 +113,16 @@ def calculate_sync_data(runtime_info, pcap_path):
     sync_start_moment = log_sync_moments[0]
     sync_success_moment = log_sync_moments[-1]
     phone_ip = runtime_info.phone_ip
-    # Construct the filter
-    sync_start_filter = 'frame.time >= "{st}"'.format(st=sync_start_moment.time.strftime(DATETIME_FORMAT))
-    sync_end_filter = 'frame.time <= "{et}"'.format(et=sync_success_moment.time.strftime(DATETIME_FORMAT))
-    ip_ver_filter = "ipv6" if runtime_info.ip_ver_is_six else "ip"
-    tls_filter = "!tls.handshake"
-    display_filter = " && ".join([sync_start_filter, sync_end_filter, ip_ver_filter, tls_filter, "tcp"])
-
-    # Get capture
-    caps = pyshark.FileCapture(pcap_path, display_filter=display_filter)
 
     x_uplink_time = []
     y_uplink_size = []
     x_downlink_time = []
     y_downlink_size = []
 
-    for pkt in caps:
+    ip_version = 6 if runtime_info.ip_ver_is_six else 4
+    for pkt in iter_packets(pcap_path, start_time=sync_start_moment.time, end_time=sync_success_moment.time):
+        if pkt.ip_version != ip_version or pkt.is_tls_handshake:
+            continue
         if is_ack_pkt(pkt):
             continue
 
@@ -153,9 +146,8 @@ def calculate_sync_data(runtime_info, pcap_path):
 
 
 def main():
-    host_dirs = [
-        input_path('../datasets/5g-static-line/host/run4'),
-    ]
+    host_dirs = [record.host_path for record in load_catalog().query(
+        tech='5g', condition='static', mode='line', run_numbers=4)]
 
     for index, host_path in enumerate(host_dirs):
         resolver_path = host_path.replace('/host/', '/resolver/')
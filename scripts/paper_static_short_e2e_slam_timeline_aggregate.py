@@ -9,9 +9,10 @@ import numpy as np
 import matplotlib.dates as mdates
 import pandas as pd
 
-from main import prepare_other_ip_summary_and_moments
+from src.utils.run_store import prepare_other_ip_summary_and_moments
 from src.phase.phase import prepare_phases
-from src.timeline.moment import parse_log_and_pcap
+from src.utils.catalog import load_catalog
+from src.utils.run_store import parse_log_and_pcap
 from src.timeline.timeline import get_timeline
 from src.utils.time import diff_sec
 from matplotlib.ticker import MaxNLocator
@@ -164,9 +165,8 @@ def prepare_e2e_latency_data(phases: List):
 
 
 def main():
-    host_dirs = [
-        input_path('../datasets/5g-static-line/host/run4'),
-    ]
+    host_dirs = [record.host_path for record in load_catalog().query(
+        tech='5g', condition='static', mode='line', run_numbers=4)]
     for index, host_path in enumerate(host_dirs):
         resolver_path = host_path.replace('/host/', '/resolver/')
         exp_name = host_path.split('/')[-3]
@@ -1,12 +1,11 @@
 import copy
 import numpy as np
 import os
-import pyshark
-from src.constants import DATETIME_FORMAT
 import matplotlib.pyplot as plt
 
-from src.timeline.moment import parse_log_and_pcap
-from src.utils.pcap import get_ip, get_timestamp, is_ack_pkt
+from src.utils.catalog import load_catalog
+from src.utils.run_store import parse_log_and_pcap
+from src.utils.packet_table import load_packet_table
 
 ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
 OUTPUT_DIR = 'output'
@@ -100,34 +99,18 @@ def calculate_sync_data(runtime_info, pcap_path):
     sync_start_moment = log_sync_moments[0]
     sync_success_moment = log_sync_moments[-1]
     phone_ip = runtime_info.phone_ip
-    # Construct the filter
-    sync_start_filter = 'frame.time >= "{st}"'.format(st=sync_start_moment.time.strftime(DATETIME_FORMAT))
-    sync_end_filter = 'frame.time <= "{et}"'.format(et=sync_success_moment.time.strftime(DATETIME_FORMAT))
-    ip_ver_filter = "ipv6" if runtime_info.ip_ver_is_six else "ip"
-    tls_filter = "!tls.handshake"
-    display_filter = " && ".join([sync_start_filter, sync_end_filter, ip_ver_filter, tls_filter, "tcp"])
-    # Get capture
-    caps = pyshark.FileCapture(pcap_path, display_filter=display_filter)
-
-    x_uplink_time = []
-    y_uplink_size = []
-    x_downlink_time = []
-    y_downlink_size = []
-
-    for pkt in caps:
-        if is_ack_pkt(pkt):
-            continue
-
-        src_ip = get_ip(pkt, type='src')
-        dst_ip = get_ip(pkt, type='dst')
-
-        if (src_ip == phone_ip) and (dst_ip in runtime_info.arcore_ip_set):
-            x_uplink_time.append(get_timestamp(pkt))
-            y_uplink_size.append(int(pkt.length))
-
-        if (dst_ip == phone_ip) and (src_ip in runtime_info.arcore_ip_set):
-            x_downlink_time.append(get_timestamp(pkt))
-            y_downlink_size.append(int(pkt.length))
+
+    table = load_packet_table(pcap_path)
+    mask = (table.get_window_mask(sync_start_moment.time, sync_success_moment.time)
+            & table.get_ip_version_mask(runtime_info.ip_ver_is_six)
+            & ~table.get_tls_handshake_mask() & ~table.get_ack_mask())
+    uplink_mask = mask & table.get_ip_mask('src', phone_ip) & table.get_ip_mask('dst', runtime_info.arcore_ip_set)
+    downlink_mask = mask & table.get_ip_mask('dst', phone_ip) & table.get_ip_mask('src', runtime_info.arcore_ip_set)
+
+    x_uplink_time = table.get_times(uplink_mask)
+    y_uplink_size = table.packets['length'][uplink_mask].tolist()
+    x_downlink_time = table.get_times(downlink_mask)
+    y_downlink_size = table.packets['length'][downlink_mask].tolist()
 
     return {
         'x_uplink_time': x_uplink_time,
@@ -138,23 +121,8 @@ def calculate_sync_data(runtime_info, pcap_path):
 
 
 def main():
-    host_dirs = [
-        input_path('../datasets/5g-static-line/host/run1'),
-        input_path('../datasets/5g-static-line/host/run2'),
-        input_path('../datasets/5g-static-line/host/run3'),
-        input_path('../datasets/5g-static-line/host/run4'),
-        input_path('../datasets/5g-static-line/host/run5'),
-        input_path('../datasets/5g-host_move-line/host/run1'),
-        input_path('../datasets/5g-host_move-line/host/run2'),
-        input_path('../datasets/5g-host_move-line/host/run3'),
-        input_path('../datasets/5g-host_move-line/host/run4'),
-        input_path('../datasets/5g-host_move-line/host/run5'),
-        input_path('../datasets/5g-resolver_move-line/host/run1'),
-        input_path('../datasets/5g-resolver_move-line/host/run2'),
-        input_path('../datasets/5g-resolver_move-line/host/run3'),
-        input_path('../datasets/5g-resolver_move-line/host/run4'),
-        input_path('../datasets/5g-resolver_move-line/host/run5'),
-    ]
+    host_dirs = [record.host_path for record in load_catalog().query(
+        tech='5g', condition=('static', 'host_move', 'resolver_move'), mode='line')]
     """
     host_dirs = [input_path('datasets/0522-static-wifi/host/run1'),
                  input_path('datasets/0522-static-wifi/host/run2'),
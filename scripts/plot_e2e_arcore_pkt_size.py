@@ -3,9 +3,9 @@ from typing import List, Dict
 
 import matplotlib.pyplot as plt
 
-from src.main import prepare_other_ip_summary_and_moments
 from src.phase.phase import prepare_phases
-from src.timeline.moment import prepare_moment_data
+from src.timeline.moment import prepare_moment_data, prepare_other_ip_summary_and_moments
+from src.utils.catalog import load_catalog
 from src.utils.time import diff_sec
 
 ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
@@ -73,23 +73,8 @@ def e2e_of_phase(phase):
 
 
 def main():
-    host_dirs = [
-        input_path('../datasets/5g-static-line/host/run1'),
-        input_path('../datasets/5g-static-line/host/run2'),
-        input_path('../datasets/5g-static-line/host/run3'),
-        input_path('../datasets/5g-static-line/host/run4'),
-        input_path('../datasets/5g-static-line/host/run5'),
-        input_path('../datasets/5g-host_move-line/host/run1'),
-        input_path('../datasets/5g-host_move-line/host/run2'),
-        input_path('../datasets/5g-host_move-line/host/run3'),
-        input_path('../datasets/5g-host_move-line/host/run4'),
-        input_path('../datasets/5g-host_move-line/host/run5'),
-        input_path('../datasets/5g-resolver_move-line/host/run1'),
-        input_path('../datasets/5g-resolver_move-line/host/run2'),
-        input_path('../datasets/5g-resolver_move-line/host/run3'),
-        input_path('../datasets/5g-resolver_move-line/host/run4'),
-        input_path('../datasets/5g-resolver_move-line/host/run5'),
-    ]
+    host_dirs = [record.host_path for record in load_catalog().query(
+        tech='5g', condition=('static', 'host_move', 'resolver_move'), mode='line')]
     for index, host_path in enumerate(host_dirs):
         resolver_path = host_path.replace('/host/', '/resolver/')
         exp_name = host_path.split('/')[-3]
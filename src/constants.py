@@ -1,2 +1,3 @@
 DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+SECOND_FORMAT = '%Y-%m-%d %H:%M:%S'
 YEAR = '2023'
@@ -1,14 +1,38 @@
+import argparse
 import glob
 import json
 import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Set, Dict, Any
+from typing import Iterable, List, Dict, Any, Union
+from unittest import mock
 
 from src.phase.phase import prepare_phases
-from src.timeline.moment import Moment, prepare_moment_for_specified_ip_list, prepare_moment_data
+from src.timeline.moment import Moment, parse_log_and_pcap, prepare_other_ip_summary_and_moments
+from src.timeline.probe import probe_capture
+from src.timeline.timeline import get_timeline, iter_timeline
+from src.utils import logcat, result_cache
+from src.utils.catalog import load_catalog
+from src.utils.journal import JOURNAL_FILENAME, RunJournal, get_completed_runs, read_journal
+from src.utils.manifest import RunManifest, get_code_version, get_file_fingerprint, load_run_manifest
+from src.utils.pcap import MESSAGE_BACKENDS, PCAP_BACKENDS
+from src.utils.pipeline import Stage, run_pipeline
+from src.utils.scheduler import estimate_run_costs, get_stage_timings, order_longest_first
+from src.utils.work_queue import CLAIMED, DONE, FAILED, MAX_ATTEMPTS, WorkQueue, get_worker_id
 from src.utils.time import diff_sec
 
 ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
+REPO_PATH = os.path.abspath(os.path.join(ROOT_PATH, '..'))
+QUEUE_POLL_SECONDS = 2
+MANIFEST_FILENAME = 'manifest.json'
+# Files written by process_run in each run's output directory
+RUN_OUTPUTS = ('phases.csv', 'send_pkt_sequences.csv', 'other_ip_statistics.csv', 'timeline.csv')
+# Also written with the pcap backends that assemble messages, see MESSAGE_BACKENDS
+MESSAGE_OUTPUTS = ('send_messages.csv',)
 
 
 def input_path(*file_path) -> str:
@@ -64,6 +88,53 @@ def output_phases(timeline: List[Moment], output_path: str):
     print('output phases to {}'.format(output_path))
 
 
+def prepare_send_messages(
+        timeline: List[Moment],
+        host_pcap: str,
+        phone_ip: str,
+        database_ip: str,
+        e2e_end_time: datetime,
+        pcap_backend: str = 'native',
+) -> List[Dict[str, Any]]:
+    """
+    The messages (see src.utils.messages) the host sent to the firebase database, from the first stroke added
+    after the user touched the screen to the end of e2e. A message is one write of the app, however many
+    segments it took.
+    Args:
+        pcap_backend: how pcaps are decoded, see src.utils.pcap.iter_packets. Must be one of MESSAGE_BACKENDS.
+
+    Returns:
+        The time, size (TCP payload bytes), segment count and IPs of each message, in time order.
+    """
+    if pcap_backend not in MESSAGE_BACKENDS:
+        raise ValueError('The {} pcap backend does not assemble messages, expected one of {}'.format(
+            pcap_backend, MESSAGE_BACKENDS))
+    found_user_touch_event = False
+    start_time = None
+    for moment in timeline:
+        if not found_user_touch_event and moment.name == 'user touches screen':
+            found_user_touch_event = True
+        if found_user_touch_event and moment.name == 'add a stroke':
+            start_time = moment.time
+            break
+    if start_time is None:
+        return []
+
+    capture = probe_capture(host_pcap, backend=pcap_backend)
+    table = capture.table
+    mask = capture.get_message_mask(phone_ip, database_ip, start_time, e2e_end_time)
+    messages = table.messages[mask]
+    return [{
+        'time': time,
+        'size': size,
+        'segments': segments,
+        'src_ip': table.get_ip(src),
+        'dst_ip': table.get_ip(dst),
+    } for time, size, segments, src, dst in zip(table.get_message_times(mask), messages['bytes'].tolist(),
+                                                 messages['segments'].tolist(), messages['src'].tolist(),
+                                                 messages['dst'].tolist())]
+
+
 def output_send_pkt_sequences(timeline: List[Moment], output_path: str):
     found_start = False
     found_user_touch_event = False
@@ -87,7 +158,15 @@ def output_send_pkt_sequences(timeline: List[Moment], output_path: str):
     print('output send packet sequences to {}'.format(output_path))
 
 
-def output_timeline(timeline: List[Moment], output_path: str):
+def output_send_messages(send_messages: List[Dict[str, Any]], output_path: str):
+    with open(output_path, 'w') as f:
+        f.write('time,msg_size,segments,src_ip,dst_ip\n')
+        for message in send_messages:
+            f.write('{time},{size},{segments},{src_ip},{dst_ip}\n'.format(**message))
+    print('output send messages to {}'.format(output_path))
+
+
+def output_timeline(timeline: Iterable[Moment], output_path: str):
     with open(output_path, 'w') as f:
         f.write('time,source,name,from,to,metadata (json)\n')
         for moment in timeline:
@@ -102,68 +181,26 @@ def output_timeline(timeline: List[Moment], output_path: str):
     print('output timeline to {}'.format(output_path))
 
 
-def prepare_other_ip_summary_and_moments(
-        host_pcap: str,
-        resolver_pcap: str,
-        e2e_start_time: datetime,
-        e2e_end_time: datetime,
-        database_ip: str,
-):
-    transmission_summation_map = {}
-    host_moment_res = prepare_moment_for_specified_ip_list(
-        pcap_path=host_pcap,
-        source='host',
-        exclude_ip_set={database_ip},
-        start_time=e2e_start_time,
-        end_time=e2e_end_time,
-    )
-    resolver_moment_res = prepare_moment_for_specified_ip_list(
-        pcap_path=resolver_pcap,
-        source='resolver',
-        exclude_ip_set={database_ip},
-        start_time=e2e_start_time,
-        end_time=e2e_end_time,
-    )
-    moments = host_moment_res.get('moments') + resolver_moment_res.get('moments')
-    moments.sort(key=lambda x: x.time)
-
-    for moment in moments:
-        key = '{}->{}'.format(moment.action_from, moment.action_to)
-        if key not in transmission_summation_map:
-            transmission_summation_map[key] = {
-                'total_size': 0,
-                'pkt_count': 0,
-            }
-        transmission_summation_map[key]['total_size'] += int(moment.metadata['size'])
-        transmission_summation_map[key]['pkt_count'] += 1
-
-    return {
-        'moments': moments,
-        'transmission_summation_map': transmission_summation_map,
-    }
-
-
 def output_other_ip_summary_and_timeline(
         res_of_other_ip: Dict[str, Any],
         output_path: str
 ):
-    transmission_summation_map = res_of_other_ip.get('transmission_summation_map')
+    transmission_summary = res_of_other_ip.get('transmission_summary')
     moments = res_of_other_ip.get('moments')
 
     with open(output_path, 'w') as f:
         f.write('time,source,name,from,to,metadata (json)\n')
 
-        for key in transmission_summation_map:
-            from_ip, to_ip = key.split('->')
+        for summary in transmission_summary:
             f.write('{time},{source},{name},{action_from},{action_to},{metadata}\n'.format(
                 time='',
                 name='transmission summary',
                 source='',
-                action_from=from_ip,
-                action_to=to_ip,
+                action_from=summary['src_ip'],
+                action_to=summary['dst_ip'],
                 metadata=json.dumps({
-                    'total_pkt_count': transmission_summation_map[key]['pkt_count'],
-                    'total_pkt_size': transmission_summation_map[key]['total_size'],
+                    'total_pkt_count': summary['pkt_count'],
+                    'total_pkt_size': summary['total_size'],
                 }),
             ))
         for moment in moments:
@@ -178,17 +215,410 @@ def output_other_ip_summary_and_timeline(
     print('output other ip statistic to {}'.format(output_path))
 
 
+def get_run_paths(host_path: str, pcap_backend: str = 'native') -> Dict[str, Any]:
+    """
+    Returns:
+        The name of the run, its four input files and the output files written with pcap_backend.
+    """
+    resolver_path = host_path.replace('/host/', '/resolver/')
+    exp_name = host_path.split('/')[-3]
+    run_name = host_path.split('/')[-1]
+    app_log = 'static_log.logcat'
+    pcap = 'capture.pcap'
+    _output_path = output_path(exp_name + '/' + run_name)
+    return {
+        'run': '{}/{}'.format(exp_name, run_name),
+        'output_path': _output_path,
+        'inputs': {
+            'host_app_log': input_path(host_path, app_log),
+            'resolver_app_log': input_path(resolver_path, app_log),
+            'host_pcap': input_path(host_path, pcap),
+            'resolver_pcap': input_path(resolver_path, pcap),
+        },
+        'outputs': [os.path.join(_output_path, filename)
+                    for filename in RUN_OUTPUTS + (MESSAGE_OUTPUTS if pcap_backend in MESSAGE_BACKENDS else ())],
+    }
+
+
+def get_run_options(pcap_backend: str) -> Dict[str, Any]:
+    """
+    The options of main that change the outputs of a run, recorded with them in the manifest and the journal.
+    """
+    return {'pcap_backend': pcap_backend}
+
+
+def get_run_journal(run_paths: Dict[str, Any]) -> RunJournal:
+    return RunJournal(path=output_path(JOURNAL_FILENAME), run=run_paths['run'])
+
+
+def parse_run(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    First stage of a run: parse its logs and pcaps.
+    Args:
+        state: host_path, pcap_backend and log_jobs of the run, see process_run.
+
+    Returns:
+        state, with the run's paths and the info map of parse_log_and_pcap.
+    """
+    run_paths = get_run_paths(state['host_path'], state['pcap_backend'])
+    inputs = run_paths['inputs']
+    os.makedirs(run_paths['output_path'], exist_ok=True)
+    info_map = parse_log_and_pcap(
+        host_app_log=inputs['host_app_log'],
+        resolver_app_log=inputs['resolver_app_log'],
+        host_pcap=inputs['host_pcap'],
+        resolver_pcap=inputs['resolver_pcap'],
+        pcap_backend=state['pcap_backend'],
+        journal=get_run_journal(run_paths),
+        log_jobs=state.get('log_jobs'),
+    )
+    return {**state, 'run_paths': run_paths, 'info_map': info_map}
+
+
+def build_run(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Second stage of a run: build its timeline, the statistics of the other IPs and the messages sent to
+    the database from the info map.
+    Returns:
+        state, with the timeline of the app and database moments, the other IPs' summary and moments and
+        the host's messages to the database (None without message assembly), without the info map.
+    """
+    info_map = state['info_map']
+    inputs = state['run_paths']['inputs']
+    # combine all moments, sorted by time
+    timeline = get_timeline(info_map)
+
+    # collect data of ips that is not the ip of firebase database
+    # including ips of arcore
+    res_of_other_ip = prepare_other_ip_summary_and_moments(
+        host_pcap=inputs['host_pcap'],
+        resolver_pcap=inputs['resolver_pcap'],
+        e2e_start_time=info_map.get('e2e_start_time'),
+        e2e_end_time=info_map.get('e2e_end_time'),
+        database_ip=info_map.get('database_ip'),
+        pcap_backend=state['pcap_backend'],
+    )
+
+    # messages sent by the host to firebase database, None if the backend does not assemble them
+    send_messages = None
+    if state['pcap_backend'] in MESSAGE_BACKENDS:
+        send_messages = prepare_send_messages(
+            timeline,
+            host_pcap=inputs['host_pcap'],
+            phone_ip=info_map['host'].phone_ip,
+            database_ip=info_map.get('database_ip'),
+            e2e_end_time=info_map.get('e2e_end_time'),
+            pcap_backend=state['pcap_backend'],
+        )
+    state = {key: value for key, value in state.items() if key != 'info_map'}
+    return {**state, 'timeline': timeline, 'res_of_other_ip': res_of_other_ip, 'send_messages': send_messages}
+
+
+def write_run(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Last stage of a run: write its outputs.
+    The end of the journal's 'outputs' stage records what the outputs were built from and their hashes,
+    so that main --resume can tell the run is complete.
+    Returns:
+        state, without the timeline, the other IPs' results and the messages.
+    """
+    run_paths = state['run_paths']
+    _output_path = run_paths['output_path']
+    journal = get_run_journal(run_paths)
+    timeline = state['timeline']
+    res_of_other_ip = state['res_of_other_ip']
+
+    with journal.stage('phases'):
+        # output_sequences(timeline, '{prefix}/sequences.txt'.format(prefix=_output_path))
+        output_phases(timeline, '{prefix}/phases.csv'.format(prefix=_output_path))
+        output_send_pkt_sequences(timeline, '{prefix}/send_pkt_sequences.csv'.format(prefix=_output_path))
+        send_messages_path = '{prefix}/send_messages.csv'.format(prefix=_output_path)
+        if state['send_messages'] is not None:
+            output_send_messages(state['send_messages'], send_messages_path)
+        else:
+            # Do not leave the messages of another backend next to these outputs
+            if os.path.isfile(send_messages_path):
+                os.remove(send_messages_path)
+            print('no message assembly with the {} pcap backend, {} not written'.format(
+                state['pcap_backend'], send_messages_path))
+
+    with journal.stage('outputs') as details:
+        output_other_ip_summary_and_timeline(
+            res_of_other_ip,
+            output_path='{prefix}/other_ip_statistics.csv'.format(prefix=_output_path)
+        )
+
+        output_timeline(iter_timeline(timeline, res_of_other_ip.get('moments')),
+                        '{prefix}/timeline.csv'.format(prefix=_output_path))
+
+        details['inputs'] = {name: get_file_fingerprint(path) for name, path in run_paths['inputs'].items()}
+        details['code_version'] = get_code_version()
+        details['options'] = get_run_options(state['pcap_backend'])
+        details['outputs'] = {path: get_file_fingerprint(path)['sha256'] for path in run_paths['outputs']}
+    return {key: value for key, value in state.items() if key not in ('timeline', 'res_of_other_ip', 'send_messages')}
+
+
+def get_run_status(host_path: str, start: float, error: Union[Exception, None]) -> Dict[str, Any]:
+    """
+    Returns:
+        The status of the run: 'ok' or 'failed' with the error, and how long it took in seconds since start
+        (a time.time()).
+    """
+    run = get_run_paths(host_path)['run']
+    if error is not None:
+        print('run {run_name} failed'.format(run_name=host_path.split('/')[-1]))
+        print(error)
+    return {
+        'run': run,
+        'status': 'ok' if error is None else 'failed',
+        'error': None if error is None else '{}: {}'.format(type(error).__name__, error),
+        'duration': time.time() - start,
+    }
+
+
+def process_run(host_path: str, pcap_backend: str = 'native', log_jobs: int = None) -> Dict[str, Any]:
+    """
+    Parse one run (the host's directory and the matching resolver's directory) and write its outputs,
+    i.e. parse_run, build_run and write_run one after the other.
+    Its stages are journaled in output/journal.jsonl.
+    Args:
+        host_path: e.g. datasets/5g-static-line/host/run1.
+        pcap_backend: how pcaps are decoded, see src.utils.pcap.iter_packets.
+        log_jobs: number of processes scanning each app log, see src.utils.logcat.get_log_jobs.
+
+    Returns:
+        The status of the run, see get_run_status.
+    """
+    start = time.time()
+    try:
+        write_run(build_run(parse_run({'host_path': host_path, 'pcap_backend': pcap_backend, 'log_jobs': log_jobs})))
+    except Exception as e:
+        return get_run_status(host_path, start, e)
+    return get_run_status(host_path, start, None)
+
+
+def get_batch_log_jobs(jobs: int, log_jobs: int = None) -> Union[int, None]:
+    """
+    Number of processes scanning each app log (see src.utils.logcat.get_log_jobs) when `jobs` runs are
+    processed at once. Unless set, each run scans its logs serially: its worker process already has a CPU,
+    and a pool per large log in every worker would start jobs times more processes than there are CPUs.
+    """
+    if log_jobs is None and jobs > 1:
+        return 1
+    return log_jobs
+
+
+def process_runs_pipelined(host_dirs: List[str], jobs: int = 1, pcap_backend: str = 'native',
+                           log_jobs: int = None) -> List[Dict[str, Any]]:
+    """
+    Process runs in an asyncio pipeline: while the outputs of a run are written, the next run is built and
+    the one after is parsed. Parsing and building happen in `jobs` worker processes (parsing up to jobs runs
+    at once), writing in a thread, and the stages are connected by bounded queues.
+    Returns:
+        The status of each run, in the order of host_dirs.
+    """
+    starts = {}
+    log_jobs = get_batch_log_jobs(jobs, log_jobs)
+
+    def start_run(host_path: str) -> Dict[str, Any]:
+        starts[host_path] = time.time()
+        return {'host_path': host_path, 'pcap_backend': pcap_backend, 'log_jobs': log_jobs}
+
+    with ProcessPoolExecutor(max_workers=jobs + 1) as process_executor, \
+            ThreadPoolExecutor(max_workers=2) as thread_executor:
+        results = run_pipeline(host_dirs, [
+            Stage(name='start', function=start_run, executor=thread_executor),
+            Stage(name='parse', function=parse_run, executor=process_executor, workers=jobs),
+            Stage(name='build', function=build_run, executor=process_executor),
+            Stage(name='write', function=write_run, executor=thread_executor),
+        ])
+    return [get_run_status(host_path, starts.get(host_path, time.time()), error)
+            for host_path, (_, error) in zip(host_dirs, results)]
+
+
+def process_runs(host_dirs: List[str], jobs: int = 1, pcap_backend: str = 'native',
+                 log_jobs: int = None) -> List[Dict[str, Any]]:
+    """
+    Process runs in up to `jobs` worker processes. Runs share no state, each one writes its own output directory.
+    Returns:
+        The status of each run (see process_run), in the order of host_dirs whatever the order they finished in.
+    """
+    log_jobs = get_batch_log_jobs(jobs, log_jobs)
+    if jobs <= 1:
+        return [process_run(host_path, pcap_backend, log_jobs) for host_path in host_dirs]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(process_run, host_dirs, [pcap_backend] * len(host_dirs),
+                                 [log_jobs] * len(host_dirs)))
+
+
+def run_worker(queue_path: str, pcap_backend: str = 'native', log_jobs: int = None):
+    """
+    Claim and process runs from the work queue at queue_path until no run is pending or being processed.
+    A heartbeat thread keeps the claim alive while the run is processed; runs whose worker died are
+    claimed again once their lease expires, and failed runs are released to be claimed again, until they
+    ran out of attempts.
+    """
+    queue = WorkQueue(path=queue_path)
+    worker = get_worker_id()
+    print('worker {} started on {}'.format(worker, queue_path))
+    while True:
+        job = queue.claim(worker)
+        if job is None:
+            if queue.get_counts()[CLAIMED] == 0:
+                break
+            # Other workers' runs may come back if they die
+            time.sleep(QUEUE_POLL_SECONDS)
+            continue
+
+        stop_heartbeat = threading.Event()
+
+        def send_heartbeats():
+            heartbeat_queue = WorkQueue(path=queue_path)
+            while not stop_heartbeat.wait(queue.lease_seconds / 4):
+                if not heartbeat_queue.heartbeat(job['id'], worker):
+                    print('worker {} lost the claim on {}'.format(worker, job['run']))
+                    break
+            heartbeat_queue.close()
+
+        heartbeat_thread = threading.Thread(target=send_heartbeats, daemon=True)
+        heartbeat_thread.start()
+        try:
+            status = process_run(os.path.join(REPO_PATH, job['payload']['host_path']), pcap_backend, log_jobs)
+        finally:
+            stop_heartbeat.set()
+            heartbeat_thread.join()
+        if status['status'] == 'failed':
+            queue.release(job['id'], worker, status['error'])
+        else:
+            queue.complete(job['id'], worker, status)
+    queue.close()
+    print('worker {} done'.format(worker))
+
+
+def process_runs_with_queue(host_dirs: List[str], queue_path: str, local_workers: int = 0,
+                            pcap_backend: str = 'native', log_jobs: int = None) -> List[Dict[str, Any]]:
+    """
+    Same as process_runs, but the runs are put in a work queue that workers started with
+    `main.py --worker --queue queue_path`, on this machine or others sharing the repository, take them from,
+    in the order of host_dirs.
+    Returns once every run was processed or ran out of attempts.
+    Args:
+        local_workers: number of workers to start on this machine.
+    """
+    log_jobs = get_batch_log_jobs(local_workers, log_jobs)
+    queue = WorkQueue(path=queue_path)
+    runs = []
+    for index, host_path in enumerate(host_dirs):
+        run = get_run_paths(host_path)['run']
+        queue.enqueue(run, {'host_path': os.path.relpath(host_path, REPO_PATH)}, priority=len(host_dirs) - index)
+        runs.append(run)
+    print('queued {} runs in {}'.format(len(runs), queue_path))
+
+    executor = ProcessPoolExecutor(max_workers=local_workers) if local_workers > 0 else None
+    if executor is not None:
+        for _ in range(local_workers):
+            executor.submit(run_worker, queue_path, pcap_backend, log_jobs)
+    try:
+        while True:
+            queue.get_counts()  # requeues expired claims
+            jobs = {job['run']: job for job in queue.get_jobs(runs)}
+            if all(job['state'] in (DONE, FAILED) for job in jobs.values()):
+                break
+            time.sleep(QUEUE_POLL_SECONDS)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        queue.close()
+
+    statuses = []
+    for run in runs:
+        job = jobs[run]
+        result = job['result'] or {}
+        statuses.append({
+            'run': run,
+            'status': result.get('status', 'failed'),
+            'error': result.get('error'),
+            'duration': result.get('duration', 0.0),
+        })
+    return statuses
+
+
+def resume_from_journal(manifest: RunManifest, journal_path: str, code_version: str,
+                        options: Dict[str, Any]) -> List[str]:
+    """
+    Record in the manifest the runs that the journal shows completed with the same code and options (see
+    get_run_options), and whose outputs were not changed since, so that an interrupted main can skip them
+    even though it did not save the manifest.
+    Returns:
+        The names of the resumed runs.
+    """
+    resumed = []
+    for run, event in get_completed_runs(read_journal(journal_path), 'outputs').items():
+        if event.get('code_version') != code_version or event.get('options', {}) != options:
+            continue
+        outputs = event.get('outputs', {})
+        if any((get_file_fingerprint(path) or {}).get('sha256') != sha256 for path, sha256 in outputs.items()):
+            continue
+        manifest.record(run, event['inputs'], code_version, options)
+        resumed.append(run)
+    return resumed
+
+
+def output_run_statuses(statuses: List[Dict[str, Any]], output_path: str):
+    with open(output_path, 'w') as f:
+        f.write('run,status,duration,error\n')
+        for status in statuses:
+            f.write('{run},{status},{duration:.3f},{error}\n'.format(
+                run=status['run'],
+                status=status['status'],
+                duration=status['duration'],
+                error=json.dumps(status['error'] or ''),
+            ))
+    print('output run statuses to {}'.format(output_path))
+
+
 def main():
-    # clear output dirs
-    output_dirs = glob.glob(input_path('../output/*/*'))
-    for _path in output_dirs:
-        for filename in os.listdir(_path):
-            filepath = os.path.join(_path, filename)
-            try:
-                if os.path.isfile(filepath):
-                    os.remove(filepath)
-            except Exception as e:
-                print(f"Error while deleting file: {filepath} ({e})")
+    parser = argparse.ArgumentParser(description='Build the timelines, phases and packet statistics of every run.')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='number of runs processed in parallel, 0 for one per CPU (default: 1)')
+    parser.add_argument('--pcap-backend', choices=PCAP_BACKENDS, default='native',
+                        help='how pcaps are decoded (default: native)')
+    parser.add_argument('--log-jobs', type=int,
+                        help='number of processes scanning each app log, 0 for one per CPU (default: 1, or half '
+                             'the CPUs for logs over {} MiB when runs are processed one at a time)'.format(
+                            logcat.LOG_PARALLEL_BYTES >> 20))
+    parser.add_argument('--full', action='store_true',
+                        help='clear the outputs and process every run, even those that are up to date')
+    parser.add_argument('--queue',
+                        help='SQLite work queue to hand the runs to, instead of processing them in this process; '
+                             'with --worker, the queue to take runs from')
+    parser.add_argument('--worker', action='store_true', help='process runs from --queue until it is empty')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='overlap the parsing, building and writing of consecutive runs')
+    parser.add_argument('--resume', action='store_true',
+                        help='also skip the runs that output/journal.jsonl shows completed by an interrupted run')
+    args = parser.parse_args()
+    jobs = args.jobs or os.cpu_count()
+
+    if args.worker:
+        if not args.queue:
+            parser.error('--worker needs --queue')
+        run_worker(args.queue, pcap_backend=args.pcap_backend, log_jobs=args.log_jobs)
+        return
+
+    manifest = load_run_manifest(output_path(MANIFEST_FILENAME))
+    if args.full:
+        # clear output dirs
+        output_dirs = glob.glob(input_path('../output/*/*'))
+        for _path in output_dirs:
+            for filename in os.listdir(_path):
+                filepath = os.path.join(_path, filename)
+                try:
+                    if os.path.isfile(filepath):
+                        os.remove(filepath)
+                except Exception as e:
+                    print(f"Error while deleting file: {filepath} ({e})")
+        manifest.runs = {}
 
     # host_dirs = [
     # input_path('../datasets/5g-static-line/host/run1'),
@@ -207,63 +637,102 @@ def main():
     # input_path('../datasets/5g-resolver_move-line/host/run4'),
     # input_path('../datasets/5g-resolver_move-line/host/run5'),
     # ]
-    host_dirs = glob.glob(input_path('../datasets/*/host/*'))
-    for index, host_path in enumerate(host_dirs):
-        resolver_path = host_path.replace('/host/', '/resolver/')
-        exp_name = host_path.split('/')[-3]
-        run_name = host_path.split('/')[-1]
-        app_log = 'static_log.logcat'
-        pcap = 'capture.pcap'
-        _output_path = output_path(exp_name + '/' + run_name)
-
-        if not os.path.exists(_output_path):
-            os.makedirs(_output_path)
-        try:
-            moment_map = prepare_moment_data(
-                host_app_log=input_path(host_path, app_log),
-                resolver_app_log=input_path(resolver_path, app_log),
-                host_pcap=input_path(host_path, pcap),
-                resolver_pcap=input_path(resolver_path, pcap),
-            )
-
-            # combine all moments
-            timeline = []
-            timeline.extend(moment_map.get('host_app'))
-            timeline.extend(moment_map.get('resolver_app'))
-            timeline.extend(moment_map.get('host_pcap'))
-            timeline.extend(moment_map.get('resolver_pcap'))
-            # sort moments by time
-            timeline.sort(key=lambda x: x.time)
-
-            # output_sequences(timeline, '{prefix}/sequences.txt'.format(prefix=_output_path))
-            output_phases(timeline, '{prefix}/phases.csv'.format(prefix=_output_path))
-            output_send_pkt_sequences(timeline,
-                                      '{prefix}/send_pkt_sequences.csv'.format(prefix=_output_path))
-
-            # collect data of ips that is not the ip of firebase database
-            # including ips of arcore
-            res_of_other_ip = prepare_other_ip_summary_and_moments(
-                host_pcap=input_path(host_path, pcap),
-                resolver_pcap=input_path(resolver_path, pcap),
-                e2e_start_time=moment_map.get('e2e_start_time'),
-                e2e_end_time=moment_map.get('e2e_end_time'),
-                database_ip=moment_map.get('database_ip'),
-            )
-            output_other_ip_summary_and_timeline(
-                res_of_other_ip,
-                output_path='{prefix}/other_ip_statistics.csv'.format(prefix=_output_path)
-            )
-
-            timeline.extend(res_of_other_ip.get('moments'))
-            timeline.sort(key=lambda x: x.time)
-            output_timeline(timeline, '{prefix}/timeline.csv'.format(prefix=_output_path))
-
-
-        except Exception as e:
-            print('run {run_name} failed'.format(run_name=run_name))
-            print(e)
-            continue
+    host_dirs = [record.host_path for record in load_catalog().records]
+    start = time.perf_counter()
+
+    # Skip the runs whose inputs, processing code and options did not change since their outputs were built
+    code_version = get_code_version()
+    options = get_run_options(args.pcap_backend)
+    if args.resume and not args.full:
+        resumed = resume_from_journal(manifest, output_path(JOURNAL_FILENAME), code_version, options)
+        print('resuming, {} run(s) completed by the journal'.format(len(resumed)))
+    run_fingerprints = {}
+    statuses = {}
+    stale_host_dirs = []
+    for host_path in host_dirs:
+        run_paths = get_run_paths(host_path, args.pcap_backend)
+        run_fingerprints[host_path] = manifest.get_fingerprints(run_paths['run'], run_paths['inputs'])
+        if manifest.is_up_to_date(run_paths['run'], run_fingerprints[host_path], code_version, run_paths['outputs'],
+                                  options):
+            statuses[host_path] = {'run': run_paths['run'], 'status': 'up to date', 'error': None, 'duration': 0.0}
+        else:
+            stale_host_dirs.append(host_path)
+
+    # Longest runs first, estimated from their sizes and the stage timings of previous batches,
+    # so that the batch does not end with one worker busy with a long run
+    run_names = {host_path: get_run_paths(host_path)['run'] for host_path in stale_host_dirs}
+    costs = estimate_run_costs({run_names[host_path]: get_run_paths(host_path)['inputs']
+                                for host_path in stale_host_dirs},
+                               get_stage_timings(read_journal(output_path(JOURNAL_FILENAME))))
+    stale_host_dirs = order_longest_first(stale_host_dirs,
+                                          {host_path: costs[run] for host_path, run in run_names.items()})
+
+    if args.queue:
+        # --jobs workers are started here, the others with --worker
+        stale_statuses = process_runs_with_queue(stale_host_dirs, args.queue, local_workers=jobs,
+                                                 pcap_backend=args.pcap_backend, log_jobs=args.log_jobs)
+    else:
+        process = process_runs_pipelined if args.pipeline else process_runs
+        stale_statuses = process(stale_host_dirs, jobs=jobs, pcap_backend=args.pcap_backend, log_jobs=args.log_jobs)
+    for host_path, status in zip(stale_host_dirs, stale_statuses):
+        statuses[host_path] = status
+        if status['status'] == 'ok':
+            manifest.record(status['run'], run_fingerprints[host_path], code_version, options)
+    manifest.save()
+
+    statuses = [statuses[host_path] for host_path in host_dirs]
+    output_run_statuses(statuses, output_path('runs.csv'))
+    failed = [status['run'] for status in statuses if status['status'] == 'failed']
+    print('{ok}/{total} runs succeeded ({skipped} up to date) in {duration:.1f}s with {jobs} job(s)'.format(
+        ok=len(statuses) - len(failed),
+        total=len(statuses),
+        skipped=len(host_dirs) - len(stale_host_dirs),
+        duration=time.perf_counter() - start,
+        jobs=jobs,
+    ))
+    if failed:
+        print('failed runs: {}'.format(', '.join(failed)))
 
 
 if __name__ == '__main__':
     main()
+
+
+class ProcessRunsUnitTest(unittest.TestCase):
+    def test_log_pools_not_nested(self):
+        host_dirs = [os.path.join(REPO_PATH, 'datasets', '5g-static-line', 'host', run) for run in ('run1', 'run3')]
+        if not all(os.path.isdir(host_path) for host_path in host_dirs):
+            self.skipTest('no dataset')
+
+        def no_pool(*args, **kwargs):
+            raise AssertionError('log pool started')
+
+        # Every log is large enough for a pool and is split in several chunks;
+        # worker processes are forked and inherit the patches
+        with tempfile.TemporaryDirectory() as dir_path, \
+                mock.patch.object(logcat, 'LOG_PARALLEL_BYTES', 0), \
+                mock.patch.object(logcat, 'LOG_CHUNK_BYTES', 1 << 16), \
+                mock.patch.object(logcat, 'ProcessPoolExecutor', no_pool), \
+                mock.patch.object(result_cache, 'CACHE_DIR', dir_path), \
+                mock.patch(__name__ + '.output_path', lambda file_path: os.path.join(dir_path, file_path)):
+            # One run at a time scans its logs in a pool
+            self.assertIsNone(get_batch_log_jobs(1))
+            status = process_runs(host_dirs[:1], jobs=1, log_jobs=2)[0]
+            self.assertEqual(('failed', 'AssertionError: log pool started'), (status['status'], status['error']))
+            # Runs in parallel do not
+            self.assertEqual(1, get_batch_log_jobs(2))
+            statuses = process_runs(host_dirs, jobs=2)
+            self.assertEqual(['ok', 'ok'], [status['status'] for status in statuses])
+
+    def test_failed_runs_retried(self):
+        with tempfile.TemporaryDirectory() as dir_path, \
+                mock.patch(__name__ + '.output_path', lambda file_path: os.path.join(dir_path, file_path)):
+            queue_path = os.path.join(dir_path, 'queue.sqlite')
+            queue = WorkQueue(path=queue_path)
+            queue.enqueue('5g-missing-line/run1', {'host_path': 'datasets/5g-missing-line/host/run1'})
+            run_worker(queue_path)
+            job = queue.get_jobs()[0]
+            queue.close()
+        # Claimed again after each failure, until it ran out of attempts
+        self.assertEqual((FAILED, MAX_ATTEMPTS), (job['state'], job['attempts']))
+        self.assertTrue(job['result']['error'].startswith('FileNotFoundError'))
@@ -1,11 +1,21 @@
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Dict, Set
-import pyshark
+from typing import Any, Dict, Iterator, List, Set
 
-from src.constants import YEAR, DATETIME_FORMAT
-from src.utils.pcap import get_ip, is_data_pkt, get_timestamp, is_ack_pkt, filter_ip
-from src.utils.strings import has_prefix, extract_timestamp, extract_stroke_id
+import numpy as np
+
+from src.constants import YEAR
+from src.timeline.probe import CaptureProbe, probe_capture
+from src.utils.packet_table import TABLE_VERSION, PacketTable
+from src.utils.journal import RunJournal, journal_stage
+from src.utils.logcat import STROKE_EVENTS, get_log_jobs, iter_log_events_parallel
+from src.utils.raw_data import LogLineRef
+from src.utils.result_cache import ResultCache
+from src.utils.strings import has_prefix, extract_timestamp
+
+# Bump whenever the output of parse_log_and_pcap changes, so that cached results are recomputed.
+PARSER_VERSION = 2
 
 
 class Moment:
@@ -44,253 +54,188 @@ class RuntimeInfo:
         self.ip_ver_is_six = kwargs.get("ip_ver_is_six")
 
 
-def create_essential_metadata(pkt, type: str):
-    src_ip = get_ip(pkt, type='src')
-    dst_ip = get_ip(pkt, type='dst')
-    pkt_size = pkt.length
+def create_essential_metadata(table: PacketTable, row: int, type: str):
+    packet = table.packets[row]
+    src_ip = table.get_ip(packet['src'])
+    dst_ip = table.get_ip(packet['dst'])
+    pkt_size = int(packet['length'])
     return {'src_ip': src_ip, 'dst_ip': dst_ip, 'type': type, 'size': pkt_size}
 
 
-def parse_log(log, phone_type: str):
+# Moment names of the app messages of the drawing section, by kind (see src.utils.logcat)
+LOG_DRAWING_EVENTS = {
+    'touch_start': 'user touches screen',
+    'stroke_added': 'add a stroke',
+    'add_points': 'add points to stroke',
+    'cloud_finish': 'notified by finish of cloud processing',
+    'line_changed': 'receive point updates',
+    'line_added': 'receive point updates',
+    'finish_rendering': 'finish rendering',
+}
+# and of the synchronization section, before SYNCED
+LOG_SYNC_EVENTS = {
+    'sync_start': 'sync start',
+    'sync_success': 'sync success',
+}
+
+
+def iter_log_moments(log, phone_type: str, jobs: int = 1) -> Iterator[Moment]:
+    """
+    The moments of the host's or resolver's application log, in the order of its lines,
+    as they are parsed (see parse_log).
+    Raises once exhausted if the log has no synchronization message.
+    Args:
+        jobs: number of processes scanning chunks of the log, for very large logs. Lines are classified
+            independently in the chunks; only the events go through the section state below, in order.
+    """
+    sync_success_found = False
+    sync_moment_names = []
+    # Lines of the messages that we care about, see iter_log_events
+    for line_offset, line_length, event in iter_log_events_parallel(log, year=YEAR, jobs=jobs):
+        if sync_success_found:
+            if event.kind not in LOG_DRAWING_EVENTS:
+                continue
+            yield Moment(
+                source=phone_type,
+                name=LOG_DRAWING_EVENTS[event.kind],
+                time=event.time,
+                raw_data=LogLineRef(log, line_offset, line_length),
+                metadata={'stroke_id': event.stroke_id} if event.kind in STROKE_EVENTS else None,
+                action_from=phone_type,
+                action_to=phone_type,
+            )
+
+        # Synchronization-related log messages.
+        elif event.kind in LOG_SYNC_EVENTS:
+            # sync_failed_regexp = lambda x: has_prefix(x, prefix=r'\[\[onAnchorResolutionError')
+            if event.kind == 'sync_success':
+                sync_success_found = True
+                if sync_moment_names[-1] != "sync start":
+                    raise Exception("No corresponding sync message")
+            sync_moment_names.append(LOG_SYNC_EVENTS[event.kind])
+            yield Moment(
+                source=phone_type,
+                name=LOG_SYNC_EVENTS[event.kind],
+                time=event.time,
+                raw_data=LogLineRef(log, line_offset, line_length),
+                action_from=phone_type,
+                action_to=phone_type,
+            )
+
+    # Error checking
+    if not sync_moment_names:
+        raise RuntimeError("Missing sync start or end message.")
+
+
+def parse_log(log, phone_type: str, jobs: int = 1):
     """
     Parse each line of the host's application log, and return necessary information.
     Args:
         host_app_log: Path to the host app log
+        jobs: number of processes scanning the log, see iter_log_moments
     Returns:
         A map that contains a list of host moments, host's synchronization start time,
-        and host's synchronization end time.
+        and host's synchronization end time. The raw_data of the moments is a LogLineRef to their line.
     """
-    # Host's regexp
-    touch_start_regexp = lambda x: has_prefix(x, prefix=r'\[\[1a start\] touch screen')
-    stroke_was_added_regexp = lambda x: has_prefix(x, prefix=r'stroke \(id: .*?\) was added at')
-    add_points_to_stroke_regexp = lambda x: has_prefix(x, prefix=r'send stroke to firebase')
-    cloud_finish_processing_regexp = lambda x: has_prefix(x, prefix=r'onComplete of doStrokeUpdate')
-    sync_start_regexp = lambda x: has_prefix(x, prefix=r'SET ANCHOR')
-    sync_success_regexp = lambda x: has_prefix(x, prefix=r'SYNCED')
-    # sync_failed_regexp = lambda x: has_prefix(x, prefix=r'\[\[onAnchorResolutionError')
-
-    # Resolver's regexp
-    on_line_added_regexp = lambda x: has_prefix(x, prefix=r'\[\[2a end - 2d start\] onChildAdded')
-    on_line_changed_regexp = lambda x: has_prefix(x, prefix=r'\[\[2a end - 2d start\] onChildChanged')
-    finish_rendering_regexp = lambda x: has_prefix(x, prefix=r'\[\[2d\] after update')
-
     log_drawing_moments = []
     log_sync_moments = []
-    sync_success_found = False
     first_add_points_moment_time = datetime.max
-    with open(log, 'r') as f:
-        while True:
-            line = f.readline()
-            if not line:
-                break
-            # process line by line
-            if sync_success_found:
-                if touch_start_regexp(line):
-                    log_drawing_moments.append(Moment(
-                        source=phone_type,
-                        name='user touches screen',
-                        time=extract_timestamp(line, year=YEAR),
-                        raw_data=line,
-                        action_from=phone_type,
-                        action_to=phone_type,
-                    ))
-                elif stroke_was_added_regexp(line):
-                    stroke_id = extract_stroke_id(line)
-                    log_drawing_moments.append(Moment(
-                        source=phone_type,
-                        name='add a stroke',
-                        time=extract_timestamp(line, year=YEAR),
-                        raw_data=line,
-                        metadata={'stroke_id': stroke_id},
-                        action_from=phone_type,
-                        action_to=phone_type,
-                    ))
-                elif add_points_to_stroke_regexp(line):
-                    add_points_moment = Moment(
-                        source=phone_type,
-                        name='add points to stroke',
-                        time=extract_timestamp(line, year=YEAR),
-                        raw_data=line,
-                        action_from=phone_type,
-                        action_to=phone_type,
-                    )
-                    if first_add_points_moment_time == datetime.max:
-                        first_add_points_moment_time = add_points_moment.time
-                    log_drawing_moments.append(add_points_moment)
-                elif cloud_finish_processing_regexp(line):
-                    log_drawing_moments.append(Moment(
-                        source=phone_type,
-                        name='notified by finish of cloud processing',
-                        time=extract_timestamp(line, year=YEAR),
-                        raw_data=line,
-                        action_from=phone_type,
-                        action_to=phone_type,
-                    ))
-                elif on_line_changed_regexp(line) or on_line_added_regexp(line):
-                    stroke_id = extract_stroke_id(line)
-                    log_drawing_moments.append(Moment(
-                        source=phone_type,
-                        name='receive point updates',
-                        time=extract_timestamp(line, year=YEAR),
-                        raw_data=line,
-                        metadata={'stroke_id': stroke_id},
-                        action_from=phone_type,
-                        action_to=phone_type,
-                    ))
-                elif finish_rendering_regexp(line):
-                    log_drawing_moments.append(Moment(
-                        source=phone_type,
-                        name='finish rendering',
-                        time=extract_timestamp(line, year=YEAR),
-                        raw_data=line,
-                        action_from=phone_type,
-                        action_to=phone_type,
-                    ))
-                else:
-                    continue  # Messages that we don't care.
-
-            # Synchronization-related log messages.
-            else:
-                if sync_start_regexp(line) or sync_success_regexp(line):
-                    if sync_start_regexp(line):
-                        sync_event_name = "sync start"
-                    # elif sync_failed_regexp(line):
-                    #    sync_event_name = "sync failed"
-                    #    if log_sync_moments[-1].name != "sync start":
-                    #        raise Exception("No corresponding sync message")
-                    else:
-                        sync_event_name = "sync success"
-                        sync_success_found = True
-                        if log_sync_moments[-1].name != "sync start":
-                            raise Exception("No corresponding sync message")
-                    log_sync_moments.append(Moment(
-                        source=phone_type,
-                        name=sync_event_name,
-                        time=extract_timestamp(line, year=YEAR),
-                        raw_data=line,
-                        action_from=phone_type,
-                        action_to=phone_type,
-                    ))
-                continue
-
-        # Error checking
-        if not log_sync_moments:
-            raise RuntimeError("Missing sync start or end message.")
+    sync_moment_names = set(LOG_SYNC_EVENTS.values())
+    for moment in iter_log_moments(log, phone_type, jobs=jobs):
+        if moment.name in sync_moment_names:
+            log_sync_moments.append(moment)
+            continue
+        if moment.name == 'add points to stroke' and first_add_points_moment_time == datetime.max:
+            first_add_points_moment_time = moment.time
+        log_drawing_moments.append(moment)
 
     return {"log_drawing_moments": log_drawing_moments,
             "log_sync_moments": log_sync_moments,
             "first_add_points_moment_time": first_add_points_moment_time}
 
 
-def get_phone_ip(pcap, ip_version_is_six: bool):
-    # Get phone IP
-    pyshark_filters = []
-    pyshark_filters.append('tcp.flags.syn == 1')
-    ip_filter = "ipv6" if ip_version_is_six else "ip"
-    pyshark_filters.append(ip_filter)
-    syn_filter = ' && '.join(pyshark_filters)
-    syn_pkts = pyshark.FileCapture(pcap, display_filter=syn_filter)
-    for syn_pkt in syn_pkts:
-        phone_ip = get_ip(syn_pkt, type='src')
-        break
+def get_phone_ip(capture: CaptureProbe, ip_version_is_six: bool):
+    # Get phone IP: the source of the first SYN packet.
+    return capture.get_phone_ip(ip_version_is_six)
 
-    return phone_ip
 
-
-def get_firebase_database_ip(host_pcap, resolver_pcap, host_phone_ip, resolver_phone_ip, host_first_add_points_time,
-                             resolver_first_add_points_time):
+def get_firebase_database_ip(host_capture: CaptureProbe, resolver_capture: CaptureProbe, host_phone_ip,
+                             resolver_phone_ip, host_first_add_points_time, resolver_first_add_points_time):
     if host_first_add_points_time < resolver_first_add_points_time:
         first_add_points_moment_time = host_first_add_points_time
-        pcap = host_pcap
+        capture = host_capture
         phone_ip = host_phone_ip
     else:
         first_add_points_moment_time = resolver_first_add_points_time
-        pcap = resolver_pcap
+        capture = resolver_capture
         phone_ip = resolver_phone_ip
 
     # Error checking
     if first_add_points_moment_time == datetime.max:
         raise Exception("No valid 1a start found")
 
-    pyshark_filters = []
-    pyshark_filters.append('frame.time >= "{st}"'.format(st=first_add_points_moment_time.strftime(DATETIME_FORMAT)))
-    pyshark_filters.append('tcp')
-    display_filter = ' && '.join(pyshark_filters)
-    pkts = pyshark.FileCapture(pcap, display_filter=display_filter)
-
     # Assume the first packet sent by the phone is to the firebase database.
-    for pkt in pkts:
-        src_ip = get_ip(pkt, type='src')
-        if src_ip == phone_ip:
-            database_ip = get_ip(pkt, type='dst')
-            break
-    return database_ip
+    return capture.get_first_dst_ip(phone_ip, first_add_points_moment_time)
 
 
 def parse_pcap(
-        pcap,
-        e2e_filter: str,
+        table: PacketTable,
+        e2e_mask: np.ndarray,
         phone_ip: str,
         database_ip: str,
         phone_type: str,
         arcore_ip_set
 ):
-    # Categorize all the packets.
+    """
+    Categorize the packets of the e2e time frame into moments.
+    Args:
+        table: packets of the capture, see CaptureProbe.
+        e2e_mask: rows of the e2e time frame, see CaptureProbe.get_e2e_mask.
+    """
+    # Push all IP addresses to a set (for debugging purposes)
+    ip_set = table.get_ips(table.packets['src'][e2e_mask]) | table.get_ips(table.packets['dst'][e2e_mask])
+
+    large_data_mask = e2e_mask & table.get_data_mask() & (table.packets['length'] > 100)
+    to_phone_mask = table.get_ip_mask('dst', phone_ip)
+    # Each packet goes to the first category it matches.
+    send_data_mask = large_data_mask & table.get_ip_mask('src', phone_ip) & table.get_ip_mask('dst', database_ip)
+    receive_ack_mask = (e2e_mask & table.get_ack_mask() & table.get_ip_mask('src', database_ip) & to_phone_mask
+                        & ~send_data_mask)
+    receive_data_mask = (large_data_mask & table.get_ip_mask('src', database_ip) & to_phone_mask
+                         & ~send_data_mask & ~receive_ack_mask)
+    receive_slam_mask = (large_data_mask & table.get_ip_mask('src', arcore_ip_set) & to_phone_mask
+                         & ~send_data_mask & ~receive_ack_mask & ~receive_data_mask)
+
+    # Drawing moments. i.e., traffic from/to firebase database.
     drawing_moments = []
-    sync_moments = []
-    ip_set = set()
-    cap_e2e = pyshark.FileCapture(pcap, display_filter=e2e_filter)
-    for pkt in cap_e2e:
-        # Push all IP addresses to a set (for debugging purposes)
-        src_ip = get_ip(pkt, type='src')
-        dst_ip = get_ip(pkt, type='dst')
-        ip_set.add(src_ip)
-        ip_set.add(dst_ip)
-
-        # Drawing moments. i.e., traffic from/to firebase database.
-        if is_data_pkt(pkt, min_size=100, src=phone_ip, dst=database_ip):
-            drawing_moments.append(Moment(
-                source=phone_type,
-                name='send data pkt to cloud',
-                time=get_timestamp(pkt),
-                raw_data=pkt,
-                metadata=create_essential_metadata(pkt, type='data'),
-                action_from=phone_type,
-                action_to='cloud',
-            ))
-        elif is_ack_pkt(pkt, src=database_ip, dst=phone_ip):
-            drawing_moments.append(Moment(
-                source=phone_type,
-                name='receive ack pkt from cloud',
-                time=get_timestamp(pkt),
-                raw_data=pkt,
-                metadata=create_essential_metadata(pkt, type='ack'),
-                action_from='cloud',
-                action_to=phone_type,
-            ))
-        elif is_data_pkt(pkt, min_size=100, src=database_ip, dst=phone_ip):
-            drawing_moments.append(Moment(
-                source=phone_type,
-                name='receive data pkt from cloud',
-                time=get_timestamp(pkt),
-                raw_data=pkt,
-                metadata=create_essential_metadata(pkt, type='data'),
-                action_from='cloud',
-                action_to=phone_type,
-            ))
-        elif is_data_pkt(pkt, min_size=100, src=arcore_ip_set, dst=phone_ip):
-            sync_moments.append(Moment(
-                source=phone_type,
-                name='receive SLAM pkt from cloud',
-                time=get_timestamp(pkt),
-                raw_data=pkt,
-                metadata=create_essential_metadata(pkt, type='data'),
-                action_from='cloud',
-                action_to=phone_type,
-            ))
+    for row in np.flatnonzero(send_data_mask | receive_ack_mask | receive_data_mask):
+        if send_data_mask[row]:
+            name, type, action_from, action_to = 'send data pkt to cloud', 'data', phone_type, 'cloud'
+        elif receive_ack_mask[row]:
+            name, type, action_from, action_to = 'receive ack pkt from cloud', 'ack', 'cloud', phone_type
         else:
-            continue
-    cap_e2e.close()
+            name, type, action_from, action_to = 'receive data pkt from cloud', 'data', 'cloud', phone_type
+        drawing_moments.append(Moment(
+            source=phone_type,
+            name=name,
+            time=table.get_time(row),
+            raw_data=table.get_raw_data(row),
+            metadata=create_essential_metadata(table, row, type=type),
+            action_from=action_from,
+            action_to=action_to,
+        ))
+
+    sync_moments = []
+    for row in np.flatnonzero(receive_slam_mask):
+        sync_moments.append(Moment(
+            source=phone_type,
+            name='receive SLAM pkt from cloud',
+            time=table.get_time(row),
+            raw_data=table.get_raw_data(row),
+            metadata=create_essential_metadata(table, row, type='data'),
+            action_from='cloud',
+            action_to=phone_type,
+        ))
     return {
         'phone_ip': phone_ip,
         'database_ip': database_ip,
@@ -300,30 +245,27 @@ def parse_pcap(
     }
 
 
-def is_ip_version_six(pcap_path) -> bool:
+def is_ip_version_six(capture: CaptureProbe) -> bool:
     """
     Check if the IP used by Just-a-Line is IPv6 or not.
     This is done by checking all the syn packets. If we don't have any IPv6 SYN,
     then the app only used IPv4 (This happens in WiFi environment).
     Otherwise, it uses IPv6 (This happens in cellular environment).
     Args:
-        pcap_path: path of the pcap file.
+        capture: probe of the pcap file.
 
     Returns:
         ip_version_is_six: a boolean indicates if the IP version is 6.
     """
-    syn_pkts = pyshark.FileCapture(pcap_path, display_filter='tcp.flags.syn==1 && ipv6')
-    for _ in syn_pkts:
-        return True
-    return False
+    return capture.is_ip_version_six()
 
 
-def get_arcore_addresses(pcap_path, first_sync_start_ts, sync_end_ts, last_rendering_ts, phone_ip, database_ip,
-                         ip_ver_is_six):
+def get_arcore_addresses(capture: CaptureProbe, first_sync_start_ts, sync_end_ts, last_rendering_ts, phone_ip,
+                         database_ip, ip_ver_is_six):
     """
     Find arcore servers used by the host/resolver.
     Args:
-        pcap_path: path to the host's or the resolver's pcap file.
+        capture: probe of the host's or the resolver's pcap file.
         first_sync_start_ts: synchronization start timestamp.
         sync_end_ts: synchronization end timestamp.
         last_rendering_ts: timestamp of the last 2d phase.
@@ -334,39 +276,15 @@ def get_arcore_addresses(pcap_path, first_sync_start_ts, sync_end_ts, last_rende
         A set containing ARCore servers.
     """
 
-    # Apply a filter to get SYN-ACK packets between the start and the end of synchronization.
-    syn_ack_filter = "tcp.flags.syn == 1 && tcp.flags.ack == 1"
-    first_sync_start_ts_filter = 'frame.time >= "{st}"'.format(st=first_sync_start_ts.strftime(DATETIME_FORMAT))
-    sync_end_ts_filter = 'frame.time <= "{et}"'.format(et=sync_end_ts.strftime(DATETIME_FORMAT))
-    ip_filter = 'ipv6' if ip_ver_is_six else 'ip'
-    pyshark_filter = [syn_ack_filter, first_sync_start_ts_filter, sync_end_ts_filter, ip_filter]
-    display_filter = " && ".join(pyshark_filter)
-    print("get_arcore_addresses: " + display_filter)
-    syn_ack_packets = pyshark.FileCapture(pcap_path, display_filter=display_filter)
-
-    # Check each SYN-ACK packet.
-    possible_arcore_syn_ack_ip_set = set()
-    for syn_ack_packet in syn_ack_packets:
-        src_ip = get_ip(syn_ack_packet, 'src')
-        possible_arcore_syn_ack_ip_set.add(src_ip)
+    # Get the sources of SYN-ACK packets between the start and the end of synchronization.
+    possible_arcore_syn_ack_ip_set = capture.get_syn_ack_src_ips(first_sync_start_ts, sync_end_ts, ip_ver_is_six)
 
     # In some cases, Just-a-Line can have a very long synchronization (a few minutes), during which the phone would
     # establish a connection with servers that are unrelated to the app.
     # So we also check the Fin packets that are generated after the last 2d phase.
     # The intersection between possible_arcore_syn_ack_ip_set and possible_arcore_fin_ip_set is very likely to be
     # the ARCore servers.
-    fin_filter = "tcp.flags.fin == 1"
-    last_rendering_ts_filter = 'frame.time >= "{et}"'.format(et=last_rendering_ts.strftime(DATETIME_FORMAT))
-    src_ip_phone_filter = ('ipv6' if ip_ver_is_six else 'ip') + ".src == " + phone_ip
-    exclude_database_ip_filter = ('ipv6' if ip_ver_is_six else 'ip') + ".dst != " + database_ip
-    pyshark_filter = [fin_filter, last_rendering_ts_filter, exclude_database_ip_filter, src_ip_phone_filter]
-    display_filter = " && ".join(pyshark_filter)
-    fin_packets = pyshark.FileCapture(pcap_path, display_filter=display_filter)
-    # Check each Fin packet.
-    possible_arcore_fin_ip_set = set()
-    for fin_packet in fin_packets:
-        dst_ip = get_ip(fin_packet, 'dst')
-        possible_arcore_fin_ip_set.add(dst_ip)
+    possible_arcore_fin_ip_set = capture.get_fin_dst_ips(last_rendering_ts, phone_ip, database_ip)
 
     if len(possible_arcore_fin_ip_set) > 0:
         arcore_ip_set = possible_arcore_syn_ack_ip_set.intersection(possible_arcore_fin_ip_set)
@@ -389,99 +307,147 @@ def get_arcore_addresses(pcap_path, first_sync_start_ts, sync_end_ts, last_rende
     return arcore_ip_set
 
 
-def parse_log_and_pcap(host_app_log, resolver_app_log, host_pcap, resolver_pcap) -> Dict[str, Any]:
+def parse_side(app_log, pcap, phone_type: str, pcap_backend: str, journal: RunJournal = None,
+               log_jobs: int = None) -> Dict[str, Any]:
+    """
+    The work of parse_log_and_pcap that only needs the files of one phone.
     """
-    Get necessary information, including moments, from logs by regexp matching and pcap by pyshark.
+    with journal_stage(journal, 'log parse', side=phone_type):
+        log_info_map = parse_log(app_log, phone_type, jobs=get_log_jobs(app_log, log_jobs))
+    with journal_stage(journal, 'pcap probe', side=phone_type):
+        capture = probe_capture(pcap, backend=pcap_backend)
+    return {
+        'log_info_map': log_info_map,
+        'capture': capture,
+    }
+
+
+def parse_side_pcap(capture: CaptureProbe, phone_type: str, phone_ip, database_ip, sync_start_ts, sync_end_ts,
+                    last_rendering_ts, e2e_start_time, e2e_end_time, ip_version_is_six,
+                    journal: RunJournal = None) -> Dict[str, Any]:
+    """
+    The work of parse_log_and_pcap on one phone's capture once the database IP and the e2e time frame are known.
+    """
+    with journal_stage(journal, 'pcap parse', side=phone_type):
+        # Find ARCore IP addresses used by the phone.
+        arcore_ip_set = get_arcore_addresses(capture, sync_start_ts, sync_end_ts, last_rendering_ts, phone_ip,
+                                             database_ip, ip_version_is_six)
+        # pcap trace moments, within the e2e time frame.
+        pcap_info = parse_pcap(
+            capture.table,
+            capture.get_e2e_mask(e2e_start_time, e2e_end_time, ip_version_is_six),
+            phone_ip,
+            database_ip,
+            phone_type,
+            arcore_ip_set,
+        )
+    return {
+        'arcore_ip_set': arcore_ip_set,
+        'pcap_info': pcap_info,
+    }
+
+
+def parse_log_and_pcap(host_app_log, resolver_app_log, host_pcap, resolver_pcap, pcap_backend: str = 'native',
+                       use_cache: bool = True, journal: RunJournal = None, log_jobs: int = None) -> Dict[str, Any]:
+    """
+    Same as compute_log_and_pcap, but the result is cached on disk (see ResultCache), keyed by the content
+    of the four files, the pcap backend, PARSER_VERSION and TABLE_VERSION (the result holds moments built
+    from the packet table).
+    A cache hit is journaled as a 'parse' stage with status 'cached', the parsing stages are not run.
+    log_jobs only changes how fast the logs are parsed, not the result, and is not part of the key.
+    """
+    if not use_cache:
+        return compute_log_and_pcap(host_app_log, resolver_app_log, host_pcap, resolver_pcap, pcap_backend, journal,
+                                    log_jobs)
+    cache = ResultCache()
+    key = cache.get_key('parse_log_and_pcap', PARSER_VERSION,
+                        [host_app_log, resolver_app_log, host_pcap, resolver_pcap], pcap_backend, TABLE_VERSION)
+    with journal_stage(journal, 'parse') as details:
+        info_map = cache.get(key)
+        if info_map is not None:
+            details['status'] = 'cached'
+    if info_map is None:
+        info_map = compute_log_and_pcap(host_app_log, resolver_app_log, host_pcap, resolver_pcap, pcap_backend,
+                                        journal, log_jobs)
+        try:
+            cache.put(key, info_map)
+        except OSError as e:
+            print('Cannot cache the result of parse_log_and_pcap ({})'.format(e))
+    return info_map
+
+
+def compute_log_and_pcap(host_app_log, resolver_app_log, host_pcap, resolver_pcap,
+                         pcap_backend: str = 'native', journal: RunJournal = None,
+                         log_jobs: int = None) -> Dict[str, Any]:
+    """
+    Get necessary information, including moments, from logs by regexp matching and from pcaps.
+    Each pcap is dissected only once (see probe_capture), all the packet queries below run on the probe.
+    The host and the resolver are processed concurrently, they only meet to agree on the IP version,
+    the firebase database IP and the e2e time frame.
     :param host_app_log: path to the host's log file.
     :param resolver_app_log: path to the resolver's log file.
     :param host_pcap: path to the host's pcap file
     :param resolver_pcap: path to the resolver's pcap file
+    :param pcap_backend: how pcaps are decoded, see src.utils.pcap.iter_packets
+    :param journal: where to journal the stages of the run, if any
+    :param log_jobs: number of processes scanning each log, see src.utils.logcat.get_log_jobs
     :return: a map
     """
-
-    def get_e2e_filter(first_touch_screen_moment_time, last_finish_rendering_moment_time, ip_version_is_six: bool):
-        pyshark_filters = []
-        pyshark_filters.append(
-            'frame.time >= "{st}"'.format(st=first_touch_screen_moment_time.strftime(DATETIME_FORMAT)))
-        pyshark_filters.append(
-            'frame.time <= "{et}"'.format(et=last_finish_rendering_moment_time.strftime(DATETIME_FORMAT)))
-        ip_filter = "ipv6" if ip_version_is_six else "ip"
-        tls_filter = "!tls.handshake"
-        pyshark_filters.append('tcp')
-        pyshark_filters.append(ip_filter)
-        pyshark_filters.append(tls_filter)
-        e2e_filter = ' && '.join(pyshark_filters)
-        return e2e_filter
-
-    # host app moments
-    host_log_info_map = parse_log(host_app_log, "host")
-    host_log_drawing_moments = host_log_info_map['log_drawing_moments']
-    host_log_sync_moments = host_log_info_map['log_sync_moments']
-
-    # resolver app moments
-    resolver_log_info_map = parse_log(resolver_app_log, "resolver")
-    resolver_log_drawing_moments = resolver_log_info_map['log_drawing_moments']
-    resolver_log_sync_moments = host_log_info_map['log_sync_moments']
-
-    # Check if the host used IPv6
-    ip_version_is_six = is_ip_version_six(host_pcap)
-
-    # Get phone IP
-    host_phone_ip = get_phone_ip(host_pcap, ip_version_is_six)
-    resolver_phone_ip = get_phone_ip(resolver_pcap, ip_version_is_six)
-
-    # Get firebase database ip
-    database_ip = get_firebase_database_ip(host_pcap, resolver_pcap, host_phone_ip, resolver_phone_ip,
-                                           host_log_info_map["first_add_points_moment_time"],
-                                           resolver_log_info_map["first_add_points_moment_time"])
-
-    # host pcap trace moments, within e2e time duration
-    # Get filters
-    first_touch_screen_moment_time = min(host_log_drawing_moments[0].time, resolver_log_drawing_moments[0].time)
-    last_finish_rendering_moment_time = max(host_log_drawing_moments[-1].time, resolver_log_drawing_moments[-1].time)
-    e2e_filter = get_e2e_filter(first_touch_screen_moment_time, last_finish_rendering_moment_time, ip_version_is_six)
-
-    # Find ARCore IP addresses used by the host.
-    host_arcore_ip_set = get_arcore_addresses(host_pcap,
-                                              # first sync start time.
-                                              host_log_sync_moments[0].time,
-                                              # sync end time.
-                                              host_log_sync_moments[-1].time,
-                                              last_finish_rendering_moment_time,
-                                              host_phone_ip,
-                                              database_ip,
-                                              ip_version_is_six)
-
-    # Find ARCore IP addresses used by the resolver.
-    resolver_arcore_ip_set = get_arcore_addresses(resolver_pcap,
-                                                  # first sync start time.
-                                                  host_log_sync_moments[0].time,
-                                                  # sync end time.
-                                                  host_log_sync_moments[-1].time,
-                                                  last_finish_rendering_moment_time,
-                                                  resolver_phone_ip,
-                                                  database_ip,
-                                                  ip_version_is_six)
-
-    # host pcap trace moments, within the e2e time frame.
-    host_pcap_info = parse_pcap(
-        host_pcap,
-        e2e_filter,
-        host_phone_ip,
-        database_ip,
-        "host",  # phone type
-        host_arcore_ip_set,
-    )
-
-    # resolver pcap trace moments, within the e2e time frame.
-    resolver_pcap_info = parse_pcap(
-        resolver_pcap,
-        e2e_filter,
-        resolver_phone_ip,
-        database_ip,
-        "resolver",  # phone type
-        resolver_arcore_ip_set,
-    )
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # app moments and dissected pcaps
+        host_future = executor.submit(parse_side, host_app_log, host_pcap, "host", pcap_backend, journal, log_jobs)
+        resolver_future = executor.submit(parse_side, resolver_app_log, resolver_pcap, "resolver", pcap_backend,
+                                          journal, log_jobs)
+
+        # Join: the IP version, the phone IPs and the database IP need both sides
+        host_side = host_future.result()
+        resolver_side = resolver_future.result()
+        host_log_info_map = host_side['log_info_map']
+        host_log_drawing_moments = host_log_info_map['log_drawing_moments']
+        host_log_sync_moments = host_log_info_map['log_sync_moments']
+        host_capture = host_side['capture']
+        resolver_log_info_map = resolver_side['log_info_map']
+        resolver_log_drawing_moments = resolver_log_info_map['log_drawing_moments']
+        resolver_log_sync_moments = host_log_info_map['log_sync_moments']
+        resolver_capture = resolver_side['capture']
+
+        # Check if the host used IPv6
+        ip_version_is_six = is_ip_version_six(host_capture)
+
+        # Get phone IP
+        host_phone_ip = get_phone_ip(host_capture, ip_version_is_six)
+        resolver_phone_ip = get_phone_ip(resolver_capture, ip_version_is_six)
+
+        # Get firebase database ip
+        database_ip = get_firebase_database_ip(host_capture, resolver_capture, host_phone_ip, resolver_phone_ip,
+                                               host_log_info_map["first_add_points_moment_time"],
+                                               resolver_log_info_map["first_add_points_moment_time"])
+
+        # e2e time duration
+        first_touch_screen_moment_time = min(host_log_drawing_moments[0].time, resolver_log_drawing_moments[0].time)
+        last_finish_rendering_moment_time = max(host_log_drawing_moments[-1].time,
+                                                resolver_log_drawing_moments[-1].time)
+
+        # ARCore addresses and pcap trace moments of each phone.
+        # Both phones use the host's sync time frame.
+        side_pcap_args = (database_ip,
+                          host_log_sync_moments[0].time,  # first sync start time.
+                          host_log_sync_moments[-1].time,  # sync end time.
+                          last_finish_rendering_moment_time,
+                          first_touch_screen_moment_time,
+                          last_finish_rendering_moment_time,
+                          ip_version_is_six,
+                          journal)
+        host_future = executor.submit(parse_side_pcap, host_capture, "host", host_phone_ip, *side_pcap_args)
+        resolver_future = executor.submit(parse_side_pcap, resolver_capture, "resolver", resolver_phone_ip,
+                                          *side_pcap_args)
+        host_side_pcap = host_future.result()
+        resolver_side_pcap = resolver_future.result()
+
+    host_arcore_ip_set = host_side_pcap['arcore_ip_set']
+    host_pcap_info = host_side_pcap['pcap_info']
+    resolver_arcore_ip_set = resolver_side_pcap['arcore_ip_set']
+    resolver_pcap_info = resolver_side_pcap['pcap_info']
 
     host_runtime_info = RuntimeInfo(log_drawing_moments=host_log_drawing_moments,
                                     log_sync_moments=host_log_sync_moments,
@@ -507,6 +473,52 @@ def parse_log_and_pcap(host_app_log, resolver_app_log, host_pcap, resolver_pcap)
     }
 
 
+def get_specified_ip_masks(
+        table: PacketTable,
+        start_time: datetime,
+        end_time: datetime,
+        include_ip_set: Set[str] = None,
+        exclude_ip_set: Set[str] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Select the data packets (TLS application data, longer than 100 bytes) and the ack packets exchanged
+    with the IPs in include_ip_set and not with those in exclude_ip_set, within the time frame.
+    """
+    mask = table.get_window_mask(start_time, end_time)
+    if exclude_ip_set:
+        mask &= ~(table.get_ip_mask('src', exclude_ip_set) | table.get_ip_mask('dst', exclude_ip_set))
+    if include_ip_set:
+        mask &= table.get_ip_mask('src', include_ip_set) | table.get_ip_mask('dst', include_ip_set)
+    data_mask = mask & table.get_data_mask() & (table.packets['length'] > 100)
+    ack_mask = mask & table.get_ack_mask() & ~data_mask
+    return {
+        'data_mask': data_mask,
+        'ack_mask': ack_mask,
+    }
+
+
+def iter_packet_moments(table: PacketTable, source: str, data_mask: np.ndarray,
+                        ack_mask: np.ndarray) -> Iterator[Moment]:
+    """
+    A moment per data or ack packet of the masks, in capture order.
+    """
+    for row in np.flatnonzero(data_mask | ack_mask):
+        type = 'data' if data_mask[row] else 'ack'
+        yield Moment(
+            source=source,
+            name='TCP data pkt' if type == 'data' else 'TCP ack pkt',
+            time=table.get_time(row),
+            raw_data=table.get_raw_data(row),
+            metadata=create_essential_metadata(table, row, type=type),
+            action_from=table.get_ip(table.packets['src'][row]),
+            action_to=table.get_ip(table.packets['dst'][row]),
+        )
+
+
+def create_packet_moments(table: PacketTable, source: str, data_mask: np.ndarray, ack_mask: np.ndarray) -> List[Moment]:
+    return list(iter_packet_moments(table, source, data_mask, ack_mask))
+
+
 def prepare_moment_for_specified_ip_list(
         pcap_path: str,
         source: str,
@@ -514,49 +526,70 @@ def prepare_moment_for_specified_ip_list(
         end_time: datetime,
         include_ip_set: Set[str] = None,
         exclude_ip_set: Set[str] = None,
+        backend: str = 'native',
 ):
-    pyshark_filters = []
-    pyshark_filters.append('frame.time >= "{st}"'.format(st=start_time.strftime(DATETIME_FORMAT)))
-    pyshark_filters.append('frame.time <= "{et}"'.format(et=end_time.strftime(DATETIME_FORMAT)))
-    pyshark_filters.append('tcp')
-    display_filter = ' && '.join(pyshark_filters)
-    cap_e2e = pyshark.FileCapture(pcap_path, display_filter=display_filter)
+    table = probe_capture(pcap_path, backend=backend).table
+    masks = get_specified_ip_masks(table, start_time, end_time, include_ip_set, exclude_ip_set)
+    return {
+        'moments': create_packet_moments(table, source, masks['data_mask'], masks['ack_mask']),
+    }
 
-    moments = []
-    for pkt in cap_e2e:
-        src_ip = get_ip(pkt, type='src')
-        dst_ip = get_ip(pkt, type='dst')
 
-        if exclude_ip_set:
-            if (src_ip in exclude_ip_set) or (dst_ip in exclude_ip_set):
-                continue
-        if include_ip_set:
-            if (src_ip not in include_ip_set) and (dst_ip not in include_ip_set):
-                continue
+def prepare_other_ip_summary_and_moments(
+        host_pcap: str,
+        resolver_pcap: str,
+        e2e_start_time: datetime,
+        e2e_end_time: datetime,
+        database_ip: str,
+        with_moments: bool = True,
+        pcap_backend: str = 'native',
+):
+    """
+    Summarize the data and ack packets exchanged with any IP other than the firebase database during e2e.
+    Args:
+        with_moments: also create a Moment per packet. The summary alone is computed from the packet tables.
+        pcap_backend: how pcaps are decoded, see src.utils.pcap.iter_packets.
+
+    Returns:
+        'moments' (empty without with_moments) and 'transmission_summary': the packet count, the total size,
+        the first/last time and the SYN/FIN/RST counts from each IP to each other IP, ordered by first time.
+    """
+    moments = []
+    direction_summaries = {}
+    for source, pcap_path in (('host', host_pcap), ('resolver', resolver_pcap)):
+        table = probe_capture(pcap_path, backend=pcap_backend).table
+        masks = get_specified_ip_masks(table, e2e_start_time, e2e_end_time, exclude_ip_set={database_ip})
+        if with_moments:
+            moments.extend(create_packet_moments(table, source, masks['data_mask'], masks['ack_mask']))
+        for summary in table.summarize_directions(masks['data_mask'] | masks['ack_mask']).tolist():
+            src, dst, pkt_count, total_size, first_ns, last_ns, syn_count, fin_count, rst_count = summary
+            key = (table.get_ip(src), table.get_ip(dst))
+            if key in direction_summaries:
+                # Seen by both phones
+                merged = direction_summaries[key]
+                pkt_count += merged['pkt_count']
+                total_size += merged['total_size']
+                first_ns = min(first_ns, merged['first_ns'])
+                last_ns = max(last_ns, merged['last_ns'])
+                syn_count += merged['syn_count']
+                fin_count += merged['fin_count']
+                rst_count += merged['rst_count']
+            direction_summaries[key] = {
+                'src_ip': key[0],
+                'dst_ip': key[1],
+                'pkt_count': pkt_count,
+                'total_size': total_size,
+                'first_ns': first_ns,
+                'last_ns': last_ns,
+                'syn_count': syn_count,
+                'fin_count': fin_count,
+                'rst_count': rst_count,
+            }
+    moments.sort(key=lambda x: x.time)
 
-        if is_data_pkt(pkt, min_size=100):
-            moments.append(Moment(
-                source=source,
-                name='TCP data pkt',
-                time=get_timestamp(pkt),
-                raw_data=pkt,
-                metadata=create_essential_metadata(pkt, type='data'),
-                action_from=src_ip,
-                action_to=dst_ip,
-            ))
-        elif is_ack_pkt(pkt):
-            moments.append(Moment(
-                source=source,
-                name='TCP ack pkt',
-                time=get_timestamp(pkt),
-                raw_data=pkt,
-                metadata=create_essential_metadata(pkt, type='ack'),
-                action_from=src_ip,
-                action_to=dst_ip,
-            ))
-    cap_e2e.close()
     return {
         'moments': moments,
+        'transmission_summary': sorted(direction_summaries.values(), key=lambda x: x['first_ns']),
     }
 
 
@@ -565,6 +598,14 @@ class ProcessAppLogUnitTest(unittest.TestCase):
         line = '04-07 15:34:34.421 10456 10592 D ar_activity: [Update ARCore frame time=2023-04-07 15:34:34.421]'
         self.assertEqual('2023-04-07 15:34:34.421', extract_timestamp(line, year='2023'))
 
+    def test_extract_timestamp_layouts(self):
+        line = '04-07 15:34:34.421 10456 10592 D ar_activity: [Update ARCore frame time=2023-04-07 15:34:34.421]'
+        self.assertEqual(datetime(2023, 4, 7, 15, 34, 34, 421000), extract_timestamp(line, year='2023'))
+        # Not at column 0
+        self.assertEqual(datetime(2023, 4, 7, 15, 34, 35, 7000),
+                         extract_timestamp('[ 04-07 15:34:35.007 10456] D ar_activity', year='2023'))
+        self.assertIsNone(extract_timestamp('--------- beginning of main', year='2023'))
+
     def test_match_prefix(self):
         line = '04-07 15:16:47.171  6297  6297 D ar_activity: [[1a start] touch screen time=2023-04-07 15:16:47.171]'
         self.assertEqual(True, has_prefix(line, r'\[\[1a start\] touch screen'))
@@ -0,0 +1,96 @@
+from datetime import datetime
+from typing import Set, Union
+
+import numpy as np
+
+from src.utils.packet_table import PacketTable, build_packet_table, load_packet_table
+from src.utils.pcap import iter_packets
+from src.utils.pcap_reader import TCP_ACK, TCP_FIN, TCP_SYN
+
+
+class CaptureProbe:
+    """
+    All the TCP packets of a capture, dissected in a single pass into a PacketTable.
+    The queries below replace the separate display-filtered captures we used to open
+    for the IP version, the phone IP, the firebase database IP, the ARCore addresses
+    and the e2e packets.
+    """
+    pcap_path: str
+    table: PacketTable
+
+    def __init__(self, **kwargs):
+        self.pcap_path = kwargs.get("pcap_path")
+        self.table = kwargs.get("table") or PacketTable()
+
+    def is_ip_version_six(self) -> bool:
+        """
+        Same as `tcp.flags.syn==1 && ipv6`: any IPv6 SYN means the app used IPv6.
+        """
+        return bool(np.any(self.table.get_flag_mask(TCP_SYN) & self.table.get_ip_version_mask(True)))
+
+    def get_phone_ip(self, ip_version_is_six: bool) -> Union[str, None]:
+        """
+        Source of the first SYN packet of the given IP version.
+        """
+        rows = np.flatnonzero(self.table.get_flag_mask(TCP_SYN) & self.table.get_ip_version_mask(ip_version_is_six))
+        if not len(rows):
+            return None
+        return self.table.get_ip(self.table.packets['src'][rows[0]])
+
+    def get_first_dst_ip(self, src_ip: str, start_time: datetime) -> Union[str, None]:
+        """
+        Destination of the first packet sent by `src_ip` at or after `start_time`.
+        """
+        rows = np.flatnonzero(self.table.get_window_mask(start_time) & self.table.get_ip_mask('src', src_ip))
+        if not len(rows):
+            return None
+        return self.table.get_ip(self.table.packets['dst'][rows[0]])
+
+    def get_syn_ack_src_ips(self, start_time: datetime, end_time: datetime, ip_version_is_six: bool) -> Set[str]:
+        mask = (self.table.get_flag_mask(TCP_SYN) & self.table.get_flag_mask(TCP_ACK)
+                & self.table.get_ip_version_mask(ip_version_is_six)
+                & self.table.get_window_mask(start_time, end_time))
+        return self.table.get_ips(self.table.packets['src'][mask])
+
+    def get_fin_dst_ips(self, start_time: datetime, src_ip: str, exclude_dst_ip: str) -> Set[str]:
+        mask = (self.table.get_flag_mask(TCP_FIN) & self.table.get_window_mask(start_time)
+                & self.table.get_ip_mask('src', src_ip) & ~self.table.get_ip_mask('dst', exclude_dst_ip))
+        return self.table.get_ips(self.table.packets['dst'][mask])
+
+    def get_e2e_mask(self, start_time: datetime, end_time: datetime, ip_version_is_six: bool) -> np.ndarray:
+        """
+        Same as `frame.time >= start && frame.time <= end && tcp && ip(v6) && !tls.handshake`.
+        """
+        return (self.table.get_window_mask(start_time, end_time)
+                & self.table.get_ip_version_mask(ip_version_is_six)
+                & ~self.table.get_tls_handshake_mask())
+
+    def get_message_mask(self, src_ips, dst_ips, start_time: datetime = None, end_time: datetime = None) -> np.ndarray:
+        """
+        Messages (see src.utils.messages) sent by one of src_ips to one of dst_ips, that start within the time frame.
+        Only the native backend assembles messages, the others match none.
+        Args:
+            src_ips, dst_ips: an IP or a collection of IPs.
+        """
+        return (self.table.get_message_window_mask(start_time, end_time)
+                & self.table.get_message_ip_mask('src', src_ips)
+                & self.table.get_message_ip_mask('dst', dst_ips))
+
+
+def probe_capture(pcap_path: str, backend: str = 'native') -> CaptureProbe:
+    """
+    Dissect the TCP packets of a pcap file once.
+    With the native backend the resulting table is cached next to the capture (see load_packet_table).
+    Args:
+        pcap_path: path of the pcap file.
+        backend: see src.utils.pcap.iter_packets.
+
+    Returns:
+        A CaptureProbe that answers all the per-capture queries of parse_log_and_pcap.
+    """
+    if backend == 'native':
+        table = load_packet_table(pcap_path)
+    else:
+        table = build_packet_table(iter_packets(pcap_path, backend=backend))
+        table.pcap_path = pcap_path
+    return CaptureProbe(pcap_path=pcap_path, table=table)
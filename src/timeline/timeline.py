@@ -1,19 +1,46 @@
-from src.timeline.moment import parse_log_and_pcap
+import heapq
+import unittest
+from datetime import datetime
+from typing import Iterable, Iterator
+
+from src.timeline.moment import Moment, parse_log_and_pcap
+
+
+def get_time(moment: Moment):
+    return moment.time
+
+
+def iter_time_ordered(moments: Iterable[Moment]) -> Iterable[Moment]:
+    """
+    Moments of a source in time order: a list is checked, and stably sorted only if it is not
+    (e.g. a packet captured with an earlier timestamp than the one before it); iterators must already be.
+    """
+    if not isinstance(moments, list):
+        return moments
+    if all(earlier.time <= later.time for earlier, later in zip(moments, moments[1:])):
+        return moments
+    return sorted(moments, key=get_time)
+
+
+def iter_timeline(*sources: Iterable[Moment]) -> Iterator[Moment]:
+    """
+    Merge the moments of several sources into one stream sorted by time, as they come.
+    Moments at the same time keep the order of the sources, then their order in their source,
+    so the result is the same as stably sorting the concatenation of the sources.
+    """
+    return heapq.merge(*[iter_time_ordered(moments) for moments in sources], key=get_time)
 
 
 def get_timeline(info_map):
-    timeline = []
     host_runtime_info_map = info_map.get("host")
     resolver_runtime_info_map = info_map.get("resolver")
-    # Combine all moments
-    timeline.extend(host_runtime_info_map.log_drawing_moments)
-    timeline.extend(resolver_runtime_info_map.log_drawing_moments)
-    timeline.extend(host_runtime_info_map.pcap_drawing_moments)
-    timeline.extend(resolver_runtime_info_map.pcap_drawing_moments)
-    # sort moments by time
-    timeline.sort(key=lambda x: x.time)
-
-    return timeline
+    # Combine all moments, sorted by time
+    return list(iter_timeline(
+        host_runtime_info_map.log_drawing_moments,
+        resolver_runtime_info_map.log_drawing_moments,
+        host_runtime_info_map.pcap_drawing_moments,
+        resolver_runtime_info_map.pcap_drawing_moments,
+    ))
 
 
 def prepare_timeline(host_app_log, resolver_app_log, host_pcap, resolver_pcap):
@@ -33,3 +60,19 @@ def prepare_timeline(host_app_log, resolver_app_log, host_pcap, resolver_pcap):
         'timeline': timeline,
         'info_map': info_map,
     }
+
+
+class TimelineUnitTest(unittest.TestCase):
+    def test_iter_timeline(self):
+        def moments(source, seconds):
+            return [Moment(source=source, name=str(index), time=datetime(2023, 4, 7, 15, 0, second))
+                    for index, second in enumerate(seconds)]
+
+        host_log = moments('host', [1, 3, 3, 7])
+        resolver_log = moments('resolver', [0, 3, 9])
+        # out of order capture timestamps
+        host_pcap = moments('host pcap', [2, 5, 4, 3])
+        sources = [host_log, iter(resolver_log), host_pcap]
+        expected = sorted(host_log + resolver_log + host_pcap, key=lambda moment: moment.time)
+        self.assertEqual([(moment.source, moment.name) for moment in expected],
+                         [(moment.source, moment.name) for moment in iter_timeline(*sources)])
@@ -0,0 +1,326 @@
+import glob
+import json
+import os
+import re
+import struct
+import tempfile
+import unittest
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.utils.manifest import get_file_fingerprint
+from src.utils.packet_table import get_table_path, read_packet_table
+from src.utils.pcap_reader import TCP_SYN, PcapReader, from_epoch_ns
+
+ROOT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DATASETS_PATH = os.path.join(ROOT_PATH, 'datasets')
+CATALOG_FILENAME = 'catalog.json'
+# Bump when the fields of RunRecord.files change, so that the catalog is rebuilt.
+CATALOG_VERSION = 2
+APP_LOG = 'static_log.logcat'
+PCAP = 'capture.pcap'
+EXP_NAME_PATTERN = re.compile(r'^(?P<tech>[^-]+)-(?P<condition>.+)-(?P<mode>line|point)$')
+RUN_NAME_PATTERN = re.compile(r'^run(?P<number>\d+)$')
+
+
+class RunRecord:
+    """
+    What we know about a run without opening its files again: e.g. 5g-static-line/run1 is
+    tech '5g', condition 'static', mode 'line', run_number 1.
+    files maps 'host_app_log', 'resolver_app_log', 'host_pcap' and 'resolver_pcap' to the fingerprint of the file
+    (see get_file_fingerprint) plus line_count for logs, and record_count, start_ns, end_ns (all the records) and
+    ip_version for pcaps; None if the file is missing.
+    """
+    name: str
+    tech: str
+    condition: str
+    mode: str
+    run_number: int
+    host_path: str
+    resolver_path: str
+    files: Dict[str, Union[Dict[str, Any], None]]
+
+    def __init__(self, **kwargs):
+        self.name = kwargs.get("name")
+        self.tech = kwargs.get("tech")
+        self.condition = kwargs.get("condition")
+        self.mode = kwargs.get("mode")
+        self.run_number = kwargs.get("run_number")
+        self.host_path = kwargs.get("host_path")
+        self.resolver_path = kwargs.get("resolver_path")
+        self.files = kwargs.get("files") or {}
+
+    @property
+    def exp_name(self) -> str:
+        return '{}-{}-{}'.format(self.tech, self.condition, self.mode)
+
+    @property
+    def is_complete(self) -> bool:
+        return all(self.files.get(name) is not None for name in get_run_inputs(self.host_path))
+
+    @property
+    def ip_version(self) -> Union[int, None]:
+        """
+        The IP version the app used, as decided by parse_log_and_pcap from the host's capture,
+        or None until that capture was decoded once (see describe_pcap).
+        """
+        host_pcap = self.files.get('host_pcap')
+        return host_pcap and host_pcap['ip_version']
+
+    def get_time_range(self) -> Tuple[Optional[datetime], Optional[datetime]]:
+        """
+        Returns:
+            The first and the last record time over both captures, or (None, None) if they have no record.
+        """
+        ranges = [(info['start_ns'], info['end_ns']) for name, info in self.files.items()
+                  if name.endswith('_pcap') and info is not None and info['record_count']]
+        if not ranges:
+            return None, None
+        return from_epoch_ns(min(start for start, _ in ranges)), from_epoch_ns(max(end for _, end in ranges))
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'tech': self.tech,
+            'condition': self.condition,
+            'mode': self.mode,
+            'run_number': self.run_number,
+            'host_path': os.path.relpath(self.host_path, ROOT_PATH),
+            'resolver_path': os.path.relpath(self.resolver_path, ROOT_PATH),
+            'files': self.files,
+        }
+
+
+def run_record_from_json(data: Dict[str, Any]) -> RunRecord:
+    return RunRecord(**{
+        **data,
+        'host_path': os.path.join(ROOT_PATH, data['host_path']),
+        'resolver_path': os.path.join(ROOT_PATH, data['resolver_path']),
+    })
+
+
+def get_run_inputs(host_path: str) -> Dict[str, str]:
+    """
+    Returns:
+        The paths of the four input files of the run of host_path, by name.
+    """
+    resolver_path = host_path.replace('/host/', '/resolver/')
+    return {
+        'host_app_log': os.path.join(host_path, APP_LOG),
+        'resolver_app_log': os.path.join(resolver_path, APP_LOG),
+        'host_pcap': os.path.join(host_path, PCAP),
+        'resolver_pcap': os.path.join(resolver_path, PCAP),
+    }
+
+
+def describe_log(path: str, previous: Dict[str, Any] = None) -> Union[Dict[str, Any], None]:
+    fingerprint = get_file_fingerprint(path, previous)
+    if fingerprint is None:
+        return None
+    if previous and previous['sha256'] == fingerprint['sha256']:
+        return {**previous, **fingerprint}
+    with open(path, 'rb') as f:
+        line_count = sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+    return {**fingerprint, 'line_count': line_count}
+
+
+def get_cached_ip_version(path: str) -> Union[int, None]:
+    """
+    Returns:
+        The IP version the app used according to the packet table of the capture at path, or None if the capture
+        was never decoded (see load_packet_table).
+    """
+    table = read_packet_table(get_table_path(path), path)
+    if table is None:
+        return None
+    # Same rule as is_ip_version_six: any IPv6 SYN means the app used IPv6
+    ip_version_is_six = bool(np.any(table.get_flag_mask(TCP_SYN) & table.get_ip_version_mask(True)))
+    return 6 if ip_version_is_six else 4
+
+
+def describe_pcap(path: str, previous: Dict[str, Any] = None) -> Union[Dict[str, Any], None]:
+    """
+    Only the record headers are read, packets are left to be decoded by the runs: the IP version is taken from
+    the packet table once one was cached.
+    """
+    fingerprint = get_file_fingerprint(path, previous)
+    if fingerprint is None:
+        return None
+    if previous and previous['sha256'] == fingerprint['sha256']:
+        description = {**previous, **fingerprint}
+        if description['ip_version'] is None:
+            description['ip_version'] = get_cached_ip_version(path)
+        return description
+    record_count = 0
+    start_ns = end_ns = None
+    with PcapReader(path) as reader:
+        for _, ts_ns in reader.iter_record_headers():
+            record_count += 1
+            start_ns = ts_ns if start_ns is None else min(start_ns, ts_ns)
+            end_ns = ts_ns if end_ns is None else max(end_ns, ts_ns)
+    return {
+        **fingerprint,
+        'record_count': record_count,
+        'start_ns': start_ns,
+        'end_ns': end_ns,
+        'ip_version': get_cached_ip_version(path),
+    }
+
+
+def describe_run(host_path: str, previous: RunRecord = None) -> Union[RunRecord, None]:
+    """
+    Returns:
+        The record of the run of host_path, or None if its directory does not follow the naming convention.
+        Files whose size and mtime did not change since previous are not read again.
+    """
+    exp_name = os.path.basename(os.path.dirname(os.path.dirname(host_path)))
+    exp_match = EXP_NAME_PATTERN.match(exp_name)
+    run_match = RUN_NAME_PATTERN.match(os.path.basename(host_path))
+    if exp_match is None or run_match is None:
+        return None
+    previous_files = previous.files if previous is not None else {}
+    files = {}
+    for name, path in get_run_inputs(host_path).items():
+        describe = describe_pcap if name.endswith('_pcap') else describe_log
+        files[name] = describe(path, previous_files.get(name))
+    return RunRecord(
+        name='{}/{}'.format(exp_name, os.path.basename(host_path)),
+        tech=exp_match.group('tech'),
+        condition=exp_match.group('condition'),
+        mode=exp_match.group('mode'),
+        run_number=int(run_match.group('number')),
+        host_path=host_path,
+        resolver_path=host_path.replace('/host/', '/resolver/'),
+        files=files,
+    )
+
+
+def matches(value, expected) -> bool:
+    if expected is None:
+        return True
+    if isinstance(expected, (str, int, bool)):
+        return value == expected
+    return value in expected
+
+
+class Catalog:
+    """
+    One RunRecord per run of the datasets directory, ordered by experiment and run number.
+    """
+    records: List[RunRecord]
+
+    def __init__(self, **kwargs):
+        self.records = kwargs.get("records") or []
+
+    def query(self, tech=None, condition=None, mode=None, ip_version: int = None,
+              run_numbers: Iterable[int] = None, complete: bool = None) -> List[RunRecord]:
+        """
+        Runs matching all the given filters. Each filter is a value or a collection of accepted values, e.g.
+        query(tech='5g', condition=('static', 'host_move'), mode='line', complete=True).
+        ip_version only matches the runs whose host capture was decoded, see RunRecord.ip_version.
+        """
+        return [record for record in self.records
+                if matches(record.tech, tech) and matches(record.condition, condition) and matches(record.mode, mode)
+                and matches(record.ip_version, ip_version) and matches(record.run_number, run_numbers)
+                and matches(record.is_complete, complete)]
+
+    def get(self, name: str) -> Union[RunRecord, None]:
+        for record in self.records:
+            if record.name == name:
+                return record
+        return None
+
+
+def scan_catalog(datasets_path: str = DATASETS_PATH, previous: Catalog = None) -> Catalog:
+    """
+    Describe every datasets/<tech>-<condition>-<line|point>/host/runN, reusing the records of previous
+    for the files that did not change.
+    """
+    previous_records = {record.name: record for record in previous.records} if previous is not None else {}
+    records = []
+    for host_path in glob.glob(os.path.join(datasets_path, '*', 'host', 'run*')):
+        name = '{}/{}'.format(os.path.basename(os.path.dirname(os.path.dirname(host_path))),
+                              os.path.basename(host_path))
+        record = describe_run(host_path, previous_records.get(name))
+        if record is not None:
+            records.append(record)
+    records.sort(key=lambda x: (x.exp_name, x.run_number))
+    return Catalog(records=records)
+
+
+def read_catalog(catalog_path: str) -> Union[Catalog, None]:
+    try:
+        with open(catalog_path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get('version') != CATALOG_VERSION:
+        return None
+    return Catalog(records=[run_record_from_json(record) for record in data['records']])
+
+
+def write_catalog(catalog_path: str, catalog: Catalog):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(catalog_path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'version': CATALOG_VERSION, 'records': [record.to_json() for record in catalog.records]}, f,
+                  indent=2)
+    os.replace(tmp_path, catalog_path)
+
+
+def load_catalog(datasets_path: str = DATASETS_PATH, refresh: bool = True) -> Catalog:
+    """
+    Load the catalog saved in datasets/catalog.json.
+    Args:
+        datasets_path: the datasets directory.
+        refresh: look for new, removed and changed runs and save the catalog if anything changed.
+            Unchanged files are only stat'ed; without refresh the saved catalog is returned as is.
+    """
+    catalog_path = os.path.join(datasets_path, CATALOG_FILENAME)
+    catalog = read_catalog(catalog_path)
+    if catalog is not None and not refresh:
+        return catalog
+    scanned = scan_catalog(datasets_path, previous=catalog)
+    if catalog is None or [record.to_json() for record in scanned.records] != \
+            [record.to_json() for record in catalog.records]:
+        try:
+            write_catalog(catalog_path, scanned)
+        except OSError as e:
+            print('Cannot write catalog {} ({})'.format(catalog_path, e))
+    return scanned
+
+
+class CatalogUnitTest(unittest.TestCase):
+    def test_query(self):
+        def record(exp_name, run_number, ip_version=4):
+            tech, condition, mode = EXP_NAME_PATTERN.match(exp_name).groups()
+            host_path = os.path.join(DATASETS_PATH, exp_name, 'host', 'run{}'.format(run_number))
+            return RunRecord(name='{}/run{}'.format(exp_name, run_number), tech=tech, condition=condition, mode=mode,
+                             run_number=run_number, host_path=host_path,
+                             files={'host_pcap': {'ip_version': ip_version, 'record_count': 0}})
+
+        catalog = Catalog(records=[record('5g-static-line', 1), record('5g-host_move-line', 2, ip_version=6),
+                                   record('lte-static-point', 1)])
+        self.assertEqual(['5g-static-line/run1'], [r.name for r in catalog.query(tech='5g', condition='static')])
+        self.assertEqual(['5g-static-line/run1', '5g-host_move-line/run2'],
+                         [r.name for r in catalog.query(condition=('static', 'host_move'), mode='line')])
+        self.assertEqual(['5g-host_move-line/run2'], [r.name for r in catalog.query(ip_version=6)])
+        self.assertEqual([], catalog.query(complete=True))
+        self.assertEqual('lte', catalog.get('lte-static-point/run1').tech)
+
+    def test_describe_pcap(self):
+        with tempfile.TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, PCAP)
+            with open(path, 'wb') as f:
+                f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 276))
+                for ts_sec, ts_usec in ((1680896216, 500000), (1680896215, 0), (1680896220, 250)):
+                    f.write(struct.pack('<IIII', ts_sec, ts_usec, 4, 4) + b'\0' * 4)
+            description = describe_pcap(path)
+            self.assertEqual(3, description['record_count'])
+            self.assertEqual((1680896215000000000, 1680896220000250000),
+                             (description['start_ns'], description['end_ns']))
+            # Records are not decoded, the IP version is unknown until the capture has a packet table
+            self.assertIsNone(description['ip_version'])
+            self.assertFalse(os.path.exists(get_table_path(path)))
+            self.assertEqual(description, describe_pcap(path, previous=description))
@@ -0,0 +1,104 @@
+import unittest
+from typing import Tuple
+
+import numpy as np
+
+from src.utils.pcap_reader import TCP_FIN, TCP_RST, TCP_SYN
+
+# One row per direction of a TCP connection, indexed by the flow id of PacketTable.packets
+FLOW_DTYPE = np.dtype([
+    ('src', np.int32),  # ip ids, see PacketTable.ips
+    ('dst', np.int32),
+    ('src_port', np.int32),
+    ('dst_port', np.int32),
+    ('stream', np.int32),
+])
+
+# Running counters over the packets of a group (a flow, or all the flows between two IPs)
+SUMMARY_DTYPE = np.dtype([
+    ('src', np.int32),
+    ('dst', np.int32),
+    ('packets', np.int64),
+    ('bytes', np.int64),  # sum of frame.len
+    ('first_ns', np.int64),
+    ('last_ns', np.int64),
+    ('syn', np.int64),
+    ('fin', np.int64),
+    ('rst', np.int64),
+])
+
+FLOW_SUMMARY_DTYPE = np.dtype([('flow', np.int32)] + [
+    (name, SUMMARY_DTYPE.fields[name][0]) for name in SUMMARY_DTYPE.names
+])
+
+
+def summarize(packets: np.ndarray, group_keys: np.ndarray,
+              dtype: np.dtype = SUMMARY_DTYPE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Aggregate packets (rows of PACKET_DTYPE) by group_keys, one key per packet.
+    Returns:
+        One row per distinct key, ordered by key, and the distinct keys.
+    """
+    keys, groups = np.unique(group_keys, return_inverse=True)
+    summary = np.zeros(len(keys), dtype=dtype)
+    summary['packets'] = np.bincount(groups, minlength=len(keys))
+    np.add.at(summary['bytes'], groups, packets['length'])
+    summary['first_ns'] = np.iinfo(np.int64).max
+    np.minimum.at(summary['first_ns'], groups, packets['time_ns'])
+    np.maximum.at(summary['last_ns'], groups, packets['time_ns'])
+    for column, flag in (('syn', TCP_SYN), ('fin', TCP_FIN), ('rst', TCP_RST)):
+        summary[column] = np.bincount(groups, weights=(packets['flags'] & flag) != 0, minlength=len(keys))
+    # All the packets of a group share the same src and dst
+    first_rows = np.zeros(len(keys), dtype=np.int64)
+    first_rows[groups[::-1]] = np.arange(len(groups))[::-1]
+    summary['src'] = packets['src'][first_rows]
+    summary['dst'] = packets['dst'][first_rows]
+    return summary, keys
+
+
+def summarize_flows(packets: np.ndarray) -> np.ndarray:
+    """
+    Returns:
+        Counters of each flow (see FLOW_SUMMARY_DTYPE) with at least one packet in packets.
+    """
+    summary, flows = summarize(packets, packets['flow'], dtype=FLOW_SUMMARY_DTYPE)
+    summary['flow'] = flows
+    return summary
+
+
+def summarize_directions(packets: np.ndarray) -> np.ndarray:
+    """
+    Returns:
+        Counters of the packets from each src IP to each dst IP (see SUMMARY_DTYPE), whatever their ports.
+    """
+    pairs = packets['src'].astype(np.int64) << 32 | packets['dst'].astype(np.int64)
+    summary, _ = summarize(packets, pairs)
+    return summary
+
+
+class FlowSummaryUnitTest(unittest.TestCase):
+    def test_summaries(self):
+        from src.utils.packet_table import PACKET_DTYPE
+
+        packets = np.array([
+            # time_ns, offset, record_length, src, dst, length, flags, tls_content_types, ip_version, stream, flow
+            (10, -1, 0, 0, 1, 80, TCP_SYN, 0, 4, 0, 0),
+            (20, -1, 0, 1, 0, 80, TCP_SYN, 0, 4, 0, 1),
+            (30, -1, 0, 0, 1, 300, 0, 0, 4, 0, 0),
+            (40, -1, 0, 0, 1, 60, TCP_SYN, 0, 4, 1, 2),
+            (50, -1, 0, 0, 1, 60, TCP_RST, 0, 4, 1, 2),
+        ], dtype=PACKET_DTYPE)
+
+        flows = summarize_flows(packets)
+        self.assertEqual([0, 1, 2], flows['flow'].tolist())
+        self.assertEqual([2, 1, 2], flows['packets'].tolist())
+        self.assertEqual([380, 80, 120], flows['bytes'].tolist())
+        self.assertEqual([(10, 30), (20, 20), (40, 50)],
+                         list(zip(flows['first_ns'].tolist(), flows['last_ns'].tolist())))
+        self.assertEqual([0, 0, 1], flows['rst'].tolist())
+
+        directions = summarize_directions(packets)
+        self.assertEqual([(0, 1), (1, 0)], list(zip(directions['src'].tolist(), directions['dst'].tolist())))
+        self.assertEqual([4, 1], directions['packets'].tolist())
+        self.assertEqual([500, 80], directions['bytes'].tolist())
+        self.assertEqual([2, 1], directions['syn'].tolist())
@@ -0,0 +1,118 @@
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from typing import Any, Dict, List
+
+JOURNAL_FILENAME = 'journal.jsonl'
+
+
+class RunJournal:
+    """
+    Append-only log of the stages of a run: one JSON line when a stage starts and one when it ends,
+    with its status ('ok', 'failed' or 'cached'), duration and details such as fingerprints.
+    Lines are appended with O_APPEND, so several processes can share a journal file.
+    """
+    path: str
+    run: str
+
+    def __init__(self, **kwargs):
+        self.path = kwargs.get("path")
+        self.run = kwargs.get("run")
+        self.lock = threading.Lock()
+
+    def append(self, **event):
+        line = json.dumps({'time': time.time(), 'run': self.run, **event}) + '\n'
+        with self.lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode())
+            finally:
+                os.close(fd)
+
+    @contextlib.contextmanager
+    def stage(self, stage: str, **details):
+        """
+        Journal the start and the end of the code in the with block. Details can be added to the end event
+        through the yielded dict.
+        """
+        start = time.perf_counter()
+        end_details = {}
+        self.append(stage=stage, event='start', **details)
+        try:
+            yield end_details
+        except BaseException as e:
+            self.append(stage=stage, event='end', status='failed', duration=time.perf_counter() - start,
+                        error='{}: {}'.format(type(e).__name__, e), **details)
+            raise
+        self.append(stage=stage, event='end', status=end_details.pop('status', 'ok'),
+                    duration=time.perf_counter() - start, **details, **end_details)
+
+
+def journal_stage(journal: RunJournal, stage: str, **details):
+    """
+    journal.stage, or a no-op if there is no journal.
+    """
+    if journal is None:
+        return contextlib.nullcontext({})
+    return journal.stage(stage, **details)
+
+
+def read_journal(path: str) -> List[Dict[str, Any]]:
+    """
+    Returns:
+        The events of the journal, without the line being written if a process died mid-write.
+    """
+    events = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return events
+
+
+def get_completed_runs(events: List[Dict[str, Any]], stage: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Returns:
+        For each run, the last successful end of stage, unless the run was started again after it.
+    """
+    completed = {}
+    for event in events:
+        if event['stage'] == stage and event['event'] == 'start':
+            completed.pop(event['run'], None)
+        elif event['stage'] == stage and event['event'] == 'end' and event['status'] == 'ok':
+            completed[event['run']] = event
+    return completed
+
+
+class RunJournalUnitTest(unittest.TestCase):
+    def test_stages(self):
+        with tempfile.TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, JOURNAL_FILENAME)
+            journal = RunJournal(path=path, run='5g-static-line/run1')
+            with journal.stage('outputs') as details:
+                details['fingerprints'] = {'phases.csv': 'abc'}
+            with self.assertRaises(ValueError):
+                with journal_stage(journal, 'log parse', side='host'):
+                    raise ValueError('no valid 1a start')
+            with journal_stage(None, 'phases'):
+                pass
+            RunJournal(path=path, run='5g-static-line/run2').append(stage='outputs', event='start')
+            with open(path, 'a') as f:
+                f.write('{"time": 1, "run": "5g-stat')
+
+            events = read_journal(path)
+            self.assertEqual(['start', 'end', 'start', 'end', 'start'], [event['event'] for event in events])
+            self.assertEqual('failed', events[3]['status'])
+            self.assertEqual('host', events[3]['side'])
+            completed = get_completed_runs(events, 'outputs')
+            self.assertEqual(['5g-static-line/run1'], list(completed))
+            self.assertEqual({'phases.csv': 'abc'}, completed['5g-static-line/run1']['fingerprints'])
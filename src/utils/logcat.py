@@ -0,0 +1,283 @@
+import itertools
+import mmap
+import multiprocessing
+import os
+import re
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterator, List, Tuple, Union
+
+from src.utils.strings import extract_stroke_id, extract_timestamp, has_prefix
+
+# The app's messages follow this tag, see has_prefix
+LOG_TAG_REGEXP = re.compile(r'ar_activity:\s')
+
+# Kind and prefix of the app's messages parse_log looks for, in the order it checks them.
+# No message starts with two of the prefixes.
+LOG_EVENT_PREFIXES = [
+    # Host's messages
+    ('touch_start', r'\[\[1a start\] touch screen'),
+    ('stroke_added', r'stroke \(id: .*?\) was added at'),
+    ('add_points', r'send stroke to firebase'),
+    ('cloud_finish', r'onComplete of doStrokeUpdate'),
+    ('sync_start', r'SET ANCHOR'),
+    ('sync_success', r'SYNCED'),
+    # Resolver's messages
+    ('line_changed', r'\[\[2a end - 2d start\] onChildChanged'),
+    ('line_added', r'\[\[2a end - 2d start\] onChildAdded'),
+    ('finish_rendering', r'\[\[2d\] after update'),
+]
+
+# One alternation with a named group per kind, matched right after the tag
+LOG_EVENT_REGEXP = re.compile('|'.join('(?P<{}>{})'.format(kind, prefix) for kind, prefix in LOG_EVENT_PREFIXES))
+
+# Finds the lines that may hold one of the app's messages in the raw bytes of a log. The tag may be followed by
+# any character \s matches: ASCII whitespace and \x1c-\x1f, or the 2 to 3 bytes of a non-ASCII one in UTF-8.
+LOG_CANDIDATE_REGEXP = re.compile(
+    rb'ar_activity:(?:[\s\x1c-\x1f]|[\x80-\xff]{2,3})(?:' +
+    b'|'.join(prefix.encode() for _, prefix in LOG_EVENT_PREFIXES) + rb')')
+
+# Logs are split in chunks of about this size to be scanned in parallel, see iter_log_events_parallel
+LOG_CHUNK_BYTES = 16 << 20
+
+# Logs larger than this are scanned by several processes unless told otherwise, see get_log_jobs
+LOG_PARALLEL_BYTES = 4 * LOG_CHUNK_BYTES
+# Logs parse_log_and_pcap scans at the same time, the host's and the resolver's
+LOGS_PER_RUN = 2
+
+# Kinds whose message carries a stroke id
+STROKE_EVENTS = {'stroke_added', 'line_changed', 'line_added'}
+
+
+class LogEvent:
+    kind: str
+    time: datetime
+    stroke_id: Union[str, None]
+
+    def __init__(self, **kwargs):
+        self.kind = kwargs.get("kind")
+        self.time = kwargs.get("time")
+        self.stroke_id = kwargs.get("stroke_id")
+
+
+def classify_line(line: str) -> Union[str, None]:
+    """
+    Same as trying has_prefix with each prefix of LOG_EVENT_PREFIXES, but the tag is found once and
+    the prefixes are matched at once.
+    Returns:
+        The kind of the app message of the line, or None if it is none of LOG_EVENT_PREFIXES.
+    """
+    tag = LOG_TAG_REGEXP.search(line)
+    if tag is None:
+        return None
+    match = LOG_EVENT_REGEXP.match(line, tag.end())
+    if match is None:
+        return None
+    return match.lastgroup
+
+
+def parse_log_event(line: str, year: str) -> Union[LogEvent, None]:
+    """
+    Returns:
+        The kind, time and, for STROKE_EVENTS, stroke id of the app message of the line,
+        or None if it is none of LOG_EVENT_PREFIXES.
+    """
+    kind = classify_line(line)
+    if kind is None:
+        return None
+    return LogEvent(
+        kind=kind,
+        time=extract_timestamp(line, year=year),
+        stroke_id=extract_stroke_id(line) if kind in STROKE_EVENTS else None,
+    )
+
+
+def iter_log_events(path: str, year: str, start: int = 0, end: int = None) -> Iterator[Tuple[int, int, LogEvent]]:
+    """
+    Scan a logcat file for the app's messages without decoding every line: the file is memory-mapped, candidate
+    lines are found with a bytes regex over the whole mapping, and only those are decoded and parsed.
+    Yields the same events as parse_log_event on each line, in file order.
+    Args:
+        start, end: only scan the lines in this byte range, whose bounds must be line starts (see split_log_chunks).
+
+    Returns:
+        An iterator of (offset, length, event) of the lines holding an event, newline included in the length.
+    """
+    with open(path, 'rb') as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # empty file
+    with buffer:
+        line_end = -1
+        for candidate in LOG_CANDIDATE_REGEXP.finditer(buffer, start, len(buffer) if end is None else end):
+            if candidate.start() < line_end:
+                continue  # line already parsed
+            line_start = buffer.rfind(b'\n', 0, candidate.start()) + 1
+            line_end = buffer.find(b'\n', candidate.start())
+            line_end = len(buffer) if line_end < 0 else line_end + 1
+            event = parse_log_event(buffer[line_start:line_end].decode(), year=year)
+            if event is not None:
+                yield line_start, line_end - line_start, event
+
+
+def split_log_chunks(path: str, chunk_bytes: int = LOG_CHUNK_BYTES) -> List[Tuple[int, int]]:
+    """
+    Returns:
+        (start, end) byte ranges of about chunk_bytes covering the file, each one ending after a newline
+        (or at the end of the file) so that no line is split.
+    """
+    size = os.path.getsize(path)
+    chunks = []
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()  # up to the end of the line the chunk would have split
+            end = min(f.tell(), size)
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def scan_log_chunk(path: str, year: str, start: int, end: int) -> List[Tuple[int, int, LogEvent]]:
+    return list(iter_log_events(path, year, start, end))
+
+
+def iter_log_events_parallel(path: str, year: str, jobs: int,
+                             chunk_bytes: int = None) -> Iterator[Tuple[int, int, LogEvent]]:
+    """
+    Same as iter_log_events, but the chunks of the file (see split_log_chunks) are scanned by `jobs` processes.
+    Which lines hold which event does not depend on the lines before them, so the chunks are independent;
+    the events are yielded in file order.
+    The processes are spawned rather than forked: the log is usually parsed in a thread of parse_log_and_pcap,
+    and forking a multithreaded process may copy locks held by the other threads.
+    Args:
+        chunk_bytes: size of the chunks, LOG_CHUNK_BYTES if None.
+    """
+    chunks = split_log_chunks(path, chunk_bytes or LOG_CHUNK_BYTES)
+    if jobs <= 1 or len(chunks) <= 1:
+        yield from iter_log_events(path, year)
+        return
+    with ProcessPoolExecutor(max_workers=min(jobs, len(chunks)),
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        yield from itertools.chain.from_iterable(executor.map(
+            scan_log_chunk,
+            itertools.repeat(path),
+            itertools.repeat(year),
+            [start for start, _ in chunks],
+            [end for _, end in chunks],
+        ))
+
+
+def get_log_jobs(path: str, jobs: int = None) -> int:
+    """
+    Args:
+        jobs: number of processes scanning the log, 0 for one per CPU, or None for 1 if the log is at most
+            LOG_PARALLEL_BYTES (smaller logs are scanned faster than a pool starts) and otherwise the CPUs
+            shared between the LOGS_PER_RUN logs of a run.
+
+    Returns:
+        The number of processes to pass to iter_log_events_parallel.
+    """
+    if jobs is None:
+        if os.path.getsize(path) <= LOG_PARALLEL_BYTES:
+            return 1
+        return max(1, os.cpu_count() // LOGS_PER_RUN)
+    return jobs or os.cpu_count()
+
+
+class LogEventUnitTest(unittest.TestCase):
+    def test_classify_line(self):
+        lines = [
+            '04-07 15:16:47.171  6297  6297 D ar_activity: [[1a start] touch screen time=2023-04-07 15:16:47.171]',
+            '04-07 15:16:47.171  6297  6297 D ar_activity: [[1b end] time=2023-04-07 15:16:47.171]',
+            '04-07 15:16:47.408 11056 11213 D ar_activity: [[2d] after update lines time=2023-04-07 15:16:47.407]',
+            '04-07 15:35:34.304 10854 10854 D ar_activity: [[2a end - 2d start] onChildChanged stroke '
+            'id=-NSSCsksd3t6Qrxa0fqY time=2023-04-07 15:35:34.303]',
+            '04-07 15:35:34.221 10854 11002 D ar_activity: stroke (id: -NSSCsksd3t6Qrxa0fqY) was added at '
+            '2023-04-07 15:35:34.221',
+            '04-07 15:34:34.421 10456 10592 D ar_activity: [Update ARCore frame time=2023-04-07 15:34:34.421]',
+            '04-07 15:34:34.421 10456 10592 D ar_activity: SYNCED: 2023-04-07 15:34:34.421',
+            '04-07 15:34:34.421 10456 10592 D ar_activityx: SYNCED ar_activity: SET ANCHOR',
+            '04-07 15:34:34.421 10456 10592 D ar_activity: x ar_activity: SET ANCHOR',
+            '--------- beginning of main',
+        ]
+        for line in lines:
+            expected = [kind for kind, prefix in LOG_EVENT_PREFIXES if has_prefix(line, prefix)]
+            self.assertEqual(expected[0] if expected else None, classify_line(line), line)
+
+    def test_parse_log_event(self):
+        event = parse_log_event('04-07 15:35:34.304 10854 10854 D ar_activity: [[2a end - 2d start] onChildChanged '
+                                'stroke id=-NSSCsksd3t6Qrxa0fqY time=2023-04-07 15:35:34.303]', year='2023')
+        self.assertEqual('line_changed', event.kind)
+        self.assertEqual(datetime(2023, 4, 7, 15, 35, 34, 304000), event.time)
+        self.assertEqual('-NSSCsksd3t6Qrxa0fqY', event.stroke_id)
+        self.assertIsNone(parse_log_event('04-07 15:34:34.421 10456 10592 D ar_activity: [Update ARCore frame]',
+                                          year='2023'))
+
+    def test_iter_log_events(self):
+        lines = [
+            b'--------- beginning of main\n',
+            b'04-07 15:34:34.421 10456 10592 D ar_activity: [Update ARCore frame time=2023-04-07 15:34:34.421]\n',
+            b'04-07 15:34:34.500 10456 10592 D ar_activity: SET ANCHOR: 2023-04-07 15:34:34.500\n',
+            b'04-07 15:34:34.600 10456 10592 D ar_activity: x ar_activity: SYNCED\n',
+            b'04-07 15:34:34.700 10456 10592 D ar_activity:\xc2\xa0SYNCED \xc3\xa9 ar_activity: SYNCED\n',
+            b'04-07 15:35:34.221 10854 11002 D ar_activity: stroke (id: -NSSCsksd3t6Qrxa0fqY) was added at',
+        ]
+        with tempfile.TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, 'static_log.logcat')
+            with open(path, 'wb') as f:
+                f.write(b''.join(lines))
+            expected = []
+            offset = 0
+            for line in lines:
+                event = parse_log_event(line.decode(), year='2023')
+                if event is not None:
+                    expected.append((offset, len(line), event.kind, event.time, event.stroke_id))
+                offset += len(line)
+            events = [(offset, length, event.kind, event.time, event.stroke_id)
+                      for offset, length, event in iter_log_events(path, year='2023')]
+            self.assertEqual(['sync_start', 'sync_success', 'stroke_added'], [event[2] for event in events])
+            self.assertEqual(expected, events)
+
+            open(path, 'wb').close()
+            self.assertEqual([], list(iter_log_events(path, year='2023')))
+
+    def test_parallel(self):
+        lines = [b'--------- beginning of main\n']
+        for second in range(40):
+            lines.append('04-07 15:34:{:02d}.421 1 2 D ar_activity: [Update ARCore frame]\n'.format(second).encode())
+            lines.append('04-07 15:34:{:02d}.500 1 2 D ar_activity: {}\n'.format(
+                second, 'SET ANCHOR' if second % 3 else 'SYNCED').encode())
+        lines.append(b'04-07 15:35:34.221 1 2 D ar_activity: stroke (id: -NSSCsksd3t6Qrxa0fqY) was added at')
+        with tempfile.TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, 'static_log.logcat')
+            with open(path, 'wb') as f:
+                f.write(b''.join(lines))
+            chunks = split_log_chunks(path, chunk_bytes=500)
+            self.assertEqual(0, chunks[0][0])
+            self.assertEqual(os.path.getsize(path), chunks[-1][1])
+            for (_, end), (start, _) in zip(chunks, chunks[1:]):
+                self.assertEqual(end, start)
+                self.assertTrue(b''.join(lines).startswith(b'\n', end - 1))
+
+            def describe(events):
+                return [(offset, length, event.kind, event.time, event.stroke_id) for offset, length, event in events]
+            self.assertEqual(describe(iter_log_events(path, year='2023')),
+                             describe(iter_log_events_parallel(path, year='2023', jobs=2, chunk_bytes=500)))
+
+    def test_log_jobs(self):
+        with tempfile.TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, 'static_log.logcat')
+            with open(path, 'wb') as f:
+                f.write(b'--------- beginning of main\n')
+            self.assertEqual(1, get_log_jobs(path))
+            self.assertEqual(3, get_log_jobs(path, jobs=3))
+            self.assertEqual(os.cpu_count(), get_log_jobs(path, jobs=0))
+            with open(path, 'wb') as f:
+                f.truncate(LOG_PARALLEL_BYTES + 1)
+            self.assertEqual(max(1, os.cpu_count() // LOGS_PER_RUN), get_log_jobs(path))
+            self.assertEqual(1, get_log_jobs(path, jobs=1))
@@ -0,0 +1,151 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+from typing import Any, Dict, List, Union
+
+from src.utils.packet_table import hash_file
+
+ROOT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def get_code_version(root_path: str = ROOT_PATH) -> str:
+    """
+    sha256 of the python sources under root_path (src), so that any change to the processing code
+    makes every run stale.
+    """
+    sha256 = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(root_path, '**', '*.py'), recursive=True)):
+        sha256.update(os.path.relpath(path, root_path).encode())
+        sha256.update(hash_file(path).encode())
+    return sha256.hexdigest()
+
+
+def get_file_fingerprint(path: str, previous: Dict[str, Any] = None) -> Union[Dict[str, Any], None]:
+    """
+    Args:
+        path: input file.
+        previous: the fingerprint recorded last time, whose hash is reused if size and mtime did not change.
+
+    Returns:
+        The size, mtime and sha256 of the file, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+        file_hash = previous['sha256']
+    else:
+        file_hash = hash_file(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_hash}
+
+
+class RunManifest:
+    """
+    What each run's outputs were last built from: the fingerprints of its input files, the code version and
+    the options that change the outputs (e.g. the pcap backend).
+    runs maps a run name to {'inputs': {input name: fingerprint}, 'code_version': str, 'options': dict}.
+    """
+    path: str
+    runs: Dict[str, Dict[str, Any]]
+
+    def __init__(self, **kwargs):
+        self.path = kwargs.get("path")
+        self.runs = kwargs.get("runs") or {}
+
+    def get_fingerprints(self, run: str, inputs: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Args:
+            run: run name.
+            inputs: input name -> path.
+        """
+        previous = self.runs.get(run, {}).get('inputs', {})
+        return {name: get_file_fingerprint(path, previous.get(name)) for name, path in inputs.items()}
+
+    def is_up_to_date(self, run: str, fingerprints: Dict[str, Any], code_version: str, outputs: List[str],
+                       options: Dict[str, Any] = None) -> bool:
+        """
+        A run is up to date if it was built from the same inputs (by content) with the same code and options,
+        and none of its outputs is missing.
+        """
+        entry = self.runs.get(run)
+        if entry is None or entry['code_version'] != code_version:
+            return False
+        if entry.get('options', {}) != (options or {}):
+            return False
+        if any(fingerprint is None for fingerprint in fingerprints.values()):
+            return False
+        previous = entry['inputs']
+        if set(previous) != set(fingerprints):
+            return False
+        if any(previous[name]['sha256'] != fingerprint['sha256'] for name, fingerprint in fingerprints.items()):
+            return False
+        return all(os.path.isfile(path) for path in outputs)
+
+    def record(self, run: str, fingerprints: Dict[str, Any], code_version: str, options: Dict[str, Any] = None):
+        self.runs[run] = {'inputs': fingerprints, 'code_version': code_version, 'options': options or {}}
+
+    def save(self):
+        dir_path = os.path.dirname(self.path)
+        os.makedirs(dir_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dir_path, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'runs': self.runs}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def load_run_manifest(path: str) -> RunManifest:
+    """
+    Returns:
+        The manifest saved at path, or an empty one if it is missing or unreadable.
+    """
+    try:
+        with open(path) as f:
+            runs = json.load(f)['runs']
+    except (OSError, ValueError, KeyError):
+        runs = {}
+    return RunManifest(path=path, runs=runs)
+
+
+class RunManifestUnitTest(unittest.TestCase):
+    def test_up_to_date(self):
+        with tempfile.TemporaryDirectory() as dir_path:
+            input_path = os.path.join(dir_path, 'capture.pcap')
+            output_path = os.path.join(dir_path, 'phases.csv')
+            for path in (input_path, output_path):
+                with open(path, 'w') as f:
+                    f.write('run1')
+            manifest = load_run_manifest(os.path.join(dir_path, 'manifest.json'))
+            fingerprints = manifest.get_fingerprints('run1', {'host_pcap': input_path})
+            self.assertFalse(manifest.is_up_to_date('run1', fingerprints, 'v1', [output_path]))
+            manifest.record('run1', fingerprints, 'v1')
+            manifest.save()
+
+            manifest = load_run_manifest(manifest.path)
+            fingerprints = manifest.get_fingerprints('run1', {'host_pcap': input_path})
+            self.assertTrue(manifest.is_up_to_date('run1', fingerprints, 'v1', [output_path]))
+            self.assertFalse(manifest.is_up_to_date('run1', fingerprints, 'v2', [output_path]))
+
+            # Touching an input is fine, changing it is not
+            os.utime(input_path, ns=(0, 0))
+            fingerprints = manifest.get_fingerprints('run1', {'host_pcap': input_path})
+            self.assertTrue(manifest.is_up_to_date('run1', fingerprints, 'v1', [output_path]))
+            with open(input_path, 'w') as f:
+                f.write('run2')
+            fingerprints = manifest.get_fingerprints('run1', {'host_pcap': input_path})
+            self.assertFalse(manifest.is_up_to_date('run1', fingerprints, 'v1', [output_path]))
+
+            # Built with other options
+            manifest.record('run1', fingerprints, 'v1', {'pcap_backend': 'native'})
+            self.assertTrue(manifest.is_up_to_date('run1', fingerprints, 'v1', [output_path],
+                                                   {'pcap_backend': 'native'}))
+            self.assertFalse(manifest.is_up_to_date('run1', fingerprints, 'v1', [output_path],
+                                                    {'pcap_backend': 'fields'}))
+            self.assertFalse(manifest.is_up_to_date('run1', fingerprints, 'v1', [output_path]))
+
+            os.remove(output_path)
+            manifest.record('run1', fingerprints, 'v1')
+            self.assertFalse(manifest.is_up_to_date('run1', fingerprints, 'v1', [output_path]))
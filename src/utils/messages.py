@@ -0,0 +1,100 @@
+import unittest
+from typing import Dict, Hashable, List
+
+import numpy as np
+
+from src.utils.pcap_reader import TCP_PSH
+
+SEQ_MODULO = 1 << 32
+
+MESSAGE_DTYPE = np.dtype([
+    ('start_ns', np.int64),  # timestamp of the first segment
+    ('end_ns', np.int64),  # timestamp of the last segment
+    ('src', np.int32),  # ip ids, see PacketTable.ips
+    ('dst', np.int32),
+    ('stream', np.int32),
+    ('bytes', np.int64),  # TCP payload bytes, from the sequence numbers
+    ('segments', np.int32),
+    ('first_row', np.int64),  # rows of the first and the last segment in PacketTable.packets
+    ('last_row', np.int64),
+])
+
+
+class MessageAssembler:
+    """
+    Group the TCP segments of each direction into application messages.
+    A message is a run of consecutive data segments of one direction. It ends with a segment that has
+    PSH set (the sender flushed a write), or when the sender's ACK number moves, i.e. the peer sent
+    data in between and the exchange turned around.
+    Sizes come from the sequence numbers, so they are exact even though only 164 bytes of each
+    segment are captured. Retransmitted segments are not counted.
+    Segments must be given in capture order.
+    """
+
+    def __init__(self):
+        # flow -> [start_ns, end_ns, src, dst, stream, start_seq, next_seq, segments, first_row, last_row, ack]
+        self.open_messages: Dict[Hashable, list] = {}
+        # flow -> sequence number following the newest segment
+        self.next_seq: Dict[Hashable, int] = {}
+        self.messages: List[tuple] = []
+
+    def add_segment(self, flow: Hashable, row: int, ts_ns: int, src: int, dst: int, stream: int, seq: int,
+                    ack: int, flags: int, payload_length: int):
+        if payload_length <= 0:
+            return
+        next_seq = self.next_seq.get(flow)
+        if next_seq is not None and 0 < (next_seq - seq) % SEQ_MODULO < SEQ_MODULO // 2:
+            # Retransmission
+            return
+        self.next_seq[flow] = (seq + payload_length) % SEQ_MODULO
+
+        message = self.open_messages.get(flow)
+        if message is not None and message[10] != ack:
+            self.close_message(flow)
+            message = None
+        if message is None:
+            message = [ts_ns, ts_ns, src, dst, stream, seq, seq, 0, row, row, ack]
+            self.open_messages[flow] = message
+        message[1] = ts_ns
+        message[6] = (seq + payload_length) % SEQ_MODULO
+        message[7] += 1
+        message[9] = row
+        if flags & TCP_PSH:
+            self.close_message(flow)
+
+    def close_message(self, flow: Hashable):
+        start_ns, end_ns, src, dst, stream, start_seq, next_seq, segments, first_row, last_row, _ = \
+            self.open_messages.pop(flow)
+        self.messages.append((start_ns, end_ns, src, dst, stream, (next_seq - start_seq) % SEQ_MODULO, segments,
+                              first_row, last_row))
+
+    def close(self) -> np.ndarray:
+        """
+        Close the messages still open at the end of the capture.
+        Returns:
+            All the messages (see MESSAGE_DTYPE), ordered by their first segment.
+        """
+        for flow in list(self.open_messages):
+            self.close_message(flow)
+        messages = np.array(self.messages, dtype=MESSAGE_DTYPE)
+        return messages[np.argsort(messages['first_row'], kind='stable')]
+
+
+class MessageAssemblerUnitTest(unittest.TestCase):
+    def test_push_and_ack_boundaries(self):
+        assembler = MessageAssembler()
+        up = ('phone', 'server')
+        # A 3000-byte write in 3 segments, the last one flushed with PSH
+        assembler.add_segment(up, 0, 100, 0, 1, 0, seq=1000, ack=1, flags=0, payload_length=1400)
+        assembler.add_segment(up, 1, 110, 0, 1, 0, seq=2400, ack=1, flags=0, payload_length=1400)
+        # Retransmission of the second segment
+        assembler.add_segment(up, 2, 115, 0, 1, 0, seq=2400, ack=1, flags=0, payload_length=1400)
+        assembler.add_segment(up, 3, 120, 0, 1, 0, seq=3800, ack=1, flags=TCP_PSH, payload_length=200)
+        # Next write without PSH, then the server answers (ACK number moves)
+        assembler.add_segment(up, 4, 200, 0, 1, 0, seq=4000, ack=1, flags=0, payload_length=100)
+        assembler.add_segment(up, 5, 300, 0, 1, 0, seq=4100, ack=51, flags=0, payload_length=100)
+        messages = assembler.close()
+        self.assertEqual([3000, 100, 100], messages['bytes'].tolist())
+        self.assertEqual([3, 1, 1], messages['segments'].tolist())
+        self.assertEqual([(100, 120), (200, 200), (300, 300)],
+                         list(zip(messages['start_ns'].tolist(), messages['end_ns'].tolist())))
@@ -0,0 +1,362 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from src.utils.flows import FLOW_DTYPE, summarize_directions, summarize_flows
+from src.utils.messages import MESSAGE_DTYPE, MessageAssembler
+from src.utils.pcap_reader import (PCAP_RECORD_HEADER_LEN, Packet, PacketRecord, PcapPacket, PcapReader, TCP_ACK,
+                                   TCP_FIN, TCP_PSH, TCP_RST, TCP_SYN, from_epoch_ns, read_pcap, to_epoch_us)
+from src.utils.raw_data import PacketRef
+from src.utils.tls import TLS_APPLICATION_DATA_BIT, TLS_HANDSHAKE_BIT, TlsRecordTracker
+
+TABLE_SUFFIX = '.npz'
+# Bump when the decoding of any column changes, so that cached tables are rebuilt.
+TABLE_VERSION = 5
+
+PACKET_DTYPE = np.dtype([
+    ('time_ns', np.int64),
+    ('offset', np.int64),  # offset of the pcap record, -1 if the packet was not read from a pcap file
+    ('record_length', np.int32),  # bytes of the pcap record, header included, 0 if not read from a pcap file
+    ('src', np.int32),  # index into PacketTable.ips
+    ('dst', np.int32),
+    ('length', np.int32),  # frame.len
+    ('flags', np.uint8),  # TCP flag bits
+    ('tls_content_types', np.uint8),  # bitmask of the TLS record types in the packet, see src.utils.tls
+    ('ip_version', np.uint8),
+    ('stream', np.int32),  # TCP connection id, by unordered (ip, port) pair
+    ('flow', np.int32),  # index into PacketTable.flows, one per direction of a connection
+])
+
+
+class PacketTable:
+    """
+    The TCP packets of a capture, decoded once into columns (see PACKET_DTYPE).
+    Queries are numpy boolean masks over the rows; rows stay in capture order.
+    messages holds the application messages the packets were assembled into (see src.utils.messages),
+    flows the (src, src port, dst, dst port) of each flow id (see src.utils.flows).
+    """
+    packets: np.ndarray
+    flows: np.ndarray
+    messages: np.ndarray
+    ips: List[str]
+    pcap_path: str
+
+    def __init__(self, **kwargs):
+        self.packets = kwargs.get("packets")
+        if self.packets is None:
+            self.packets = np.zeros(0, dtype=PACKET_DTYPE)
+        self.flows = kwargs.get("flows")
+        if self.flows is None:
+            self.flows = np.zeros(0, dtype=FLOW_DTYPE)
+        self.messages = kwargs.get("messages")
+        if self.messages is None:
+            self.messages = np.zeros(0, dtype=MESSAGE_DTYPE)
+        self.ips = list(kwargs.get("ips") or [])
+        self.ip_ids = {ip: ip_id for ip_id, ip in enumerate(self.ips)}
+        self.pcap_path = kwargs.get("pcap_path")
+
+    def __len__(self):
+        return len(self.packets)
+
+    def get_ip_id(self, ip: str) -> int:
+        """
+        Returns:
+            The id of ip, or -1 (matches no row) if the capture never saw it.
+        """
+        return self.ip_ids.get(ip, -1)
+
+    def get_ip_ids(self, ips: Iterable[str]) -> np.ndarray:
+        return np.array([self.get_ip_id(ip) for ip in ips], dtype=np.int32)
+
+    def get_ip(self, ip_id: int) -> str:
+        return self.ips[ip_id]
+
+    def get_ips(self, ip_ids: np.ndarray) -> Set[str]:
+        return {self.ips[ip_id] for ip_id in np.unique(ip_ids)}
+
+    def get_raw_data(self, row: int) -> Union[PacketRef, None]:
+        """
+        Returns:
+            A reference to the pcap record of the row, or None if the table was not read from a pcap file.
+        """
+        offset = int(self.packets['offset'][row])
+        if offset < 0 or self.pcap_path is None:
+            return None
+        return PacketRef(self.pcap_path, offset, int(self.packets['record_length'][row]))
+
+    def get_time(self, row: int) -> datetime:
+        return from_epoch_ns(int(self.packets['time_ns'][row]))
+
+    def get_times(self, mask: np.ndarray) -> List[datetime]:
+        return [from_epoch_ns(ts_ns) for ts_ns in self.packets['time_ns'][mask].tolist()]
+
+    def get_window_mask(self, start_time: datetime = None, end_time: datetime = None) -> np.ndarray:
+        return get_time_window_mask(self.packets['time_ns'], start_time, end_time)
+
+    def get_ip_version_mask(self, ip_version_is_six: bool) -> np.ndarray:
+        return self.packets['ip_version'] == (6 if ip_version_is_six else 4)
+
+    def get_flag_mask(self, flag: int) -> np.ndarray:
+        return (self.packets['flags'] & flag) != 0
+
+    def get_ack_mask(self) -> np.ndarray:
+        """
+        Same as is_ack_pkt: ACK set and PSH not set.
+        """
+        return self.get_flag_mask(TCP_ACK) & ~self.get_flag_mask(TCP_PSH)
+
+    def get_data_mask(self) -> np.ndarray:
+        """
+        Same as is_data_pkt: the packet carries a TLS Application Data record.
+        """
+        return (self.packets['tls_content_types'] & TLS_APPLICATION_DATA_BIT) != 0
+
+    def get_tls_handshake_mask(self) -> np.ndarray:
+        return (self.packets['tls_content_types'] & TLS_HANDSHAKE_BIT) != 0
+
+    def get_ip_mask(self, column: str, ips) -> np.ndarray:
+        """
+        Args:
+            column: 'src' or 'dst'.
+            ips: an IP or a collection of IPs.
+        """
+        if isinstance(ips, str):
+            return self.packets[column] == self.get_ip_id(ips)
+        return np.isin(self.packets[column], self.get_ip_ids(ips))
+
+    def summarize_flows(self, mask: np.ndarray = None) -> np.ndarray:
+        """
+        Per-flow packet and byte counts, first/last timestamps and SYN/FIN/RST counts over the rows in mask.
+        """
+        return summarize_flows(self.packets if mask is None else self.packets[mask])
+
+    def summarize_directions(self, mask: np.ndarray = None) -> np.ndarray:
+        """
+        Same as summarize_flows, but for all the flows from one IP to another.
+        """
+        return summarize_directions(self.packets if mask is None else self.packets[mask])
+
+    def get_message_window_mask(self, start_time: datetime = None, end_time: datetime = None) -> np.ndarray:
+        """
+        Messages that start within the window.
+        """
+        return get_time_window_mask(self.messages['start_ns'], start_time, end_time)
+
+    def get_message_ip_mask(self, column: str, ips) -> np.ndarray:
+        if isinstance(ips, str):
+            return self.messages[column] == self.get_ip_id(ips)
+        return np.isin(self.messages[column], self.get_ip_ids(ips))
+
+    def get_message_times(self, mask: np.ndarray) -> List[datetime]:
+        return [from_epoch_ns(ts_ns) for ts_ns in self.messages['start_ns'][mask].tolist()]
+
+
+def get_time_window_mask(time_ns: np.ndarray, start_time: datetime = None, end_time: datetime = None) -> np.ndarray:
+    # Compare at microsecond precision, like frame.time filters and Packet.sniff_time
+    time_us = time_ns // 1000
+    mask = np.ones(len(time_ns), dtype=bool)
+    if start_time is not None:
+        mask &= time_us >= to_epoch_us(start_time)
+    if end_time is not None:
+        mask &= time_us <= to_epoch_us(end_time)
+    return mask
+
+
+def build_packet_table(packets: Iterable[Packet]) -> PacketTable:
+    """
+    Decode packets (see src.utils.pcap.iter_packets) into a PacketTable.
+    Messages are only assembled for packets of the native reader, pyshark records carry no sequence numbers.
+    """
+    ip_ids: Dict[str, int] = {}
+    stream_ids: Dict[Tuple, int] = {}
+    flow_ids: Dict[Tuple, int] = {}
+    tls_tracker = TlsRecordTracker()
+    message_assembler = MessageAssembler()
+    rows = []
+    for row, pkt in enumerate(packets):
+        src_ip_id = ip_ids.setdefault(pkt.src_ip, len(ip_ids))
+        dst_ip_id = ip_ids.setdefault(pkt.dst_ip, len(ip_ids))
+        if isinstance(pkt, PcapPacket):
+            ts_ns = pkt.capture.get_timestamp_ns(pkt.offset)
+            offset = pkt.offset
+            record_length = PCAP_RECORD_HEADER_LEN + len(pkt.frame)
+            flags = pkt.flags
+            src_port, dst_port = pkt.src_port, pkt.dst_port
+            tls_content_types = tls_tracker.classify((src_ip_id, src_port, dst_ip_id, dst_port), pkt.seq,
+                                                     pkt.payload_length, pkt.payload)
+            pkt.set_tls_content_types(tls_content_types)
+        else:
+            ts_ns = to_epoch_us(pkt.sniff_time) * 1000
+            offset = -1
+            record_length = 0
+            flags = ((TCP_SYN if pkt.flags_syn else 0) | (TCP_ACK if pkt.flags_ack else 0)
+                     | (TCP_FIN if pkt.flags_fin else 0) | (TCP_PSH if pkt.flags_push else 0)
+                     | (TCP_RST if pkt.flags_reset else 0))
+            src_port, dst_port = pkt.src_port, pkt.dst_port
+            tls_content_types = ((TLS_APPLICATION_DATA_BIT if pkt.is_app_data else 0)
+                                 | (TLS_HANDSHAKE_BIT if pkt.is_tls_handshake else 0))
+        endpoints = ((src_ip_id, src_port), (dst_ip_id, dst_port))
+        stream_id = stream_ids.setdefault((min(endpoints), max(endpoints)), len(stream_ids))
+        flow_id = flow_ids.setdefault((src_ip_id, dst_ip_id, src_port, dst_port, stream_id), len(flow_ids))
+        if isinstance(pkt, PcapPacket):
+            message_assembler.add_segment(endpoints, row, ts_ns, src_ip_id, dst_ip_id, stream_id, pkt.seq,
+                                          pkt.ack_seq, flags, pkt.payload_length)
+        rows.append((ts_ns, offset, record_length, src_ip_id, dst_ip_id, pkt.length, flags, tls_content_types,
+                     pkt.ip_version, stream_id, flow_id))
+    return PacketTable(packets=np.array(rows, dtype=PACKET_DTYPE), flows=np.array(list(flow_ids), dtype=FLOW_DTYPE),
+                       messages=message_assembler.close(), ips=list(ip_ids))
+
+
+def get_table_path(pcap_path: str) -> str:
+    return pcap_path + TABLE_SUFFIX
+
+
+def hash_file(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def read_packet_table(table_path: str, pcap_path: str) -> Optional[PacketTable]:
+    """
+    Returns:
+        The table cached at table_path, or None if it is missing or stale.
+        A table whose pcap only changed mtime (same size and hash) is still valid.
+    """
+    try:
+        with np.load(table_path) as data:
+            version, size, mtime_ns = data['meta'].tolist()
+            file_hash = str(data['hash'])
+            packets = data['packets']
+            flows = data['flows']
+            messages = data['messages']
+            ips = data['ips'].tolist()
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        return None
+    stat = os.stat(pcap_path)
+    if version != TABLE_VERSION or size != stat.st_size:
+        return None
+    if mtime_ns != stat.st_mtime_ns:
+        if file_hash != hash_file(pcap_path):
+            return None
+        write_packet_table(table_path, pcap_path,
+                           PacketTable(packets=packets, flows=flows, messages=messages, ips=ips), file_hash=file_hash)
+    return PacketTable(packets=packets, flows=flows, messages=messages, ips=ips)
+
+
+def write_packet_table(table_path: str, pcap_path: str, table: PacketTable, file_hash: str = None):
+    stat = os.stat(pcap_path)
+    # np.savez appends .npz to names that lack it, keep the temporary name ending with it
+    tmp_path = '{}.{}.tmp.npz'.format(table_path[:-len(TABLE_SUFFIX)], os.getpid())
+    np.savez(
+        tmp_path,
+        meta=np.array([TABLE_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64),
+        hash=np.array(file_hash or hash_file(pcap_path)),
+        packets=table.packets,
+        flows=table.flows,
+        messages=table.messages,
+        ips=np.array(table.ips, dtype=str),
+    )
+    os.replace(tmp_path, table_path)
+
+
+def load_packet_table(pcap_path: str) -> PacketTable:
+    """
+    Load the packet table of a pcap file, decoding it with the native reader and caching it next to
+    the capture (capture.pcap.npz) on first use.
+    """
+    table_path = get_table_path(pcap_path)
+    table = read_packet_table(table_path, pcap_path)
+    if table is None:
+        with PcapReader(pcap_path) as reader:
+            table = build_packet_table(reader)
+        try:
+            write_packet_table(table_path, pcap_path, table)
+        except OSError as e:
+            print('Cannot write packet table {} ({})'.format(table_path, e))
+    table.pcap_path = pcap_path
+    return table
+
+
+def read_classified_pcap(pcap_path: str, start_time: datetime = None,
+                         end_time: datetime = None) -> Iterator[PcapPacket]:
+    """
+    Same as read_pcap, but the TLS content types of the packets are the ones of the packet table (see
+    load_packet_table), whose TlsRecordTracker followed the records of each direction from the start of the
+    capture. A packet read alone, e.g. the first one of a time window, may start in the middle of a record.
+    """
+    table = load_packet_table(pcap_path)
+    offsets = table.packets['offset']
+    content_types = table.packets['tls_content_types']
+    for pkt in read_pcap(pcap_path, start_time=start_time, end_time=end_time):
+        row = int(np.searchsorted(offsets, pkt.offset))
+        if row < len(offsets) and offsets[row] == pkt.offset:
+            pkt.set_tls_content_types(int(content_types[row]))
+        yield pkt
+
+
+class PacketTableUnitTest(unittest.TestCase):
+    def setUp(self):
+        start = datetime(2023, 4, 7, 15, 34, 34)
+        self.start = start
+        self.table = build_packet_table([
+            PacketRecord(sniff_time=start, length=80, ip_version=6, src_ip='a', dst_ip='b', flags_syn=1),
+            PacketRecord(sniff_time=start + timedelta(seconds=1), length=300, ip_version=6, src_ip='b',
+                         dst_ip='a', flags_ack=1, flags_push=1, is_app_data=True),
+            PacketRecord(sniff_time=start + timedelta(seconds=2), length=60, ip_version=4, src_ip='a', dst_ip='c',
+                         flags_ack=1),
+        ])
+
+    def test_window_mask(self):
+        mask = self.table.get_window_mask(self.start + timedelta(seconds=1), self.start + timedelta(seconds=2))
+        self.assertEqual([False, True, True], mask.tolist())
+        self.assertEqual(self.start + timedelta(seconds=1), self.table.get_time(1))
+
+    def test_packet_masks(self):
+        self.assertEqual([False, True, False], self.table.get_data_mask().tolist())
+        self.assertEqual([False, False, True], self.table.get_ack_mask().tolist())
+        self.assertEqual([True, False, True], self.table.get_ip_mask('src', 'a').tolist())
+        self.assertEqual([True, False, True], self.table.get_ip_mask('dst', {'b', 'c'}).tolist())
+        self.assertEqual([False, False, False], self.table.get_ip_mask('src', 'unknown').tolist())
+        self.assertEqual({'b', 'c'}, self.table.get_ips(self.table.packets['dst'][self.table.get_ip_mask('src', 'a')]))
+
+    def test_truncated_table(self):
+        with tempfile.TemporaryDirectory() as dir_path:
+            pcap_path = os.path.join(dir_path, 'capture.pcap')
+            with open(pcap_path, 'wb') as f:
+                f.write(b'\0' * 24)
+            table_path = get_table_path(pcap_path)
+            write_packet_table(table_path, pcap_path, self.table)
+            self.assertEqual(3, len(read_packet_table(table_path, pcap_path).packets))
+            size = os.path.getsize(table_path)
+            for length in (size // 2, 10, 0):
+                with open(table_path, 'r+b') as f:
+                    f.truncate(length)
+                self.assertIsNone(read_packet_table(table_path, pcap_path))
+
+    def test_classified_pcap(self):
+        path = os.path.join(os.path.dirname(__file__), '..', '..', 'datasets', '5g-static-line', 'host', 'run1',
+                            'capture.pcap')
+        if not os.path.isfile(path):
+            self.skipTest('no dataset')
+        with tempfile.TemporaryDirectory() as dir_path:
+            pcap_path = os.path.join(dir_path, 'capture.pcap')
+            shutil.copyfile(path, pcap_path)
+            table = load_packet_table(pcap_path)
+            # Classifications only the table has
+            table.packets['tls_content_types'] = np.arange(len(table.packets)) % 7
+            write_packet_table(get_table_path(pcap_path), pcap_path, table)
+            start_time, end_time = table.get_time(10), table.get_time(20)
+            window = table.get_window_mask(start_time, end_time)
+            packets = list(read_classified_pcap(pcap_path, start_time, end_time))
+            self.assertEqual(table.packets['offset'][window].tolist(), [pkt.offset for pkt in packets])
+            self.assertEqual((np.flatnonzero(window) % 7).tolist(), [pkt.get_tls_content_types() for pkt in packets])
@@ -1,7 +1,190 @@
+import subprocess
+import unittest
+from datetime import datetime
+from typing import Iterator, List
+from unittest import mock
+
 import pyshark
+from pyshark.tshark.tshark import get_process_path
+
+from src.constants import DATETIME_FORMAT
+from src.utils.packet_table import read_classified_pcap
+from src.utils.pcap_reader import Packet, PacketRecord, TCP_ACK, TCP_FIN, TCP_PSH, TCP_RST, TCP_SYN, from_epoch_ns
+from src.utils.tls import TLS_APPLICATION_DATA_BIT, TLS_HANDSHAKE_BIT, get_content_type_bit
+
+PCAP_BACKENDS = ('native', 'pyshark', 'fields')
+# Backends whose packets carry sequence numbers, so that their packet tables have messages (see src.utils.messages)
+MESSAGE_BACKENDS = ('native',)
+
+# Fields requested from `tshark -T fields`, in the order of the output columns
+TSHARK_FIELDS = (
+    'frame.time_epoch',
+    'frame.len',
+    'ip.src',
+    'ip.dst',
+    'ipv6.src',
+    'ipv6.dst',
+    'tcp.srcport',
+    'tcp.dstport',
+    'tcp.flags',
+    'tls.record.content_type',
+)
+
+
+def get_pyshark_tls_content_types(pkt) -> int:
+    """
+    Bitmask of the TLS record types of a pyshark packet (see src.utils.tls), read from the
+    tls.record.content_type fields instead of rendering the whole layer. Cached on the packet.
+    """
+    content_types = getattr(pkt, 'tls_content_types', None)
+    if content_types is None:
+        content_types = 0
+        if 'tls' in pkt:
+            for layer in pkt.get_multiple_layers('tls'):
+                field = layer.get_field('record_content_type')
+                if field is None:
+                    continue
+                for content_type in field.all_fields:
+                    content_types |= get_content_type_bit(int(content_type.show))
+        pkt.tls_content_types = content_types
+    return content_types
+
+
+def packet_record_from_pyshark(pkt) -> PacketRecord:
+    """
+    Copy the fields we need out of a pyshark TCP packet.
+    """
+    tls_content_types = get_pyshark_tls_content_types(pkt)
+    return PacketRecord(
+        sniff_time=pkt.sniff_time,
+        length=int(pkt.length),
+        ip_version=4 if 'ip' in pkt else 6,
+        src_ip=get_ip(pkt, type='src'),
+        dst_ip=get_ip(pkt, type='dst'),
+        flags_syn=int(pkt.tcp.flags_syn),
+        flags_ack=int(pkt.tcp.flags_ack),
+        flags_fin=int(pkt.tcp.flags_fin),
+        flags_push=int(pkt.tcp.flags_push),
+        flags_reset=int(pkt.tcp.flags_reset),
+        src_port=int(pkt.tcp.srcport),
+        dst_port=int(pkt.tcp.dstport),
+        is_app_data=(tls_content_types & TLS_APPLICATION_DATA_BIT) != 0,
+        is_tls_handshake=(tls_content_types & TLS_HANDSHAKE_BIT) != 0,
+    )
+
+
+def parse_epoch_ns(time_epoch: str) -> int:
+    """
+    Parse frame.time_epoch ("1680896216.665927000") without going through a float.
+    """
+    seconds, _, fraction = time_epoch.partition('.')
+    return int(seconds) * 1000000000 + int(fraction[:9].ljust(9, '0'))
+
+
+def packet_record_from_fields(line: str) -> PacketRecord:
+    """
+    Parse a line of `tshark -T fields` output with the columns of TSHARK_FIELDS.
+    Fields that occur several times in a packet (e.g. one TLS content type per record) are separated by commas.
+    """
+    time_epoch, length, ip_src, ip_dst, ipv6_src, ipv6_dst, src_port, dst_port, flags, content_types = \
+        line.rstrip('\n').split('\t')
+    tls_content_types = 0
+    for content_type in filter(None, content_types.split(',')):
+        tls_content_types |= get_content_type_bit(int(content_type))
+    flags = int(flags, 16)
+    # Only the outer IP header is ours, an inner one would come from an ICMP error
+    ip_version = 4 if ip_src else 6
+    return PacketRecord(
+        sniff_time=from_epoch_ns(parse_epoch_ns(time_epoch)),
+        length=int(length),
+        ip_version=ip_version,
+        src_ip=(ip_src or ipv6_src).split(',')[0],
+        dst_ip=(ip_dst or ipv6_dst).split(',')[0],
+        src_port=int(src_port.split(',')[0]),
+        dst_port=int(dst_port.split(',')[0]),
+        flags_syn=1 if flags & TCP_SYN else 0,
+        flags_ack=1 if flags & TCP_ACK else 0,
+        flags_fin=1 if flags & TCP_FIN else 0,
+        flags_push=1 if flags & TCP_PSH else 0,
+        flags_reset=1 if flags & TCP_RST else 0,
+        is_app_data=(tls_content_types & TLS_APPLICATION_DATA_BIT) != 0,
+        is_tls_handshake=(tls_content_types & TLS_HANDSHAKE_BIT) != 0,
+    )
+
+
+def get_display_filter(start_time: datetime = None, end_time: datetime = None) -> str:
+    display_filters = ['tcp']
+    if start_time is not None:
+        display_filters.append('frame.time >= "{st}"'.format(st=start_time.strftime(DATETIME_FORMAT)))
+    if end_time is not None:
+        display_filters.append('frame.time <= "{et}"'.format(et=end_time.strftime(DATETIME_FORMAT)))
+    return ' && '.join(display_filters)
+
+
+def get_tshark_fields_command(pcap_path: str, display_filter: str) -> List[str]:
+    command = [get_process_path(), '-n', '-r', pcap_path, '-Y', display_filter, '-T', 'fields',
+               '-E', 'separator=/t', '-E', 'occurrence=a', '-E', 'aggregator=,']
+    for field in TSHARK_FIELDS:
+        command.extend(['-e', field])
+    return command
+
+
+def iter_tshark_fields(pcap_path: str, start_time: datetime = None, end_time: datetime = None) -> Iterator[Packet]:
+    """
+    Dissect a pcap file with tshark, but only print the fields of TSHARK_FIELDS and parse them while tshark runs,
+    instead of building the full PDML tree of each packet like pyshark.
+    """
+    process = subprocess.Popen(get_tshark_fields_command(pcap_path, get_display_filter(start_time, end_time)),
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    try:
+        for line in process.stdout:
+            yield packet_record_from_fields(line)
+        stderr = process.stderr.read()
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        process.stderr.close()
+    if process.returncode != 0:
+        raise RuntimeError('tshark failed on {} ({})'.format(pcap_path, stderr.strip()))
+
+
+def iter_packets(pcap_path: str, backend: str = 'native', start_time: datetime = None,
+                 end_time: datetime = None) -> Iterator[Packet]:
+    """
+    Iterate over the TCP packets of a pcap file.
+    Args:
+        pcap_path: path of the pcap file.
+        backend: 'native' decodes the file with src.utils.pcap_reader, with the TLS content types of its packet
+            table (see read_classified_pcap), 'pyshark' dissects it with tshark,
+            'fields' dissects it with tshark too but only extracts the fields we read (see iter_tshark_fields).
+        start_time: if given, skip packets captured before it.
+        end_time: if given, skip packets captured after it.
+    """
+    if backend == 'native':
+        yield from read_classified_pcap(pcap_path, start_time=start_time, end_time=end_time)
+    elif backend == 'pyshark':
+        cap = pyshark.FileCapture(pcap_path, display_filter=get_display_filter(start_time, end_time))
+        try:
+            for pkt in cap:
+                yield packet_record_from_pyshark(pkt)
+        finally:
+            # Stops tshark even if the caller does not read every packet
+            cap.close()
+    elif backend == 'fields':
+        yield from iter_tshark_fields(pcap_path, start_time=start_time, end_time=end_time)
+    else:
+        raise ValueError('Unknown pcap backend: {}, expected one of {}'.format(backend, PCAP_BACKENDS))
 
 
 def get_ip(pkt, type: str):
+    if isinstance(pkt, Packet):
+        if type == 'src':
+            return pkt.src_ip
+        elif type == 'dst':
+            return pkt.dst_ip
+        return None
     if type == 'src':
         if 'ip' in pkt:
             return pkt.ip.src
@@ -27,14 +210,18 @@ def filter_ip(ip: str, type: str):
 
 
 def is_data_pkt(pkt, min_size=0, src=None, dst=None):
-    data_pkt_flag = False
-    if 'tls' in pkt:
-        data_pkt_flag = 'Application Data' in str(pkt.tls)
+    if isinstance(pkt, Packet):
+        data_pkt_flag = pkt.is_app_data
+    else:
+        data_pkt_flag = (get_pyshark_tls_content_types(pkt) & TLS_APPLICATION_DATA_BIT) != 0
     return data_pkt_flag and is_pkt(pkt, min_size, src, dst)
 
 
 def is_ack_pkt(pkt, min_size=0, src=None, dst=None):
-    ack_pkt_flag = 'TCP' in pkt and int(pkt.tcp.flags_ack) == 1 and int(pkt.tcp.flags_push) == 0
+    if isinstance(pkt, Packet):
+        ack_pkt_flag = pkt.flags_ack == 1 and pkt.flags_push == 0
+    else:
+        ack_pkt_flag = 'TCP' in pkt and int(pkt.tcp.flags_ack) == 1 and int(pkt.tcp.flags_push) == 0
     return ack_pkt_flag and is_pkt(pkt, min_size, src, dst)
 
 
@@ -73,3 +260,37 @@ def extract_phone_ip(pcap_file):
         phone_ip = get_ip(pkt, type='src')
         break
     return phone_ip
+
+
+class TsharkFieldsUnitTest(unittest.TestCase):
+    def test_packet_record_from_fields(self):
+        pkt = packet_record_from_fields('1680896216.665927123\t583\t\t\t2600:1000::1\t2607:f8b0::2\t'
+                                        '40512\t443\t0x0018\t23,23\n')
+        self.assertEqual(6, pkt.ip_version)
+        self.assertEqual(('2600:1000::1', '2607:f8b0::2'), (pkt.src_ip, pkt.dst_ip))
+        self.assertEqual((40512, 443), (pkt.src_port, pkt.dst_port))
+        self.assertEqual((1, 1, 0, 0), (pkt.flags_ack, pkt.flags_push, pkt.flags_syn, pkt.flags_reset))
+        self.assertTrue(pkt.is_app_data)
+        self.assertFalse(pkt.is_tls_handshake)
+        self.assertEqual(665927, pkt.sniff_time.microsecond)
+
+        pkt = packet_record_from_fields('1680896216.5\t74\t10.0.0.2\t142.250.81.234\t\t\t40512\t443\t0x0002\t\n')
+        self.assertEqual((4, '10.0.0.2', 1, 0), (pkt.ip_version, pkt.src_ip, pkt.flags_syn, pkt.flags_ack))
+        self.assertEqual(500000, pkt.sniff_time.microsecond)
+
+        # Content types out of the mask (e.g. a record misdissected from garbage) are ignored
+        pkt = packet_record_from_fields('1680896216.5\t583\t10.0.0.2\t10.0.0.3\t\t\t40512\t443\t0x0018\t'
+                                        '255,23,5\n')
+        self.assertTrue(pkt.is_app_data)
+        self.assertFalse(pkt.is_tls_handshake)
+
+    def test_pyshark_closed_early(self):
+        cap = mock.MagicMock()
+        cap.__iter__.return_value = iter([object(), object()])
+        with mock.patch.object(pyshark, 'FileCapture', return_value=cap), \
+                mock.patch(__name__ + '.packet_record_from_pyshark', side_effect=lambda pkt: pkt):
+            packets = iter_packets('capture.pcap', backend='pyshark')
+            next(packets)
+            cap.close.assert_not_called()
+            packets.close()
+        cap.close.assert_called_once_with()
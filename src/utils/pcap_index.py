@@ -0,0 +1,143 @@
+import bisect
+import os
+import struct
+from typing import List, Tuple
+
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'PIDX'
+INDEX_VERSION = 1
+# One index entry every N packets.
+INDEX_EVERY = 256
+
+# magic, version, every, file size, file mtime (ns), entry count
+INDEX_HEADER = struct.Struct('<4sIIQqI')
+# max timestamp before the entry, min timestamp from the entry on (both epoch ns), record offset
+INDEX_ENTRY = struct.Struct('<qqQ')
+
+
+class PcapIndex:
+    """
+    Sparse timestamp -> byte offset index of a pcap file.
+    Every INDEX_EVERY packets we keep the offset of the record header, together with
+    the largest timestamp seen before it and the smallest timestamp from it on.
+    Both bounds are monotonic even if the capture is slightly out of order, so a time
+    window maps to a contiguous byte range by two bisections.
+    """
+    prefix_max_ns: List[int]
+    suffix_min_ns: List[int]
+    offsets: List[int]
+
+    def __init__(self, **kwargs):
+        self.prefix_max_ns = kwargs.get("prefix_max_ns") or []
+        self.suffix_min_ns = kwargs.get("suffix_min_ns") or []
+        self.offsets = kwargs.get("offsets") or []
+        self.end_offset = kwargs.get("end_offset")
+
+    def get_byte_range(self, start_ns: int = None, end_ns: int = None) -> Tuple[int, int]:
+        """
+        Returns:
+            (start offset, end offset) of the records that may fall within [start_ns, end_ns].
+        """
+        start_offset = self.offsets[0]
+        end_offset = self.end_offset
+        if start_ns is not None:
+            # Last entry before which every timestamp is < start_ns
+            index = bisect.bisect_left(self.prefix_max_ns, start_ns) - 1
+            if index > 0:
+                start_offset = self.offsets[index]
+        if end_ns is not None:
+            # First entry from which every timestamp is > end_ns
+            index = bisect.bisect_right(self.suffix_min_ns, end_ns)
+            if index < len(self.offsets):
+                end_offset = self.offsets[index]
+        return start_offset, end_offset
+
+
+def get_index_path(pcap_path: str) -> str:
+    return pcap_path + INDEX_SUFFIX
+
+
+def build_pcap_index(reader) -> PcapIndex:
+    """
+    Scan the record headers of a PcapReader, without decoding any packet.
+    """
+    prefix_max_ns = []
+    offsets = []
+    timestamps = []
+    max_ns = -1
+    for count, (offset, ts_ns) in enumerate(reader.iter_record_headers()):
+        if count % INDEX_EVERY == 0:
+            prefix_max_ns.append(max_ns)
+            offsets.append(offset)
+            timestamps.append(ts_ns)
+        else:
+            timestamps[-1] = min(timestamps[-1], ts_ns)
+        max_ns = max(max_ns, ts_ns)
+
+    # Turn the per-block minimum into the minimum of everything from the block on
+    suffix_min_ns = timestamps
+    for index in range(len(suffix_min_ns) - 2, -1, -1):
+        suffix_min_ns[index] = min(suffix_min_ns[index], suffix_min_ns[index + 1])
+
+    if not offsets:
+        offsets.append(reader.end_offset)
+        prefix_max_ns.append(max_ns)
+        suffix_min_ns.append(max_ns)
+    return PcapIndex(prefix_max_ns=prefix_max_ns, suffix_min_ns=suffix_min_ns, offsets=offsets,
+                     end_offset=reader.end_offset)
+
+
+def read_pcap_index(index_path: str, file_size: int, file_mtime_ns: int) -> PcapIndex:
+    """
+    Returns:
+        The index stored at index_path, or None if it is missing or was built for another version of the pcap.
+    """
+    try:
+        with open(index_path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < INDEX_HEADER.size:
+        return None
+    magic, version, every, size, mtime_ns, count = INDEX_HEADER.unpack_from(data)
+    if (magic, version, every, size, mtime_ns) != (INDEX_MAGIC, INDEX_VERSION, INDEX_EVERY, file_size,
+                                                   file_mtime_ns):
+        return None
+    if len(data) != INDEX_HEADER.size + count * INDEX_ENTRY.size:
+        return None
+    entries = list(INDEX_ENTRY.iter_unpack(data[INDEX_HEADER.size:]))
+    return PcapIndex(
+        prefix_max_ns=[entry[0] for entry in entries],
+        suffix_min_ns=[entry[1] for entry in entries],
+        offsets=[entry[2] for entry in entries],
+        end_offset=file_size,
+    )
+
+
+def write_pcap_index(index_path: str, index: PcapIndex, file_size: int, file_mtime_ns: int):
+    entries = zip(index.prefix_max_ns, index.suffix_min_ns, index.offsets)
+    data = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, INDEX_EVERY, file_size, file_mtime_ns,
+                             len(index.offsets))
+    data += b''.join(INDEX_ENTRY.pack(*entry) for entry in entries)
+    # Write then rename, so that a concurrent reader never sees a partial index
+    tmp_path = '{}.{}.tmp'.format(index_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, index_path)
+
+
+def load_pcap_index(reader) -> PcapIndex:
+    """
+    Load the sidecar index of a PcapReader's file, building and storing it next to the capture on first use.
+    If the directory is read-only, the index is only kept in memory.
+    """
+    stat = os.stat(reader.pcap_path)
+    index_path = get_index_path(reader.pcap_path)
+    index = read_pcap_index(index_path, stat.st_size, stat.st_mtime_ns)
+    if index is None:
+        index = build_pcap_index(reader)
+        try:
+            write_pcap_index(index_path, index, stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            print('Cannot write pcap index {} ({})'.format(index_path, e))
+    return index
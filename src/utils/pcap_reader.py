@@ -0,0 +1,414 @@
+import mmap
+import socket
+import struct
+from datetime import datetime
+from typing import Dict, Iterator, Tuple, Union
+
+from src.utils.pcap_index import load_pcap_index
+from src.utils.tls import TLS_APPLICATION_DATA_BIT, TLS_HANDSHAKE_BIT, scan_tls_records
+
+# pcap magic numbers, as read with little-endian byte order.
+PCAP_MAGIC_MICROSECOND = 0xa1b2c3d4
+PCAP_MAGIC_NANOSECOND = 0xa1b23c4d
+PCAP_MAGIC_MICROSECOND_SWAPPED = 0xd4c3b2a1
+PCAP_MAGIC_NANOSECOND_SWAPPED = 0x4d3cb2a1
+
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+
+IP_PROTO_TCP = 6
+# IPv6 extension headers that we step over to reach TCP.
+IPV6_EXTENSION_HEADERS = {0, 43, 60}
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+
+PCAP_GLOBAL_HEADER_LEN = 24
+PCAP_RECORD_HEADER_LEN = 16
+
+
+class Packet:
+    """
+    The few fields of a captured TCP packet that this project reads.
+    Implemented by PacketRecord (decoded eagerly, e.g. from pyshark) and PcapPacket (decoded lazily from a mapping).
+    """
+    __slots__ = ()
+    sniff_time: datetime
+    length: int
+    ip_version: int
+    src_ip: str
+    dst_ip: str
+    src_port: int
+    dst_port: int
+    flags_syn: int
+    flags_ack: int
+    flags_fin: int
+    flags_push: int
+    flags_reset: int
+    is_app_data: bool
+    is_tls_handshake: bool
+
+
+class PacketRecord(Packet):
+    """
+    A detached copy of the packet fields, so that a capture can be dissected once and
+    then queried many times without going back to tshark.
+    """
+    __slots__ = ('sniff_time', 'length', 'ip_version', 'src_ip', 'dst_ip', 'src_port', 'dst_port', 'flags_syn',
+                 'flags_ack', 'flags_fin', 'flags_push', 'flags_reset', 'is_app_data', 'is_tls_handshake')
+
+    def __init__(self, **kwargs):
+        self.sniff_time = kwargs.get("sniff_time")
+        self.length = kwargs.get("length") or 0
+        self.ip_version = kwargs.get("ip_version")
+        self.src_ip = kwargs.get("src_ip")
+        self.dst_ip = kwargs.get("dst_ip")
+        self.src_port = kwargs.get("src_port") or 0
+        self.dst_port = kwargs.get("dst_port") or 0
+        self.flags_syn = kwargs.get("flags_syn") or 0
+        self.flags_ack = kwargs.get("flags_ack") or 0
+        self.flags_fin = kwargs.get("flags_fin") or 0
+        self.flags_push = kwargs.get("flags_push") or 0
+        self.flags_reset = kwargs.get("flags_reset") or 0
+        self.is_app_data = kwargs.get("is_app_data") or False
+        self.is_tls_handshake = kwargs.get("is_tls_handshake") or False
+
+
+class PcapPacket(Packet):
+    """
+    A TCP packet inside a memory-mapped pcap file.
+    It only keeps offsets and a memoryview of the frame; the fields are decoded on first access.
+    """
+    __slots__ = ('capture', 'offset', 'frame', 'length', 'ip_version', 'ip_offset', 'tcp_offset',
+                 '_sniff_time', '_tls_content_types')
+
+    def __init__(self, capture: 'PcapReader', offset: int, frame: memoryview, length: int, ip_version: int,
+                 ip_offset: int, tcp_offset: int):
+        self.capture = capture
+        # Offset of the pcap record header in the file
+        self.offset = offset
+        self.frame = frame
+        self.length = length
+        self.ip_version = ip_version
+        self.ip_offset = ip_offset
+        self.tcp_offset = tcp_offset
+        self._sniff_time = None
+        self._tls_content_types = None
+
+    @property
+    def sniff_time(self) -> datetime:
+        if self._sniff_time is None:
+            self._sniff_time = self.capture.get_sniff_time(self.offset)
+        return self._sniff_time
+
+    @property
+    def src_ip(self) -> str:
+        if self.ip_version == 4:
+            return self.capture.format_ip(socket.AF_INET, self.frame[self.ip_offset + 12:self.ip_offset + 16])
+        return self.capture.format_ip(socket.AF_INET6, self.frame[self.ip_offset + 8:self.ip_offset + 24])
+
+    @property
+    def dst_ip(self) -> str:
+        if self.ip_version == 4:
+            return self.capture.format_ip(socket.AF_INET, self.frame[self.ip_offset + 16:self.ip_offset + 20])
+        return self.capture.format_ip(socket.AF_INET6, self.frame[self.ip_offset + 24:self.ip_offset + 40])
+
+    @property
+    def src_port(self) -> int:
+        return (self.frame[self.tcp_offset] << 8) | self.frame[self.tcp_offset + 1]
+
+    @property
+    def dst_port(self) -> int:
+        return (self.frame[self.tcp_offset + 2] << 8) | self.frame[self.tcp_offset + 3]
+
+    @property
+    def flags(self) -> int:
+        return self.frame[self.tcp_offset + 13]
+
+    @property
+    def flags_syn(self) -> int:
+        return 1 if self.flags & TCP_SYN else 0
+
+    @property
+    def flags_ack(self) -> int:
+        return 1 if self.flags & TCP_ACK else 0
+
+    @property
+    def flags_fin(self) -> int:
+        return 1 if self.flags & TCP_FIN else 0
+
+    @property
+    def flags_push(self) -> int:
+        return 1 if self.flags & TCP_PSH else 0
+
+    @property
+    def flags_reset(self) -> int:
+        return 1 if self.flags & TCP_RST else 0
+
+    @property
+    def seq(self) -> int:
+        return int.from_bytes(self.frame[self.tcp_offset + 4:self.tcp_offset + 8], 'big')
+
+    @property
+    def ack_seq(self) -> int:
+        return int.from_bytes(self.frame[self.tcp_offset + 8:self.tcp_offset + 12], 'big')
+
+    @property
+    def payload_offset(self) -> int:
+        return self.tcp_offset + (self.frame[self.tcp_offset + 12] >> 4) * 4
+
+    @property
+    def payload(self) -> memoryview:
+        """
+        The captured part of the TCP payload.
+        """
+        return self.frame[self.payload_offset:]
+
+    @property
+    def payload_length(self) -> int:
+        """
+        Length of the TCP payload on the wire, which is usually more than what the snaplen let us capture.
+        """
+        return max(0, self.length - self.payload_offset)
+
+    def get_tls_content_types(self) -> int:
+        """
+        Bitmask of the TLS record types whose header is in the packet, see src.utils.tls.
+        Without the packets before it, a packet is assumed to start at a record boundary, so this is a
+        per-segment best effort for packets read alone (e.g. PacketRef.load); build_packet_table classifies
+        packets in order with a TlsRecordTracker and stores the result here, and iter_packets reads
+        it back from the packet table (see src.utils.packet_table.read_classified_pcap).
+        """
+        if self._tls_content_types is None:
+            self._tls_content_types = scan_tls_records(self.payload)[0]
+        return self._tls_content_types
+
+    def set_tls_content_types(self, content_types: int):
+        self._tls_content_types = content_types
+
+    @property
+    def is_app_data(self) -> bool:
+        return (self.get_tls_content_types() & TLS_APPLICATION_DATA_BIT) != 0
+
+    @property
+    def is_tls_handshake(self) -> bool:
+        return (self.get_tls_content_types() & TLS_HANDSHAKE_BIT) != 0
+
+
+def read_pcap_header(header: bytes) -> Tuple[str, int, int]:
+    """
+    Parse the global header of a classic libpcap file.
+    Returns:
+        (byte order for struct, timestamp fraction divisor to microseconds, link type)
+    """
+    magic, = struct.unpack('<I', header[:4])
+    if magic in (PCAP_MAGIC_MICROSECOND, PCAP_MAGIC_NANOSECOND):
+        endian = '<'
+    elif magic in (PCAP_MAGIC_MICROSECOND_SWAPPED, PCAP_MAGIC_NANOSECOND_SWAPPED):
+        endian = '>'
+    else:
+        raise ValueError('Not a libpcap file (magic {:#x}); pcapng is not supported'.format(magic))
+    is_nanosecond = magic in (PCAP_MAGIC_NANOSECOND, PCAP_MAGIC_NANOSECOND_SWAPPED)
+    link_type, = struct.unpack(endian + 'I', header[20:24])
+    return endian, 1000 if is_nanosecond else 1, link_type
+
+
+def get_link_payload(link_type: int, frame: Union[bytes, memoryview]) -> Tuple[int, int]:
+    """
+    Returns:
+        (ethertype, offset of the network layer) of a frame, or (-1, -1) for unsupported link types.
+    """
+    if link_type == LINKTYPE_LINUX_SLL2:
+        if len(frame) < 20:
+            return -1, -1
+        return (frame[0] << 8) | frame[1], 20
+    if link_type == LINKTYPE_LINUX_SLL:
+        if len(frame) < 16:
+            return -1, -1
+        return (frame[14] << 8) | frame[15], 16
+    return -1, -1
+
+
+class PcapReader:
+    """
+    Memory-mapped libpcap file.
+    Iterating over it yields PcapPacket views into the mapping, so packet bytes are paged in
+    by the OS and never copied into per-packet objects.
+    Only the Linux cooked capture link types used by our datasets are supported;
+    frames of any other protocol (e.g. the rmnet MAP duplicates) are skipped like tshark does.
+    """
+
+    def __init__(self, pcap_path: str):
+        self.pcap_path = pcap_path
+        with open(pcap_path, 'rb') as f:
+            header = f.read(PCAP_GLOBAL_HEADER_LEN)
+            self.endian, self.fraction_divisor, self.link_type = read_pcap_header(header)
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.buffer)
+        self.end_offset = len(self.buffer)
+        self.record_header = struct.Struct(self.endian + 'IIII')
+        self.ip_cache: Dict[bytes, str] = {}
+        self.index = None
+
+    def close(self):
+        """
+        Unmap the file. Packets still referencing the mapping keep it alive: it is unmapped once they are freed.
+        """
+        self.view.release()
+        try:
+            self.buffer.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def format_ip(self, family, raw: memoryview) -> str:
+        key = raw.tobytes()
+        ip = self.ip_cache.get(key)
+        if ip is None:
+            ip = socket.inet_ntop(family, key)
+            self.ip_cache[key] = ip
+        return ip
+
+    def get_sniff_time(self, offset: int) -> datetime:
+        ts_sec, ts_fraction, _, _ = self.record_header.unpack_from(self.buffer, offset)
+        return datetime.fromtimestamp(ts_sec).replace(microsecond=ts_fraction // self.fraction_divisor)
+
+    def get_timestamp_ns(self, offset: int) -> int:
+        ts_sec, ts_fraction, _, _ = self.record_header.unpack_from(self.buffer, offset)
+        return ts_sec * 1000000000 + ts_fraction * (1000 // self.fraction_divisor)
+
+    def iter_record_headers(self) -> Iterator[Tuple[int, int]]:
+        """
+        Returns:
+            An iterator of (record offset, epoch ns timestamp) of all the records.
+        """
+        unpack_record_header = self.record_header.unpack_from
+        fraction_ns = 1000 // self.fraction_divisor
+        offset = PCAP_GLOBAL_HEADER_LEN
+        while offset + PCAP_RECORD_HEADER_LEN <= self.end_offset:
+            ts_sec, ts_fraction, captured_length, _ = unpack_record_header(self.buffer, offset)
+            yield offset, ts_sec * 1000000000 + ts_fraction * fraction_ns
+            offset += PCAP_RECORD_HEADER_LEN + captured_length
+
+    def get_index(self):
+        if self.index is None:
+            self.index = load_pcap_index(self)
+        return self.index
+
+    def __iter__(self) -> Iterator[PcapPacket]:
+        return self.iter_packets()
+
+    def iter_packets(self, start_time: datetime = None, end_time: datetime = None) -> Iterator[PcapPacket]:
+        """
+        Iterate over the TCP packets, optionally only those within [start_time, end_time].
+        A time window seeks to its first record through the sidecar index (see src.utils.pcap_index)
+        and stops at its last one, instead of reading the whole file.
+        """
+        offset = PCAP_GLOBAL_HEADER_LEN
+        end = self.end_offset
+        start_us = None if start_time is None else to_epoch_us(start_time)
+        end_us = None if end_time is None else to_epoch_us(end_time)
+        if start_us is not None or end_us is not None:
+            offset, end = self.get_index().get_byte_range(
+                None if start_us is None else start_us * 1000,
+                None if end_us is None else end_us * 1000 + 999,
+            )
+        return self.iter_records(offset, end, start_us, end_us)
+
+    def get_packet(self, offset: int) -> Union[PcapPacket, None]:
+        """
+        Returns:
+            The packet of the record at offset, or None if it is not a TCP packet.
+        """
+        _, _, captured_length, _ = self.record_header.unpack_from(self.buffer, offset)
+        return next(self.iter_records(offset, offset + PCAP_RECORD_HEADER_LEN + captured_length), None)
+
+    def iter_records(self, offset: int, end: int, start_us: int = None, end_us: int = None) -> Iterator[PcapPacket]:
+        """
+        Iterate over the TCP packets of the records from offset, which must be the offset of a record, to end,
+        skipping those outside of [start_us, end_us].
+        """
+        buffer = self.buffer
+        view = self.view
+        link_type = self.link_type
+        unpack_record_header = self.record_header.unpack_from
+        fraction_divisor = self.fraction_divisor
+        while offset + PCAP_RECORD_HEADER_LEN <= end:
+            ts_sec, ts_fraction, captured_length, length = unpack_record_header(buffer, offset)
+            record_offset = offset
+            frame_start = offset + PCAP_RECORD_HEADER_LEN
+            offset = frame_start + captured_length
+            if offset > self.end_offset:
+                break
+            if start_us is not None or end_us is not None:
+                ts_us = ts_sec * 1000000 + ts_fraction // fraction_divisor
+                if (start_us is not None and ts_us < start_us) or (end_us is not None and ts_us > end_us):
+                    continue
+            frame = view[frame_start:offset]
+
+            ethertype, ip_offset = get_link_payload(link_type, frame)
+            if ethertype == ETHERTYPE_IPV4:
+                if captured_length < ip_offset + 20:
+                    continue
+                # Skip non-first fragments
+                if (frame[ip_offset + 6] & 0x1f) or frame[ip_offset + 7] or frame[ip_offset + 9] != IP_PROTO_TCP:
+                    continue
+                ip_version = 4
+                tcp_offset = ip_offset + (frame[ip_offset] & 0x0f) * 4
+            elif ethertype == ETHERTYPE_IPV6:
+                if captured_length < ip_offset + 40:
+                    continue
+                ip_version = 6
+                next_header = frame[ip_offset + 6]
+                tcp_offset = ip_offset + 40
+                while next_header in IPV6_EXTENSION_HEADERS and captured_length >= tcp_offset + 8:
+                    next_header = frame[tcp_offset]
+                    tcp_offset += (frame[tcp_offset + 1] + 1) * 8
+                if next_header != IP_PROTO_TCP:
+                    continue
+            else:
+                continue
+
+            if captured_length < tcp_offset + 20:
+                continue
+            yield PcapPacket(self, record_offset, frame, length, ip_version, ip_offset, tcp_offset)
+
+
+def from_epoch_ns(ts_ns: int) -> datetime:
+    """
+    Naive local datetime of an epoch ns timestamp, truncated to microseconds like PcapPacket.sniff_time.
+    """
+    return datetime.fromtimestamp(ts_ns // 1000000000).replace(microsecond=ts_ns % 1000000000 // 1000)
+
+
+def to_epoch_us(time: datetime) -> int:
+    """
+    Epoch microseconds of a naive local datetime, the inverse of PcapReader.get_sniff_time.
+    """
+    return int(time.replace(microsecond=0).timestamp()) * 1000000 + time.microsecond
+
+
+def read_pcap(pcap_path: str, start_time: datetime = None, end_time: datetime = None) -> Iterator[PcapPacket]:
+    """
+    Decode the TCP packets of a libpcap file without tshark.
+    Args:
+        pcap_path: path of the pcap file.
+        start_time: if given, skip packets captured before it.
+        end_time: if given, skip packets captured after it.
+
+    Returns:
+        An iterator of PcapPacket, in capture order.
+    """
+    with PcapReader(pcap_path) as reader:
+        yield from reader.iter_packets(start_time, end_time)
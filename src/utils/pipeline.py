@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, List, Tuple, Union
+
+# Items a stage may have finished but the next stage not started yet
+QUEUE_SIZE = 2
+
+# Put in a stage's queue once per worker when no item is left
+_DONE = object()
+
+
+class Stage:
+    """
+    A step of a pipeline: function is called on the result of the previous stage, in executor
+    (the event loop's default one if None), by `workers` items at a time.
+    function and its results must be picklable if executor is a process pool.
+    """
+    name: str
+    function: Callable[[Any], Any]
+    executor: Union[Executor, None]
+    workers: int
+
+    def __init__(self, **kwargs):
+        self.name = kwargs.get("name")
+        self.function = kwargs.get("function")
+        self.executor = kwargs.get("executor")
+        self.workers = kwargs.get("workers") or 1
+
+
+async def run_stages(items: List[Any], stages: List[Stage], queue_size: int = QUEUE_SIZE) -> List[Tuple[Any, Any]]:
+    """
+    Pass every item through the stages. Stages are connected by queues of queue_size items, so a stage
+    works on the next items while the following stages work on the previous ones, and a slow stage
+    holds back the ones before it instead of piling up their results.
+
+    Returns:
+        For each item, in the order of items: (result of the last stage, None), or
+        (result of the last stage that succeeded, exception) if a stage raised; the following stages are skipped.
+    """
+    loop = asyncio.get_running_loop()
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+    results = [None] * len(items)
+
+    async def feed():
+        for index, item in enumerate(items):
+            await queues[0].put((index, item, None))
+        for _ in range(stages[0].workers):
+            await queues[0].put(_DONE)
+
+    async def work(k: int):
+        stage = stages[k]
+        while True:
+            entry = await queues[k].get()
+            if entry is _DONE:
+                return
+            index, value, error = entry
+            if error is None:
+                try:
+                    value = await loop.run_in_executor(stage.executor, stage.function, value)
+                except Exception as e:
+                    error = e
+            if k + 1 < len(stages):
+                await queues[k + 1].put((index, value, error))
+            else:
+                results[index] = (value, error)
+
+    async def run_stage(k: int):
+        await asyncio.gather(*[work(k) for _ in range(stages[k].workers)])
+        if k + 1 < len(stages):
+            for _ in range(stages[k + 1].workers):
+                await queues[k + 1].put(_DONE)
+
+    await asyncio.gather(feed(), *[run_stage(k) for k in range(len(stages))])
+    return results
+
+
+def run_pipeline(items: List[Any], stages: List[Stage], queue_size: int = QUEUE_SIZE) -> List[Tuple[Any, Any]]:
+    """
+    run_stages in a new event loop.
+    """
+    return asyncio.run(run_stages(items, stages, queue_size))
+
+
+class PipelineUnitTest(unittest.TestCase):
+    def test_run_pipeline(self):
+        def parse(item):
+            if item == 3:
+                raise ValueError('no valid 1a start')
+            return item * 10
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            results = run_pipeline(list(range(6)), [
+                Stage(name='parse', function=parse, executor=executor, workers=2),
+                Stage(name='output', function=lambda value: value + 1, executor=executor),
+            ])
+        self.assertEqual([1, 11, 21, 3, 41, 51], [value for value, _ in results])
+        self.assertEqual([None] * 3 + ['no valid 1a start'] + [None] * 2,
+                         [error if error is None else str(error) for _, error in results])
+
+    def test_overlap(self):
+        # The second stage of item k runs while the first stage of item k + 1 does
+        active = []
+        overlapped = []
+        lock = threading.Lock()
+
+        def step(item):
+            with lock:
+                active.append(item)
+                if len(active) > 1:
+                    overlapped.append(item)
+            time.sleep(0.02)
+            with lock:
+                active.remove(item)
+            return item
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = run_pipeline(list(range(4)), [
+                Stage(name='parse', function=step, executor=executor),
+                Stage(name='output', function=step, executor=executor),
+            ], queue_size=1)
+        self.assertEqual([(item, None) for item in range(4)], results)
+        self.assertTrue(overlapped)
@@ -0,0 +1,89 @@
+import os
+import sys
+import tempfile
+import unittest
+
+from src.utils.pcap_reader import PCAP_RECORD_HEADER_LEN, PcapPacket, PcapReader
+
+
+class RawDataRef:
+    """
+    Where the raw data of a Moment is: `length` bytes at `offset` of the file at `path`.
+    Moments keep this instead of the log line or the packet, which are read again by load only when needed.
+    Paths are interned so that the references into a file share one string.
+    """
+    __slots__ = ('path', 'offset', 'length')
+
+    def __init__(self, path: str, offset: int, length: int):
+        self.path = sys.intern(path)
+        self.offset = offset
+        self.length = length
+
+    def __getstate__(self):
+        return self.path, self.offset, self.length
+
+    def __setstate__(self, state):
+        path, self.offset, self.length = state
+        self.path = sys.intern(path)
+
+    def __eq__(self, other):
+        return (type(self) is type(other)
+                and (self.path, self.offset, self.length) == (other.path, other.offset, other.length))
+
+    def __repr__(self):
+        return '{}({!r}, {}, {})'.format(type(self).__name__, self.path, self.offset, self.length)
+
+    def read(self) -> bytes:
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            return f.read(self.length)
+
+    def load(self):
+        return self.read()
+
+
+class LogLineRef(RawDataRef):
+    """
+    A line of a logcat file.
+    """
+    __slots__ = ()
+
+    def load(self) -> str:
+        return self.read().decode()
+
+
+class PacketRef(RawDataRef):
+    """
+    A record of a libpcap file, offset is the one of its record header (PACKET_DTYPE's offset column).
+    """
+    __slots__ = ()
+
+    def load(self) -> PcapPacket:
+        with PcapReader(self.path) as reader:
+            return reader.get_packet(self.offset)
+
+
+class RawDataRefUnitTest(unittest.TestCase):
+    def test_log_line(self):
+        with tempfile.TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, 'static_log.logcat')
+            lines = [b'10-11 13:43:49.025  1 2 D ar_activity: SET ANCHOR\n',
+                     b'10-11 13:43:52.110  1 2 D ar_activity: SYNCED\n']
+            with open(path, 'wb') as f:
+                f.write(b''.join(lines))
+            ref = LogLineRef(path, len(lines[0]), len(lines[1]))
+            self.assertEqual(lines[1].decode(), ref.load())
+            self.assertEqual(ref, LogLineRef(path, len(lines[0]), len(lines[1])))
+            self.assertNotEqual(ref, RawDataRef(path, len(lines[0]), len(lines[1])))
+
+    def test_packet(self):
+        path = os.path.join(os.path.dirname(__file__), '..', '..', 'datasets', '5g-static-line', 'host', 'run1',
+                            'capture.pcap')
+        if not os.path.isfile(path):
+            self.skipTest('no dataset')
+        with PcapReader(path) as reader:
+            packet = next(iter(reader))
+        ref = PacketRef(path, packet.offset, PCAP_RECORD_HEADER_LEN + len(packet.frame))
+        loaded = ref.load()
+        self.assertEqual(packet.offset, loaded.offset)
+        self.assertEqual((packet.src_ip, packet.dst_ip, packet.seq), (loaded.src_ip, loaded.dst_ip, loaded.seq))
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import unittest
+from typing import Any, Iterable
+
+from src.utils.packet_table import hash_file
+
+ROOT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+CACHE_DIR = os.path.join(ROOT_PATH, '.cache')
+# Least recently used results are evicted beyond this size
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+CACHE_SUFFIX = '.pickle'
+
+
+class ResultCache:
+    """
+    Results of expensive functions pickled on disk, addressed by the content of their input files.
+    An entry is keyed by a namespace (usually the function), a version to bump whenever the function's output
+    changes, and the sha256 of every input file, so editing or replacing an input never returns a stale result.
+    Hits refresh the mtime of the entry, which is what the LRU eviction goes by.
+    """
+    cache_dir: str
+    max_bytes: int
+
+    def __init__(self, **kwargs):
+        self.cache_dir = kwargs.get("cache_dir") or CACHE_DIR
+        self.max_bytes = kwargs.get("max_bytes") or CACHE_MAX_BYTES
+
+    def get_key(self, namespace: str, version: int, paths: Iterable[str], *args) -> str:
+        """
+        Args:
+            namespace: what is cached, e.g. the function name.
+            version: version of the function's output.
+            paths: input files.
+            args: other inputs that change the output, converted with repr.
+        """
+        sha256 = hashlib.sha256('{}\0{}'.format(namespace, version).encode())
+        for path in paths:
+            sha256.update(hash_file(path).encode())
+        for arg in args:
+            sha256.update(repr(arg).encode())
+        return '{}-{}'.format(namespace, sha256.hexdigest())
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+
+    def get(self, key: str) -> Any:
+        """
+        Returns:
+            The cached result, or None on a miss. An entry that cannot be unpickled, e.g. a truncated one or one
+            whose classes were moved or changed since (ModuleNotFoundError, AttributeError...), is a miss.
+        """
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+            os.utime(path)
+        except Exception:
+            return None
+        return result
+
+    def put(self, key: str, result: Any):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.get_path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in max_bytes.
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(CACHE_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_bytes -= size
+
+
+class ResultCacheUnitTest(unittest.TestCase):
+    def test_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            input_path = os.path.join(cache_dir, 'input.txt')
+            with open(input_path, 'w') as f:
+                f.write('run1')
+            cache = ResultCache(cache_dir=cache_dir, max_bytes=500)
+            key = cache.get_key('test', 1, [input_path])
+            self.assertIsNone(cache.get(key))
+            cache.put(key, {'moments': [1, 2, 3]})
+            self.assertEqual({'moments': [1, 2, 3]}, cache.get(key))
+            self.assertNotEqual(key, cache.get_key('test', 2, [input_path]))
+
+            with open(input_path, 'w') as f:
+                f.write('run2')
+            other_key = cache.get_key('test', 1, [input_path])
+            self.assertNotEqual(key, other_key)
+            os.utime(cache.get_path(key), ns=(0, 0))
+            cache.put(other_key, b'x' * 480)
+            self.assertIsNone(cache.get(key))
+            self.assertEqual(b'x' * 480, cache.get(other_key))
+
+    def test_unreadable_entries(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ResultCache(cache_dir=cache_dir)
+            for key, data in (('truncated', pickle.dumps({'moments': [1, 2, 3]})[:-3]),
+                              ('moved_module', b'cno_such_module\nRuntimeInfo\n.'),
+                              ('moved_class', b'cos\nNoSuchRuntimeInfo\n.')):
+                with open(cache.get_path(key), 'wb') as f:
+                    f.write(data)
+                self.assertIsNone(cache.get(key), key)
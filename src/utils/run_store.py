@@ -0,0 +1,69 @@
+import os
+from typing import Any, Dict, Tuple
+
+import pandas as pd
+
+from src.timeline import moment
+
+
+class RunStore:
+    """
+    In-memory memo of what the figure scripts load for each run, so that scripts run in the same
+    process (see scripts/make_figures.py) parse a run and read an output csv only once.
+    The returned info maps and moments are shared between scripts and must be treated as read-only;
+    DataFrames are copied since scripts modify them.
+    """
+    info_maps: Dict[Tuple, Dict[str, Any]]
+    other_ip_results: Dict[Tuple, Dict[str, Any]]
+    frames: Dict[str, pd.DataFrame]
+
+    def __init__(self, **kwargs):
+        self.info_maps = kwargs.get("info_maps") or {}
+        self.other_ip_results = kwargs.get("other_ip_results") or {}
+        self.frames = kwargs.get("frames") or {}
+
+    def parse_log_and_pcap(self, host_app_log, resolver_app_log, host_pcap, resolver_pcap,
+                           pcap_backend: str = 'native') -> Dict[str, Any]:
+        key = tuple(os.path.abspath(path) for path in (host_app_log, resolver_app_log, host_pcap, resolver_pcap)) \
+            + (pcap_backend,)
+        if key not in self.info_maps:
+            self.info_maps[key] = moment.parse_log_and_pcap(host_app_log, resolver_app_log, host_pcap, resolver_pcap,
+                                                            pcap_backend=pcap_backend)
+        return self.info_maps[key]
+
+    def prepare_other_ip_summary_and_moments(self, host_pcap, resolver_pcap, e2e_start_time, e2e_end_time, database_ip,
+                                             **kwargs) -> Dict[str, Any]:
+        """
+        See src.timeline.moment.prepare_other_ip_summary_and_moments. host_arcore_ip_set and
+        resolver_arcore_ip_set, which some scripts pass, are ignored: the selected packets only depend
+        on the database IP.
+        """
+        kwargs.pop('host_arcore_ip_set', None)
+        kwargs.pop('resolver_arcore_ip_set', None)
+        key = (os.path.abspath(host_pcap), os.path.abspath(resolver_pcap), e2e_start_time, e2e_end_time,
+               database_ip) + tuple(sorted(kwargs.items()))
+        if key not in self.other_ip_results:
+            self.other_ip_results[key] = moment.prepare_other_ip_summary_and_moments(
+                host_pcap, resolver_pcap, e2e_start_time, e2e_end_time, database_ip, **kwargs)
+        return self.other_ip_results[key]
+
+    def read_csv(self, path: str) -> pd.DataFrame:
+        path = os.path.abspath(path)
+        if path not in self.frames:
+            self.frames[path] = pd.read_csv(path)
+        return self.frames[path].copy()
+
+
+RUN_STORE = RunStore()
+
+
+def parse_log_and_pcap(*args, **kwargs) -> Dict[str, Any]:
+    return RUN_STORE.parse_log_and_pcap(*args, **kwargs)
+
+
+def prepare_other_ip_summary_and_moments(*args, **kwargs) -> Dict[str, Any]:
+    return RUN_STORE.prepare_other_ip_summary_and_moments(*args, **kwargs)
+
+
+def read_csv(path: str) -> pd.DataFrame:
+    return RUN_STORE.read_csv(path)
@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+from typing import Any, Dict, List, Tuple
+
+# Stages of a run journaled by process_run (see src.utils.journal), and the input files their cost grows with:
+# a kind of input ('app_log' or 'pcap') of the stage's side, or all the inputs for stages without a side.
+STAGE_INPUTS = {
+    'log parse': 'app_log',
+    'pcap probe': 'pcap',
+    'pcap parse': 'pcap',
+    'phases': None,
+    'outputs': None,
+}
+
+# Cost of a stage never timed before, when no run was timed either
+DEFAULT_SECONDS_PER_BYTE = 1e-7
+
+
+def get_stage_timings(events: List[Dict[str, Any]]) -> Dict[str, Dict[Tuple[str, str], float]]:
+    """
+    Args:
+        events: events of the journal, see src.utils.journal.read_journal.
+
+    Returns:
+        For each run, the duration of the last successful end of each (stage, side) of STAGE_INPUTS.
+        Stages whose result came from a cache say nothing about their cost and are ignored.
+    """
+    timings = {}
+    for event in events:
+        if event.get('event') != 'end' or event.get('status') != 'ok' or event.get('stage') not in STAGE_INPUTS:
+            continue
+        timings.setdefault(event['run'], {})[(event['stage'], event.get('side'))] = event['duration']
+    return timings
+
+
+def get_stage_bytes(stage: str, side: str, input_sizes: Dict[str, int]) -> int:
+    """
+    Args:
+        input_sizes: input name (e.g. 'host_pcap') -> size of the file.
+    """
+    kind = STAGE_INPUTS[stage]
+    if kind is None or side is None:
+        return sum(input_sizes.values())
+    return input_sizes.get('{}_{}'.format(side, kind), 0)
+
+
+def estimate_run_costs(run_inputs: Dict[str, Dict[str, str]],
+                       timings: Dict[str, Dict[Tuple[str, str], float]]) -> Dict[str, float]:
+    """
+    Estimate how long processing each run takes: the sum of its stages, each one timed by a previous batch
+    or, if it was never timed, its input bytes times the seconds per byte of that stage over the timed runs.
+    Args:
+        run_inputs: run name -> input name -> path, see main.get_run_paths.
+        timings: see get_stage_timings.
+
+    Returns:
+        run name -> estimated seconds.
+    """
+    sizes = {run: {name: os.path.getsize(path) if os.path.isfile(path) else 0 for name, path in inputs.items()}
+             for run, inputs in run_inputs.items()}
+    stages = {key for run_timings in timings.values() for key in run_timings}
+    stages |= {(stage, side) for stage, kind in STAGE_INPUTS.items()
+               for side in (('host', 'resolver') if kind else (None,))}
+
+    # seconds per byte of each stage, over the runs that were timed
+    rates = {}
+    for key in stages:
+        seconds = total_bytes = 0
+        for run, run_timings in timings.items():
+            if key in run_timings and run in sizes:
+                seconds += run_timings[key]
+                total_bytes += get_stage_bytes(*key, sizes[run])
+        rates[key] = seconds / total_bytes if total_bytes else None
+    timed_rates = [rate for rate in rates.values() if rate is not None]
+    default_rate = sum(timed_rates) / len(timed_rates) if timed_rates else DEFAULT_SECONDS_PER_BYTE
+
+    costs = {}
+    for run, run_sizes in sizes.items():
+        run_timings = timings.get(run, {})
+        costs[run] = sum(
+            run_timings[key] if key in run_timings else get_stage_bytes(*key, run_sizes) * (rates[key] or default_rate)
+            for key in stages
+        )
+    return costs
+
+
+def order_longest_first(runs: List[str], costs: Dict[str, float]) -> List[str]:
+    """
+    Longest processing time first: with workers taking the next run whenever they are free, starting with the
+    longest runs leaves the short ones to even out the end of the batch, instead of one worker finishing
+    a long run long after the others went idle. Ties keep the order of runs.
+    """
+    return sorted(runs, key=lambda run: -costs.get(run, 0.0))
+
+
+class SchedulerUnitTest(unittest.TestCase):
+    def test_longest_first(self):
+        with tempfile.TemporaryDirectory() as dir_path:
+            run_inputs = {}
+            for run, pcap_size in (('run1', 100), ('run2', 1000), ('run3', 10)):
+                run_inputs[run] = {}
+                for name, size in (('host_app_log', 10), ('resolver_app_log', 10), ('host_pcap', pcap_size),
+                                   ('resolver_pcap', pcap_size)):
+                    path = os.path.join(dir_path, '{}_{}'.format(run, name))
+                    with open(path, 'wb') as f:
+                        f.write(b'\0' * size)
+                    run_inputs[run][name] = path
+
+            # Without history, costs follow input sizes
+            costs = estimate_run_costs(run_inputs, {})
+            self.assertEqual(['run2', 'run1', 'run3'], order_longest_first(['run1', 'run2', 'run3'], costs))
+
+            # Runs measured in an earlier batch are ordered by their timings whatever their size
+            events = [{'run': 'run1', 'stage': 'parse', 'event': 'end', 'status': 'cached', 'duration': 0.01},
+                      {'run': 'run3', 'stage': 'outputs', 'event': 'end', 'status': 'failed', 'duration': 90}]
+            for run, duration in (('run1', 30), ('run2', 20)):
+                for stage, kind in STAGE_INPUTS.items():
+                    for side in (('host', 'resolver') if kind else (None,)):
+                        events.append({'run': run, 'stage': stage, 'side': side, 'event': 'end', 'status': 'ok',
+                                       'duration': duration})
+            timings = get_stage_timings(events)
+            self.assertEqual(['run1', 'run2'], sorted(timings))
+            costs = estimate_run_costs(run_inputs, timings)
+            self.assertEqual(240, costs['run1'])
+            self.assertEqual(['run1', 'run2', 'run3'], order_longest_first(['run3', 'run2', 'run1'], costs))
+            # Untimed runs are estimated with the seconds per byte of the timed ones
+            self.assertGreater(costs['run3'], 0)
@@ -1,8 +1,9 @@
+import functools
 import re
 from datetime import datetime
-from typing import Union
+from typing import Tuple, Union
 
-from src.constants import DATETIME_FORMAT
+from src.constants import SECOND_FORMAT
 
 
 def has_prefix(line: str, prefix: str) -> bool:
@@ -15,13 +16,39 @@ def has_prefix(line: str, prefix: str) -> bool:
     return match is not None
 
 
-def extract_timestamp(line: str, year: str) -> Union[datetime, None]:
-    pattern = r".*?(\d{2}-\d{2}\s\d{2}:\d{2}:\d{2}\.\d{3})"
-    match = re.match(pattern, line)
+LOG_TIMESTAMP_REGEXP = re.compile(r"(\d{2}-\d{2}\s\d{2}:\d{2}:\d{2})\.(\d{3})")
+
+
+def split_log_timestamp(line: str) -> Union[Tuple[str, str], None]:
+    """
+    Returns:
+        ('MM-DD HH:MM:SS', 'mmm') of the first timestamp in the line, or None.
+        Logcat lines start with it, so the fields are sliced without a regex when they are at column 0.
+    """
+    if (len(line) >= 18 and line[2] == '-' and line[8] == ':' and line[11] == ':' and line[14] == '.'
+            and line[5].isspace() and line[0:2].isdecimal() and line[3:5].isdecimal() and line[6:8].isdecimal()
+            and line[9:11].isdecimal() and line[12:14].isdecimal() and line[15:18].isdecimal()):
+        return line[:14], line[15:18]
+    match = LOG_TIMESTAMP_REGEXP.search(line)
     if not match:
         return None
-    app_log_time = match.group(1)
-    return datetime.strptime(year + '-' + app_log_time, DATETIME_FORMAT)
+    return match.group(1), match.group(2)
+
+
+@functools.lru_cache(maxsize=1 << 12)
+def get_log_second(year: str, second: str) -> datetime:
+    """
+    Consecutive lines mostly share their second, so the slow strptime runs about once per second of log.
+    """
+    return datetime.strptime(year + '-' + second, SECOND_FORMAT)
+
+
+def extract_timestamp(line: str, year: str) -> Union[datetime, None]:
+    timestamp = split_log_timestamp(line)
+    if timestamp is None:
+        return None
+    second, millisecond = timestamp
+    return get_log_second(year, second).replace(microsecond=int(millisecond) * 1000)
 
 
 def extract_stroke_id(line: str) -> Union[str, None]:
@@ -0,0 +1,132 @@
+import unittest
+from typing import Dict, Hashable, Tuple, Union
+
+TLS_CHANGE_CIPHER_SPEC = 20
+TLS_ALERT = 21
+TLS_HANDSHAKE = 22
+TLS_APPLICATION_DATA = 23
+TLS_HEARTBEAT = 24
+TLS_RECORD_HEADER_LEN = 5
+# Legacy record versions: SSL 3.0 (0x0300) to TLS 1.3 (0x0304, never sent on the wire but tolerated).
+TLS_MAJOR_VERSION = 3
+TLS_MAX_MINOR_VERSION = 4
+
+# Content types present in a packet are kept as a bitmask, bit (content type - 20)
+TLS_APPLICATION_DATA_BIT = 1 << (TLS_APPLICATION_DATA - TLS_CHANGE_CIPHER_SPEC)
+TLS_HANDSHAKE_BIT = 1 << (TLS_HANDSHAKE - TLS_CHANGE_CIPHER_SPEC)
+# Content types that fit in the 8 bits of the mask
+TLS_MASK_CONTENT_TYPES = range(TLS_CHANGE_CIPHER_SPEC, TLS_CHANGE_CIPHER_SPEC + 8)
+
+SEQ_MODULO = 1 << 32
+
+
+def get_content_type_bit(content_type: int) -> int:
+    """
+    Returns:
+        The bit of content_type in a content type mask, or 0 if it has none (not a TLS content type we know).
+    """
+    if content_type not in TLS_MASK_CONTENT_TYPES:
+        return 0
+    return 1 << (content_type - TLS_CHANGE_CIPHER_SPEC)
+
+
+def is_tls_record_header(payload: Union[bytes, memoryview], offset: int) -> bool:
+    content_type = payload[offset]
+    return (TLS_CHANGE_CIPHER_SPEC <= content_type <= TLS_HEARTBEAT
+            and payload[offset + 1] == TLS_MAJOR_VERSION
+            and payload[offset + 2] <= TLS_MAX_MINOR_VERSION)
+
+
+def scan_tls_records(payload: Union[bytes, memoryview], offset: int = 0) -> Tuple[int, int]:
+    """
+    Walk the TLS record headers found in the captured part of a TCP payload, starting at offset.
+    Returns:
+        (bitmask of the record content types, offset where the walk stopped)
+        The walk stops at the first invalid header (the returned offset then points at it), or at the first
+        header that is not captured (the offset may then be past the captured bytes).
+    """
+    content_types = 0
+    while offset + TLS_RECORD_HEADER_LEN <= len(payload):
+        if not is_tls_record_header(payload, offset):
+            break
+        content_types |= 1 << (payload[offset] - TLS_CHANGE_CIPHER_SPEC)
+        offset += TLS_RECORD_HEADER_LEN + ((payload[offset + 3] << 8) | payload[offset + 4])
+    return content_types, offset
+
+
+class TlsRecordTracker:
+    """
+    Follow TLS record boundaries of each TCP direction in sequence number space.
+    Our captures are truncated (164-byte snaplen) and records span many segments, so a segment
+    often starts in the middle of a record: its first bytes are ciphertext, not a record header.
+    Knowing where the current record ends lets us skip those bytes, and read the next header
+    if it falls in the captured part of the segment.
+    Segments must be given in capture order.
+    """
+
+    def __init__(self):
+        # flow -> sequence number of the next record header, None if unknown
+        self.next_record_seq: Dict[Hashable, Union[int, None]] = {}
+        # flow -> sequence number following the newest segment
+        self.next_seq: Dict[Hashable, int] = {}
+
+    def classify(self, flow: Hashable, seq: int, payload_length: int, payload: Union[bytes, memoryview]) -> int:
+        """
+        Args:
+            flow: key of the TCP direction, e.g. (src ip, src port, dst ip, dst port).
+            seq: sequence number of the segment.
+            payload_length: TCP payload length on the wire.
+            payload: captured part of the TCP payload.
+        Returns:
+            Bitmask of the content types of the records whose header is in the segment.
+        """
+        if payload_length <= 0:
+            return 0
+        next_seq = self.next_seq.get(flow)
+        if next_seq is not None and 0 < (next_seq - seq) % SEQ_MODULO < SEQ_MODULO // 2:
+            # Retransmission: classify it like the original segment, from its first byte, and keep the state
+            return scan_tls_records(payload)[0]
+        self.next_seq[flow] = (seq + payload_length) % SEQ_MODULO
+
+        offset = 0
+        next_record_seq = self.next_record_seq.get(flow)
+        if next_record_seq is not None:
+            delta = (next_record_seq - seq) % SEQ_MODULO
+            if delta >= SEQ_MODULO // 2:
+                # Segments were missed, assume the segment starts with a record
+                pass
+            elif delta >= payload_length:
+                # The whole segment is inside the current record
+                return 0
+            else:
+                offset = delta
+
+        content_types, offset = scan_tls_records(payload, offset)
+        if offset < payload_length:
+            # Not TLS, or the next header is in the part of the segment that was not captured:
+            # we lost track of the record boundaries
+            self.next_record_seq[flow] = None
+        else:
+            self.next_record_seq[flow] = (seq + offset) % SEQ_MODULO
+        return content_types
+
+
+class TlsUnitTest(unittest.TestCase):
+    def test_scan_tls_records(self):
+        payload = bytes([23, 3, 3, 0, 2, 0xaa, 0xbb, 22, 3, 3, 0, 40]) + bytes(10)
+        self.assertEqual((TLS_APPLICATION_DATA_BIT | TLS_HANDSHAKE_BIT, 52), scan_tls_records(payload))
+        self.assertEqual(0, scan_tls_records(bytes([23, 3, 9, 0, 2]))[0])
+
+    def test_tracker_skips_continuation(self):
+        tracker = TlsRecordTracker()
+        flow = ('a', 443, 'b', 5000)
+        # A 3000-byte Application Data record starting at seq 1000, split in 1400-byte segments
+        first = bytes([23, 3, 3, 0x0b, 0xb8]) + bytes(100)
+        self.assertEqual(TLS_APPLICATION_DATA_BIT, tracker.classify(flow, 1000, 1400, first))
+        # Ciphertext that looks like a record header is not one
+        self.assertEqual(0, tracker.classify(flow, 2400, 1400, bytes([23, 3, 3, 0, 1]) + bytes(100)))
+        # The last segment ends the record at seq 4005, and carries a new header right after it
+        last = bytes(205) + bytes([21, 3, 3, 0, 2, 1, 0])
+        self.assertEqual(1 << (TLS_ALERT - TLS_CHANGE_CIPHER_SPEC), tracker.classify(flow, 3800, 212, last))
+        # A retransmission of the first segment is classified like the original
+        self.assertEqual(TLS_APPLICATION_DATA_BIT, tracker.classify(flow, 1000, 1400, first))
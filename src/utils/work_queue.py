@@ -0,0 +1,219 @@
+import json
+import os
+import socket
+import sqlite3
+import tempfile
+import time
+import unittest
+from typing import Any, Dict, List, Union
+
+# A claim whose worker has not sent a heartbeat for this long is given to another worker
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    priority REAL NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    heartbeat_at REAL,
+    result TEXT,
+    updated_at REAL NOT NULL
+)
+'''
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def get_worker_id() -> str:
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+class WorkQueue:
+    """
+    A queue of runs to process, kept in a SQLite file that the coordinator and the workers share
+    (e.g. on shared storage). A job goes pending -> claimed -> done, or back to pending when its worker
+    stops sending heartbeats or raises, until it has been attempted max_attempts times (then failed).
+    """
+    path: str
+    lease_seconds: float
+    max_attempts: int
+
+    def __init__(self, **kwargs):
+        self.path = kwargs.get("path")
+        self.lease_seconds = kwargs.get("lease_seconds") or LEASE_SECONDS
+        self.max_attempts = kwargs.get("max_attempts") or MAX_ATTEMPTS
+        self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute(SCHEMA)
+        columns = [row['name'] for row in self.connection.execute('PRAGMA table_info(jobs)')]
+        if 'priority' not in columns:
+            # queue created before jobs had priorities
+            self.connection.execute('ALTER TABLE jobs ADD COLUMN priority REAL NOT NULL DEFAULT 0')
+
+    def close(self):
+        self.connection.close()
+
+    def transaction(self):
+        """
+        BEGIN IMMEDIATE takes the write lock up front, so that two workers never claim the same job.
+        """
+        return Transaction(self.connection)
+
+    def enqueue(self, run: str, payload: Dict[str, Any], priority: float = 0.0):
+        """
+        Add a run, or reset it to pending with a new payload if it was already queued.
+        Jobs of higher priority are claimed first.
+        """
+        with self.transaction():
+            self.connection.execute(
+                'INSERT INTO jobs (run, payload, priority, state, attempts, updated_at) VALUES (?, ?, ?, ?, 0, ?) '
+                'ON CONFLICT (run) DO UPDATE SET payload = excluded.payload, priority = excluded.priority, '
+                'state = excluded.state, attempts = 0, worker = NULL, heartbeat_at = NULL, result = NULL, '
+                'updated_at = excluded.updated_at',
+                (run, json.dumps(payload), priority, PENDING, time.time()))
+
+    def requeue_expired(self):
+        now = time.time()
+        self.connection.execute(
+            'UPDATE jobs SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, worker = NULL, updated_at = ?, '
+            "result = CASE WHEN attempts >= ? THEN '{\"status\": \"failed\", \"error\": \"lease expired\"}' "
+            'ELSE result END '
+            'WHERE state = ? AND heartbeat_at < ?',
+            (self.max_attempts, FAILED, PENDING, now, self.max_attempts, CLAIMED, now - self.lease_seconds))
+
+    def claim(self, worker: str) -> Union[Dict[str, Any], None]:
+        """
+        Returns:
+            The pending job ('id', 'run', 'payload', 'attempts') of highest priority, the oldest among equals,
+            now claimed by worker, or None.
+        """
+        with self.transaction():
+            self.requeue_expired()
+            row = self.connection.execute(
+                'SELECT id, run, payload, attempts FROM jobs WHERE state = ? ORDER BY priority DESC, id LIMIT 1',
+                (PENDING,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self.connection.execute(
+                'UPDATE jobs SET state = ?, worker = ?, attempts = attempts + 1, heartbeat_at = ?, updated_at = ? '
+                'WHERE id = ?', (CLAIMED, worker, now, now, row['id']))
+        return {'id': row['id'], 'run': row['run'], 'payload': json.loads(row['payload']),
+                'attempts': row['attempts'] + 1}
+
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        """
+        Returns:
+            False if the job is no longer claimed by worker, e.g. its lease expired and it was given to another one.
+        """
+        now = time.time()
+        with self.transaction():
+            cursor = self.connection.execute(
+                'UPDATE jobs SET heartbeat_at = ?, updated_at = ? WHERE id = ? AND worker = ? AND state = ?',
+                (now, now, job_id, worker, CLAIMED))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker: str, result: Dict[str, Any]):
+        """
+        Commit the result of a claimed job. The result of a worker that lost its claim is dropped.
+        """
+        with self.transaction():
+            self.connection.execute(
+                'UPDATE jobs SET state = ?, result = ?, heartbeat_at = NULL, updated_at = ? '
+                'WHERE id = ? AND worker = ? AND state = ?',
+                (DONE, json.dumps(result), time.time(), job_id, worker, CLAIMED))
+
+    def release(self, job_id: int, worker: str, error: str):
+        """
+        Give a job back after an unexpected error, to be retried unless it ran out of attempts.
+        """
+        with self.transaction():
+            self.connection.execute(
+                'UPDATE jobs SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, worker = NULL, '
+                'heartbeat_at = NULL, result = ?, updated_at = ? WHERE id = ? AND worker = ? AND state = ?',
+                (self.max_attempts, FAILED, PENDING, json.dumps({'status': 'failed', 'error': error}), time.time(),
+                 job_id, worker, CLAIMED))
+
+    def get_counts(self) -> Dict[str, int]:
+        with self.transaction():
+            self.requeue_expired()
+        counts = {PENDING: 0, CLAIMED: 0, DONE: 0, FAILED: 0}
+        for row in self.connection.execute('SELECT state, COUNT(*) AS count FROM jobs GROUP BY state'):
+            counts[row['state']] = row['count']
+        return counts
+
+    def get_jobs(self, runs: List[str] = None) -> List[Dict[str, Any]]:
+        rows = self.connection.execute('SELECT run, payload, state, attempts, worker, result FROM jobs ORDER BY id')
+        jobs = []
+        for row in rows:
+            if runs is not None and row['run'] not in runs:
+                continue
+            jobs.append({
+                'run': row['run'],
+                'payload': json.loads(row['payload']),
+                'state': row['state'],
+                'attempts': row['attempts'],
+                'worker': row['worker'],
+                'result': json.loads(row['result']) if row['result'] else None,
+            })
+        return jobs
+
+
+class Transaction:
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+class WorkQueueUnitTest(unittest.TestCase):
+    def test_claim_heartbeat_and_retry(self):
+        with tempfile.TemporaryDirectory() as dir_path:
+            queue = WorkQueue(path=os.path.join(dir_path, 'queue.sqlite'), lease_seconds=60, max_attempts=2)
+            queue.enqueue('5g-static-line/run1', {'host_path': 'datasets/5g-static-line/host/run1'})
+            queue.enqueue('5g-static-line/run2', {'host_path': 'datasets/5g-static-line/host/run2'})
+
+            job = queue.claim('worker-a')
+            self.assertEqual('5g-static-line/run1', job['run'])
+            self.assertEqual('datasets/5g-static-line/host/run1', job['payload']['host_path'])
+            self.assertTrue(queue.heartbeat(job['id'], 'worker-a'))
+            queue.complete(job['id'], 'worker-a', {'status': 'ok'})
+
+            # worker-b dies: its lease expires and worker-c gets the job again
+            job = queue.claim('worker-b')
+            queue.connection.execute('UPDATE jobs SET heartbeat_at = 0 WHERE id = ?', (job['id'],))
+            retried = queue.claim('worker-c')
+            self.assertEqual((job['run'], 2), (retried['run'], retried['attempts']))
+            self.assertFalse(queue.heartbeat(job['id'], 'worker-b'))
+            queue.complete(job['id'], 'worker-b', {'status': 'ok'})
+            self.assertEqual({'pending': 0, 'claimed': 1, 'done': 1, 'failed': 0}, queue.get_counts())
+
+            # Out of attempts
+            queue.release(retried['id'], 'worker-c', 'MemoryError')
+            self.assertEqual({'pending': 0, 'claimed': 0, 'done': 1, 'failed': 1}, queue.get_counts())
+            self.assertIsNone(queue.claim('worker-c'))
+            queue.close()
+
+    def test_priority(self):
+        with tempfile.TemporaryDirectory() as dir_path:
+            queue = WorkQueue(path=os.path.join(dir_path, 'queue.sqlite'))
+            queue.enqueue('5g-block-point/run1', {}, priority=1)
+            queue.enqueue('5g-static-point/run1', {}, priority=3)
+            queue.enqueue('5g-static-point/run2', {}, priority=3)
+            self.assertEqual(['5g-static-point/run1', '5g-static-point/run2', '5g-block-point/run1'],
+                             [queue.claim('worker-a')['run'] for _ in range(3)])
+            queue.close()